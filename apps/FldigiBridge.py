@@ -25,14 +25,15 @@ import time
 import sys
 import argparse
 import Queue
-import crcmod
 import ConfigParser
 from datetime import datetime
 import traceback
 from threading import Thread
 from horuslib import *
+from horuslib.checksum import SentenceChecker, crc16_ccitt
 from horuslib.oziplotter import *
 from horuslib.habitat import *
+from horuslib.timestamps import parse_short_time
 from PyQt5 import QtGui, QtWidgets, QtCore
 
 FLDIGI_PORT = 7322
@@ -46,10 +47,9 @@ class FldigiBridge(object):
     and forward them on to either OziPlotter, or OziMux.
     """
 
-    # Receive thread variables and buffers.
+    # Receive thread variables.
     rx_thread_running = True
-    MAX_BUFFER_LEN = 256
-    input_buffer = ""
+    RX_CHUNK_LEN = 1024
 
 
     def __init__(self,
@@ -109,9 +109,12 @@ class FldigiBridge(object):
             if self.callback != None:
                     self.callback("CONNECTED - WAITING FOR DATA.")
 
+            # Sentences are checked as the characters arrive, so start afresh on each connection.
+            _checker = SentenceChecker()
+
             while self.rx_thread_running:
                 try:
-                    _char = _s.recv(1)
+                    _data = _s.recv(self.RX_CHUNK_LEN)
                 except socket.timeout:
                     # No data received? Keep trying...
                     continue
@@ -126,31 +129,23 @@ class FldigiBridge(object):
                         pass
                     break
 
-                # Append to input buffer.
-                self.input_buffer += _char
-                # Roll buffer if we've exceeded the max length.
-                if len(self.input_buffer) > self.MAX_BUFFER_LEN:
-                    self.input_buffer = self.input_buffer[1:]
-
-                # If we have received a newline, attempt to process the current buffer of data.
-                if _char == '\n':
-                    self.process_data(self.input_buffer)
-                    # Clear the buffer and continue.
-                    self.input_buffer = ""
-                else:
-                    continue
+                if _data == "":
+                    # fldigi has closed the connection. Re-connect.
+                    if self.callback != None:
+                        self.callback("CONNECTION CLOSED!")
+                    _s.close()
+                    break
 
-        _s.close()
+                # If we have a log file open, write the data out to disk.
+                if self.log_file is not None:
+                    self.log_file.write(_data)
+                    # Immediately flush the file to disk.
+                    self.log_file.flush()
 
+                for (_sentence, _crc_ok) in _checker.update(_data):
+                    self.process_sentence(_sentence, _crc_ok)
 
-    def crc16_ccitt(self,data):
-        """
-        Calculate the CRC16 CCITT checksum of *data*.
-        
-        (CRC16 CCITT: start 0xFFFF, poly 0x1021)
-        """
-        crc16 = crcmod.predefined.mkCrcFun('crc-ccitt-false')
-        return hex(crc16(data))[2:].upper().zfill(4)
+        _s.close()
 
 
     def send_to_callback(self, data):
@@ -162,40 +157,25 @@ class FldigiBridge(object):
                     pass
 
 
-    def process_data(self, data):
+    def process_sentence(self, telemetry, crc_ok):
         """
-        Attempt to process a line of data, and extract time, lat, lon and alt
+        Attempt to process a sentence from the SentenceChecker, and extract time, lat, lon and alt
+
+        Keyword Arguments:
+        telemetry: The sentence, between the '$$' and the '*'.
+        crc_ok: True if the sentence's CRC16 matched.
         """
         try:
-            # If we have a log file open, write the data out to disk.
-            if self.log_file is not None:
-                # Append trailing LF, since we don't get passed that.
-                self.log_file.write(data)
-                # Immediately flush the file to disk.
-                self.log_file.flush()
-
             # Try and proceed through the following. If anything fails, we have a corrupt sentence.
-            # Strip out any leading/trailing whitespace.
-            data = data.strip()
-
-            # First, try and find the start of the sentence, which always starts with '$$''
-            _sentence = data.split('$$')[-1]
-            # Hack to handle odd numbers of $$'s at the start of a sentence
-            if _sentence[0] == '$':
-                _sentence = _sentence[1:]
-            # Now try and split out the telemetry from the CRC16.
-            _telem = _sentence.split('*')[0]
-            _crc = _sentence.split('*')[1]
-
-            # Now check if the CRC matches.
-            _calc_crc = self.crc16_ccitt(_telem)
-
-            if _calc_crc != _crc:
+            if not crc_ok:
                 self.send_to_callback("ERROR - CRC Fail.")
                 return
 
+            # Re-attach the checksum, as it is included in the sentence passed to the callback (and uploaded to Habitat).
+            _sentence = "%s*%s" % (telemetry, crc16_ccitt(telemetry))
+
             # We now have a valid sentence! Extract fields..
-            _fields = _telem.split(',')
+            _fields = telemetry.split(',')
 
             _telem_dict = {}
             _telem_dict['time'] = _fields[2]
@@ -208,19 +188,15 @@ class FldigiBridge(object):
             # Perform some sanity checks on the data.
 
             # Attempt to parse the time string. This will throw an error if any values are invalid.
-            if ":" in _telem_dict['time']:
-                try:
-                    _time_dt = datetime.strptime(_telem_dict['time'], "%H:%M:%S")
-                except:
-                    self.send_to_callback("ERROR - Invalid Time.")
-            else:
-                try:
-                    _time_dt = datetime.strptime(_telem_dict['time'], "%H%M%S")
-                except:
-                    self.send_to_callback("ERROR - Invalid Time.")
+            # Accepts either HH:MM:SS or HHMMSS.
+            try:
+                _time = parse_short_time(_telem_dict['time'])
+            except:
+                self.send_to_callback("ERROR - Invalid Time.")
+                return
             
             # Convert the extracted time back to HH:MM:SS Format
-            _telem_dict['time'] = _time_dt.strftime("%H:%M:%S")
+            _telem_dict['time'] = "%02d:%02d:%02d" % _time
 
             # Check if the lat/long is 0.0,0.0 - no point passing this along.
             if _telem_dict['latitude'] == 0.0 or _telem_dict['longitude'] == 0.0:
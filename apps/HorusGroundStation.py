@@ -8,6 +8,7 @@
 
 from horuslib import *
 from horuslib.packets import *
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 from horuslib.oziplotter import *
 from threading import Thread
 from PyQt5 import QtGui, QtWidgets, QtCore
@@ -17,6 +18,8 @@ import ConfigParser
 
 udp_broadcast_port = HORUS_UDP_PORT
 udp_listener_running = False
+# Receive buffer size (bytes) for the UDP listener socket. None uses the system default.
+rx_socket_buffer = None
 
 
 
@@ -584,6 +587,12 @@ try:
 except:
     print("Problems reading configuration file, skipping...")
 
+try:
+    rx_socket_buffer = config.getint('Interface', 'rx_socket_buffer')
+except:
+    # Optional setting - use the system default.
+    pass
+
 # Delete FoxTrotGPS log file if it exists.
 if os.path.exists(foxtrot_log):
     print("Found Existing GPS Log. Removing.")
@@ -693,13 +702,16 @@ def processPacket(packet):
     # Reset packet timer.
     last_packet_timer = 0.0
 
+    # Normalise the payload once, for use by all of the decoders below.
+    payload = PacketBuffer(packet['payload'])
+
     # Immediately update the last packet data.
     try:
         lastPacketRSSIValue.setText("%d dBm" % packet['rssi'])
         lastPacketSNRValue.setText("%.1f dB" % packet['snr'])
         lastPacketTimeValue.setText(packet['timestamp'])
         lastPacketFreqErrorValue.setText("%.1f Hz" % packet['freq_error'])
-        lastPacketIDValue.setText("%d" % decode_payload_id(packet['payload']))
+        lastPacketIDValue.setText("%d" % decode_payload_id(payload))
     except:
         pass
 
@@ -710,7 +722,6 @@ def processPacket(packet):
         return
     
     # Now delve into the payload.
-    payload = packet['payload']
 
     payload_id = decode_payload_id(payload)
 
@@ -812,7 +823,7 @@ def processPacket(packet):
 def process_udp(udp_packet):
     global mylat, mylon, myspeed, current_payload, console, consoleInhibitStatus, lowpriFrameSlotValue, lowpriGPSValue, lowpriFrameMessage, myCallsignValue, my_slot_id
     try:
-        packet_dict = json.loads(udp_packet)
+        packet_dict = decode_udp_packet(udp_packet)
         
         # Avoid flooding the terminal with: Local GPS data, Control messages, Summary messages.
         if packet_dict['type'] not in ['GPS','LOWPRIORITY','PAYLOAD_SUMMARY', 'WENET', 'OZIMUX']:
@@ -865,26 +876,23 @@ def process_udp(udp_packet):
 def udp_rx_thread():
     global udp_listener_running
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
+    s.setblocking(0)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except:
         pass
+    if rx_socket_buffer is not None:
+        set_receive_buffer(s, rx_socket_buffer)
     s.bind(('',HORUS_UDP_PORT))
     print("Started UDP Listener Thread.")
     udp_listener_running = True
     while udp_listener_running:
-        try:
-            m = s.recvfrom(MAX_JSON_LEN)
-        except socket.timeout:
-            m = None
-        
-        if m != None:
+        for m in receive_datagrams(s, MAX_JSON_LEN):
             # Realistically the only way the rx queue will get full is on OSX,
             # where the app goes into a 'nap' state, and the GUI thread stops.
             if rxqueue.qsize()<(RX_QUEUE_SIZE-1):
-                rxqueue.put_nowait(m[0])
+                rxqueue.put_nowait(m)
             else:
                 # Discard packets at this point.
                 print("UDP Packet discarded.")
@@ -8,6 +8,7 @@
 
 from horuslib import *
 from horuslib.packets import *
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 from threading import Thread
 from PyQt5 import QtGui, QtWidgets, QtCore
 from datetime import datetime
@@ -16,6 +17,8 @@ import ConfigParser
 
 udp_broadcast_port = HORUS_UDP_PORT
 udp_listener_running = False
+# Receive buffer size (bytes) for the UDP listener socket. None uses the system default.
+rx_socket_buffer = None
 
 current_payload = 0
 
@@ -87,6 +90,12 @@ try:
 except:
     print("Problems reading configuration file, skipping...")
 
+try:
+    rx_socket_buffer = config.getint('Interface', 'rx_socket_buffer')
+except:
+    # Optional setting - use the system default.
+    pass
+
 
 # Send a message!
 def send_message():
@@ -116,7 +125,7 @@ def process_rxpkt(packet_dict):
     global current_payload
 
     # Now delve into the payload.
-    payload = packet_dict['payload']
+    payload = PacketBuffer(packet_dict['payload'])
 
     payload_id = decode_payload_id(payload)
 
@@ -130,14 +139,14 @@ def process_rxpkt(packet_dict):
         payloadSelectionList.addItem(str(payload_id))
 
 
-    if(packet_dict['payload'][0] == HORUS_PACKET_TYPES.TEXT_MESSAGE):
+    if(payload.packet_type == HORUS_PACKET_TYPES.TEXT_MESSAGE):
         line = datetime.utcnow().strftime("%H:%M ")
         rssi = float(packet_dict['rssi'])
         snr = float(packet_dict['snr'])
         print(packet_dict['payload'])
-        (source,message) = read_text_message_packet(packet_dict['payload'])
+        (source,message) = read_text_message_packet(payload)
 
-        payload_flags = decode_payload_flags(packet_dict['payload'])
+        payload_flags = decode_payload_flags(payload)
         if payload_flags['is_repeated']:
             line += "<%8s via #%d>" % (source,payload_id)
         else:
@@ -149,7 +158,7 @@ def process_rxpkt(packet_dict):
 # Method to process UDP packets.
 def process_udp(udp_packet):
     try:
-        packet_dict = json.loads(udp_packet)
+        packet_dict = decode_udp_packet(udp_packet)
 
         # Start every line with a timestamp
         line = datetime.utcnow().strftime("%H:%M ")
@@ -179,23 +188,23 @@ def process_udp(udp_packet):
 def udp_rx_thread():
     global udp_listener_running
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
+    s.setblocking(0)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except:
         pass
+    if rx_socket_buffer is not None:
+        set_receive_buffer(s, rx_socket_buffer)
     s.bind(('',HORUS_UDP_PORT))
     print("Started UDP Listener Thread.")
     udp_listener_running = True
     while udp_listener_running:
-        try:
-            m = s.recvfrom(MAX_JSON_LEN)
-        except socket.timeout:
-            m = None
-        
-        if m != None:
-            rxqueue.put_nowait(m[0])
+        for m in receive_datagrams(s, MAX_JSON_LEN):
+            try:
+                rxqueue.put_nowait(m)
+            except Queue.Full:
+                print("UDP Packet discarded.")
     
     print("Closing UDP Listener")
     s.close()
@@ -30,6 +30,13 @@
 #
 #   JSON PACKET FORMATS
 #   ===================
+#   If started with --binary, RXPKT, TXQUEUED and TXDONE messages are sent using the
+#   compact binary envelope described in horuslib/wireformat.py instead of JSON.
+#   Either format is accepted on input.
+#
+#   If started with --multicast (or --loopback), messages are sent to the per-type multicast
+#   groups described in horuslib/topics.py instead of being broadcast. Broadcast messages are still
+#   accepted on input.
 #
 #   TRANSMIT PACKET
 #   Packet to be transmitted by the LoRa server. Is added to a queue and
@@ -40,6 +47,8 @@
 #       'payload' : [<payload as a list of bytes>] # Encode this using list(bytearray('string'))
 #       'destination' : payload_id # Optional field. If given, the UDP server will cache the packet in a separate queue, and 
 #                                    will wait until it observes a packet from the given payload ID before TXing.
+#       'tx_id' : '<transmit ID>' # Optional field. If given, it is copied into the TXQUEUED and TXDONE messages
+#                                   (and any ERROR message) relating to this packet.
 #   }
 #
 #   TRANSMIT QUEUE STATUS
@@ -51,6 +60,7 @@
 #     'timestamp' : '<ISO-8601 formatted timestamp>',
 #     'payload' : [<payload as a list of bytes>]
 #     'txqueuesize' : Number of packets remaining in the transmit queue.
+#     'tx_id' : '<transmit ID>' # Only present if supplied in the TXPKT message.
 #   }
 #
 #   TRANSMIT CONFIRMATION
@@ -61,6 +71,7 @@
 #     'timestamp' : '<ISO-8601 formatted timestamp>',
 #     'payload' : [<payload as a list of bytes>]
 #     'txqueuesize' : Number of packets remaining in the transmit queue.
+#     'tx_id' : '<transmit ID>' # Only present if supplied in the TXPKT message.
 #   }
 #
 #
@@ -132,13 +143,14 @@ import json,socket,Queue,random, argparse, sys, traceback, time, random
 from threading import Thread
 from horuslib import *
 from horuslib.packets import *
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 from datetime import datetime
 
 from SX127x.LoRa import *
 
 
 class LoRaTxRxCont(LoRa):
-    def __init__(self,hw,verbose=False,max_payload=255,mode=0,frequency=431.650, callsign='blank', low_priority_destination=-1):
+    def __init__(self,hw,verbose=False,max_payload=255,mode=0,frequency=431.650, callsign='blank', low_priority_destination=-1, binary_udp=False, topics=None, rcvbuf=None):
         super(LoRaTxRxCont, self).__init__(hw,verbose)
         self.set_mode(MODE.SLEEP)
         self.set_dio_mapping([0] * 6)
@@ -147,16 +159,19 @@ class LoRaTxRxCont(LoRa):
         self.frequency = frequency
         self.max_payload = max_payload
         self.udp_broadcast_port = HORUS_UDP_PORT
+        self.topics = topics
+        self.rcvbuf = rcvbuf # Receive buffer size for the UDP listener socket, or None for the system default.
+        self.broadcaster = HorusBroadcaster(binary=binary_udp, topics=topics)
 
         self.udprxqueue = Queue.Queue(128) # Queue for incoming UDP packets to be processed.
-        self.txqueue = Queue.Queue(TX_QUEUE_SIZE)
+        self.txqueue = Queue.Queue(TX_QUEUE_SIZE) # Data stored into this queue is of the form (payload,tx_id)
         self.udp_listener_running = False
 
         self.status_counter = 0
         self.status_throttle = 20
 
         # TX-after-RX Queue. I with python queues had a peek method... 
-        # Data stored into this queue is of the form (payload,destination_id)
+        # Data stored into this queue is of the form (payload,destination_id,timeout,tx_id)
         self.tx_after_rx = Queue.Queue(1)
         self.default_tx_timeout = 15
 
@@ -222,13 +237,14 @@ class LoRaTxRxCont(LoRa):
         self.set_mode(MODE.TX)
 
     def udp_broadcast(self,data):
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST, 1)
-        try:
-            s.sendto(json.dumps(data), ('<broadcast>', self.udp_broadcast_port))
-        except socket.error:
-            s.sendto(json.dumps(data), ('127.0.0.1', self.udp_broadcast_port))
-        s.close()
+        self.broadcaster.send(data, port=self.udp_broadcast_port)
+
+    def udp_error(self, error_str, tx_id=None):
+        ''' Broadcast an error message, optionally relating to the packet with the supplied transmit ID. '''
+        error = {'type':'ERROR', 'str': error_str}
+        if tx_id != None:
+            error['tx_id'] = tx_id
+        self.udp_broadcast(error)
 
     def udp_send_rx(self,payload,snr,rssi,pkt_flags,freq_error):
         pkt_dict = {
@@ -253,7 +269,9 @@ class LoRaTxRxCont(LoRa):
         fei = self.get_fei()
         freq_error = -1*int(((fei&0x0FFFFF) * 2**24.0 / 32e6)*(125e6/500e6))
 #        print("Packet SNR: %.1f dB, RSSI: %d dB" % (snr, rssi))
-        rxdata = self.read_payload(nocheck=True)
+        rx_payload = self.read_payload(nocheck=True)
+        # Normalise the received packet once, so the decoders below don't need to re-copy it.
+        rxdata = PacketBuffer(rx_payload)
         print("RX Packet!")
 
         self.set_mode(MODE.SLEEP)
@@ -262,7 +280,7 @@ class LoRaTxRxCont(LoRa):
         # Go back into RX mode.
         self.set_rx_mode()
 
-        self.udp_send_rx(rxdata,snr,rssi,pkt_flags,freq_error)
+        self.udp_send_rx(rx_payload,snr,rssi,pkt_flags,freq_error)
 
         # TX-After-RX Logic.
         # We only transmit if:
@@ -275,21 +293,21 @@ class LoRaTxRxCont(LoRa):
             if decode_payload_type(rxdata) == HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY:
                 print("Packet is telemetry...")
                 # Grab the packet information to be transmitted off the tx-after-rx queue.
-                (tx_packet, dest_id, timeout) = self.tx_after_rx.get_nowait()
+                (tx_packet, dest_id, timeout, tx_id) = self.tx_after_rx.get_nowait()
 
                 if decode_payload_id(rxdata) == dest_id:
                     # Do stuff here.
                     print("TX after RX time!")
                     time.sleep(TX_AFTER_RX_DELAY)
-                    self.tx_packet(tx_packet)
+                    self.tx_packet(tx_packet, tx_id=tx_id)
                 else:
                     # Push packet back onto queue.
                     print("Not our destination ID: %d" % decode_payload_id(rxdata))
                     if time.time() > timeout:
                         print("TX Packet has timed out.")
-                        self.udp_broadcast({'type':'ERROR', 'str': 'TX-after-RX packed timed-out.'})
+                        self.udp_error('TX-after-RX packed timed-out.', tx_id)
                     else:
-                        self.tx_after_rx.put_nowait((tx_packet,dest_id,timeout))
+                        self.tx_after_rx.put_nowait((tx_packet,dest_id,timeout,tx_id))
 
         # Uplink timeslot request logic
         # Send a timeslot request packet if:
@@ -377,7 +395,7 @@ class LoRaTxRxCont(LoRa):
         print("\nTxDone")
         print(self.get_irq_flags())
 
-    def tx_packet(self,data):
+    def tx_packet(self,data,tx_id=None):
         # Clip payload to max_paload length.
         if len(data)>self.max_payload:
             data = data[:self.max_payload]
@@ -420,6 +438,8 @@ class LoRaTxRxCont(LoRa):
             'payload' : list(bytearray(data)),
             'txqueuesize' : self.txqueue.qsize()
         }
+        if tx_id != None:
+            tx_indication['tx_id'] = tx_id
         self.udp_broadcast(tx_indication)
         print("Transmitted: %s" % udp_packet_to_string(tx_indication))
         
@@ -439,11 +459,11 @@ class LoRaTxRxCont(LoRa):
 
         # If we get this far, we'll assume the channel is clear, and transmit.
         try:
-            data = self.txqueue.get_nowait()
+            (data, tx_id) = self.txqueue.get_nowait()
         except:
             return
         # Transmit!
-        self.tx_packet(data)
+        self.tx_packet(data, tx_id=tx_id)
 
     # Handle a settings update request. This is currently only used to update
     # the operating frequency of the LoRa module at runtime.
@@ -474,9 +494,10 @@ class LoRaTxRxCont(LoRa):
                 pass
             else:
                 try:
-                    m_data = json.loads(udp_datagram)
+                    m_data = decode_udp_packet(udp_datagram)
                     # Packet to be transmitted.
                     if m_data['type'] == 'TXPKT':
+                        tx_id = m_data.get('tx_id', None)
                         # Switch based on if we have a 'destination' field.
                         if 'destination' in m_data.keys():
                             dest_id = m_data['destination']
@@ -485,12 +506,16 @@ class LoRaTxRxCont(LoRa):
                             else:
                                 tx_timeout = time.time() + self.default_tx_timeout
                             try:
-                                self.tx_after_rx.put_nowait((m_data['payload'],dest_id,tx_timeout))
+                                self.tx_after_rx.put_nowait((m_data['payload'],dest_id,tx_timeout,tx_id))
                             except:
-                                self.udp_broadcast({'type':'ERROR', 'str': 'TX-after-RX Queue is full.'})
+                                self.udp_error('TX-after-RX Queue is full.', tx_id)
                                 continue
                         else:
-                            self.txqueue.put_nowait(m_data['payload']) # TODO: Data type checking.
+                            try:
+                                self.txqueue.put_nowait((m_data['payload'],tx_id)) # TODO: Data type checking.
+                            except:
+                                self.udp_error('TX Queue is full.', tx_id)
+                                continue
 
                         tx_timestamp = datetime.utcnow().isoformat()
                         tx_indication = {
@@ -499,6 +524,8 @@ class LoRaTxRxCont(LoRa):
                             'payload' : list(bytearray(m_data['payload'])),
                             'txqueuesize' : self.txqueue.qsize()
                         }
+                        if tx_id != None:
+                            tx_indication['tx_id'] = tx_id
                         self.udp_broadcast(tx_indication)
                         print("Queued: %s" % udp_packet_to_string(m_data))
                     # Just a check to see if we are alive. Respond immediately.
@@ -546,23 +573,26 @@ class LoRaTxRxCont(LoRa):
     # This function should be run in a separate thread.
     def udp_listen(self):
         s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        s.settimeout(1)
+        s.setblocking(0)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         except:
             pass
+        if self.rcvbuf is not None:
+            set_receive_buffer(s, self.rcvbuf)
         s.bind(('',self.udp_broadcast_port))
+        if self.topics is not None:
+            # Only join the groups for the messages we act on.
+            self.topics.join(s, self.topics.groups_for(['TXPKT', 'PING', 'RF', 'LOWPRIORITY']))
         print("Started UDP Listener Thread.")
         self.udp_listener_running = True
         while self.udp_listener_running:
-            try:
-                m = s.recvfrom(MAX_JSON_LEN)
-            except:
-                m = None
-
-            if m != None:
-                self.udprxqueue.put_nowait(m[0])
+            for m in receive_datagrams(s, MAX_JSON_LEN):
+                try:
+                    self.udprxqueue.put_nowait(m)
+                except Queue.Full:
+                    print("UDP Packet discarded.")
         #
         print("Closing UDP Listener")
         s.close()
@@ -621,12 +651,12 @@ class LoRaTxRxCont(LoRa):
 
             # Check if the tx_after_rx packet has timed out
             if self.tx_after_rx.qsize()>0:
-                (tx_packet, dest_id, timeout) = self.tx_after_rx.get_nowait()
+                (tx_packet, dest_id, timeout, tx_id) = self.tx_after_rx.get_nowait()
                 if time.time() > timeout:
                     print("TX-after-RX Packet automatically timed out.")
-                    self.udp_broadcast({'type':'ERROR', 'str': 'TX-after-RX packed timed-out.'})
+                    self.udp_error('TX-after-RX packed timed-out.', tx_id)
                 else:
-                    self.tx_after_rx.put_nowait((tx_packet,dest_id,timeout))
+                    self.tx_after_rx.put_nowait((tx_packet,dest_id,timeout,tx_id))
 
 
 # Main Script
@@ -640,8 +670,20 @@ parser.add_argument("-f", "--frequency",type=float,default=431.650,help="Operati
 parser.add_argument("-m", "--mode",type=int,default=0,help="Transmit Mode: 0 = Slow, 1 = Fast, 2 = Really Fast")
 parser.add_argument("--callsign", default="blank", help="OPTIONAL: Callsign used for automatic uplink slot requesting.")
 parser.add_argument("--payload_id", default=-1, type=int, help="OPTIONAL: Payload ID to automatically request slot from.")
+parser.add_argument("--binary", action="store_true", default=False, help="OPTIONAL: Send RXPKT/TXQUEUED/TXDONE messages using the compact binary UDP format.")
+transport_group = parser.add_mutually_exclusive_group()
+transport_group.add_argument("--multicast", action="store_true", default=False, help="OPTIONAL: Send messages to per-type multicast groups, rather than broadcasting them.")
+transport_group.add_argument("--loopback", action="store_true", default=False, help="OPTIONAL: As for --multicast, but only on the loopback interface (single-host setups).")
+parser.add_argument("--rcvbuf", default=None, type=int, help="OPTIONAL: Receive buffer size (bytes) for the UDP listener socket. Default: system default.")
 args = parser.parse_args()
 
+if args.multicast:
+    topics = TopicMap('multicast')
+elif args.loopback:
+    topics = TopicMap('loopback')
+else:
+    topics = None
+
 mode = int(args.mode)
 frequency = float(args.frequency)
 my_callsign = args.callsign
@@ -661,7 +703,7 @@ while True:
         sys.exit(1)
 
     try:
-        lora = LoRaTxRxCont(hw,verbose=False,mode=mode,frequency=frequency, callsign=my_callsign, low_priority_destination=payload_id)
+        lora = LoRaTxRxCont(hw,verbose=False,mode=mode,frequency=frequency, callsign=my_callsign, low_priority_destination=payload_id, binary_udp=args.binary, topics=topics, rcvbuf=args.rcvbuf)
         lora.start()
     except KeyboardInterrupt:
         sys.stdout.flush()
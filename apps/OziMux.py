@@ -21,6 +21,8 @@ from threading import Thread
 from PyQt5 import QtGui, QtCore, QtWidgets
 from horuslib import *
 from horuslib.packets import *
+from horuslib.listener import ListenerReactor
+from horuslib.transport import DatagramEndpoint, receive_datagrams, set_receive_buffer
 
 # RX Message queue to avoid threading issues.
 rxqueue = Queue.Queue(32)
@@ -51,7 +53,9 @@ class TelemetryListener(object):
                 callback = None,
                 debug_output = True,
                 log_enabled = False,
-                log_path = "./log/"):
+                log_path = "./log/",
+                event_loop = None,
+                rcvbuf = None):
 
         self.source_name = source_name
         self.source_short_name = source_short_name
@@ -65,11 +69,22 @@ class TelemetryListener(object):
         self.log_enabled = log_enabled
         self.log_file = None
         self.log_path = log_path
+        self.rcvbuf = rcvbuf
 
+        self.endpoint = None
         self.udp_listener_running = True
 
-        self.t = Thread(target=self.udp_rx_thread)
-        self.t.start()
+        if event_loop is not None:
+            self.start(event_loop)
+        else:
+            self.t = Thread(target=self.udp_rx_thread)
+            self.t.start()
+
+
+    def start(self, event_loop):
+        ''' Listen using a shared event loop (i.e. a horuslib.listener.ListenerReactor), rather than a dedicated thread. '''
+        print("INFO: Starting Listener: %s, port %d " % (self.source_name, self.input_port))
+        self.endpoint = DatagramEndpoint(event_loop, self.input_port, self.handle_packet_safe, max_size=256, rcvbuf=self.rcvbuf)
 
 
     def enable_output(self, enabled):
@@ -102,36 +117,40 @@ class TelemetryListener(object):
 
         print("INFO: Starting Listener Thread: %s, port %d " % (self.source_name, self.input_port))
         self.s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        self.s.settimeout(1)
+        self.s.setblocking(0)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         except:
             pass
+        if self.rcvbuf is not None:
+            set_receive_buffer(self.s, self.rcvbuf)
         self.s.bind(('',self.input_port))
         
         while self.udp_listener_running:
-            try:
-                m = self.s.recvfrom(256)
-            except socket.timeout:
-                m = None
-            
-            if m != None:
-                try:
-                    self.handle_packet(m[0])
-                except:
-                    traceback.print_exc()
-                    print("ERROR: Couldn't handle packet correctly.")
-                    pass
+            for _packet in receive_datagrams(self.s, 256):
+                self.handle_packet_safe(_packet)
         
         print("INFO: Closing UDP Listener: %s" % self.source_name)
         self.s.close()
 
 
+    def handle_packet_safe(self, packet):
+        try:
+            self.handle_packet(packet)
+        except:
+            traceback.print_exc()
+            print("ERROR: Couldn't handle packet correctly.")
+
+
     def close(self):
         """
         Close the UDP listener thread.
         """
+        if self.endpoint is not None:
+            self.endpoint.loop.call_soon_threadsafe(self.endpoint.close)
+            self.endpoint = None
+
         self.udp_listener_running = False
 
 
@@ -403,6 +422,7 @@ def telemetry_callback(input_name, packet):
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--config", type=str, default='ozimux.cfg', help="Configuration file. Default: ozimux.cfg")
+parser.add_argument("--rcvbuf", type=int, default=None, help="Receive buffer size (bytes) for the input sockets. Default: system default.")
 args = parser.parse_args()
 
 
@@ -428,6 +448,9 @@ num_inputs = len(input_list)
 
 listener_objects = []
 
+# All the inputs are serviced by a single reactor thread.
+reactor = ListenerReactor()
+
 # Create Objects
 for n in range(num_inputs):
     _obj = TelemetryListener(source_name = input_list[n],
@@ -438,7 +461,9 @@ for n in range(num_inputs):
                             summary_enabled = config['inputs'][input_list[n]]['enabled_at_start'],
                             callback = telemetry_callback,
                             log_enabled = config['enable_logging'],
-                            log_path = config['log_directory']
+                            log_path = config['log_directory'],
+                            event_loop = reactor,
+                            rcvbuf = args.rcvbuf
                             )
 
     listener_objects.append(_obj)
@@ -449,6 +474,9 @@ for n in range(num_inputs):
         inputActive[n].setChecked(True)
 
 
+reactor.start()
+
+
 # Handle checkbox changes.
 def handle_checkbox():
     _checked_id = inputSelector.checkedId()
@@ -514,6 +542,7 @@ if __name__ == "__main__":
         # If we get here, we've closed the window. Close all threads.
         for _obj in listener_objects:
             _obj.close()
+        reactor.close()
 
 
 
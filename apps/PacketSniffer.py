@@ -10,13 +10,17 @@
 
 from horuslib import *
 from horuslib.packets import *
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 import socket,json,sys,Queue,traceback
 
 udp_listener_running = False
 
+# Receive buffer size (bytes) for the listening socket. None uses the system default.
+RX_SOCKET_BUFFER = None
+
 def process_udp(udp_packet, address="0.0.0.0"):
     try:
-        packet_dict = json.loads(udp_packet)
+        packet_dict = decode_udp_packet(udp_packet)
         
         print(udp_packet_to_string(packet_dict))
         sys.stdout.flush()
@@ -27,24 +31,21 @@ def process_udp(udp_packet, address="0.0.0.0"):
 def udp_rx_thread():
     global udp_listener_running
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(0.2)
+    s.setblocking(0)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except:
         pass
+    if RX_SOCKET_BUFFER is not None:
+        set_receive_buffer(s, RX_SOCKET_BUFFER)
     s.bind(('',HORUS_UDP_PORT))
     print("Started UDP Listener Thread.")
     udp_listener_running = True
     while udp_listener_running:
-        try:
-            (m,addr) = s.recvfrom(MAX_JSON_LEN)
+        for (m,addr) in receive_datagrams(s, MAX_JSON_LEN, timeout=0.2, with_address=True):
             print(addr)
-        except socket.timeout:
-            m = None
-        
-        if m != None:
-                process_udp(m)
+            process_udp(m)
     
     print("Closing UDP Listener")
     s.close()
@@ -22,6 +22,7 @@ from horuslib import *
 from horuslib.packets import *
 from horuslib.earthmaths import *
 from horuslib.rotators import PSTRotator, ROTCTLD
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 from threading import Thread
 from PyQt5 import QtGui, QtCore, QtWidgets
 from datetime import datetime
@@ -45,6 +46,12 @@ else:
     logging.error("Invalid Rotator Specified!")
     sys.exit(1)
 
+# Optional receive buffer size (bytes) for the UDP listener sockets. None uses the system default.
+if config.has_option("Interface", "rx_socket_buffer"):
+    rx_socket_buffer = int(config.get("Interface", "rx_socket_buffer"))
+else:
+    rx_socket_buffer = None
+
 
 # RX Message queue to avoid threading issues.
 rxqueue = Queue.Queue(16)
@@ -235,7 +242,7 @@ def connect_rotator():
 
     if rotator_type == 'pstrotator':
         # PST Rotator handles polling internally, we don't need to pass it a poll rate variable.
-        rotator = PSTRotator(rotator_hostname, rotator_port)
+        rotator = PSTRotator(rotator_hostname, rotator_port, rcvbuf=rx_socket_buffer)
         # Not much need to check this one, as it talks entirely via UDP.
         # Can only tell if its working by watching the PSTRotator window...
         rotatorStatusLabel.setText("Started PSTRotator Connection.")
@@ -515,7 +522,7 @@ def update_my_stats(packet):
 # Method to process UDP packets.
 def process_udp(udp_packet):
     try:
-        packet_dict = json.loads(udp_packet)
+        packet_dict = decode_udp_packet(udp_packet)
 
         # TX Confirmation Packet?
         if packet_dict['type'] == 'PAYLOAD_SUMMARY':
@@ -535,23 +542,23 @@ def udp_rx_thread():
     """ Listen for broadcast UDP packets from ChaseTracker / HorusGroundStation, and push into a queue """
     global udp_listener_running
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
+    s.setblocking(0)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except:
         pass
+    if rx_socket_buffer is not None:
+        set_receive_buffer(s, rx_socket_buffer)
     s.bind(('',HORUS_UDP_PORT))
     logging.debug("Started UDP Listener Thread.")
     udp_listener_running = True
     while udp_listener_running:
-        try:
-            m = s.recvfrom(MAX_JSON_LEN)
-        except socket.timeout:
-            m = None
-        
-        if m != None:
-            rxqueue.put_nowait(m[0])
+        for m in receive_datagrams(s, MAX_JSON_LEN):
+            try:
+                rxqueue.put_nowait(m)
+            except Queue.Full:
+                logging.debug("UDP Packet discarded.")
     
     logging.debug("Closing UDP Listener")
     s.close()
@@ -14,18 +14,21 @@ from horuslib.packets import *
 from horuslib.listener import UDPListener
 from horuslib.earthmaths import *
 from horuslib.atmosphere import time_to_landing
-from horuslib.geometry import GenericTrack
+from horuslib.geometry import TrackRegistry
+from horuslib.timestamps import short_time_to_datetime
 from threading import Thread
 from PyQt5 import QtGui, QtCore, QtWidgets
 from datetime import datetime
-import socket,json,sys,Queue,traceback,time,math
+import socket,json,sys,Queue,traceback,time,math,argparse
 
 
 
 # RX Message queue to avoid threading issues.
 rxqueue = Queue.Queue(16)
 
-payload_track = GenericTrack()
+# Per-payload tracks, used to calculate ascent rates. Only the last 100 positions of each are kept in memory.
+# Replaced on startup if an archive directory is given (--archive).
+payload_tracks = TrackRegistry(ttl=3600, retention=100)
 
 # At what data age (Seconds) do we show a warning or error indication?
 PAYLOAD_DATA_WARN = 20.0
@@ -164,13 +167,12 @@ def calculate_az_el_range():
     
 
 def update_payload_stats(packet):
-    global payload_track, payload_latitude, payload_longitude, payload_altitude, payload_lastdata, payload_data_age, altitudeValue, speedValue, ascrateValue, timeToLanding, use_supplied_time
+    global payload_tracks, payload_latitude, payload_longitude, payload_altitude, payload_lastdata, payload_data_age, altitudeValue, speedValue, ascrateValue, timeToLanding, use_supplied_time
     try:
         # Attempt to parse a timestamp from the supplied packet.
         try:
-            packet_time = datetime.strptime(packet['time'], "%H:%M:%S")
             # Insert the hour/minute/second data into the current UTC time.
-            packet_dt = datetime.utcnow().replace(hour=packet_time.hour, minute=packet_time.minute, second=packet_time.second, microsecond=0)
+            packet_dt = short_time_to_datetime(packet['time'])
             # Convert into a unix timestamp:
             timestamp = (packet_dt - datetime(1970, 1, 1)).total_seconds()
         except:
@@ -186,11 +188,10 @@ def update_payload_stats(packet):
         new_longitude = packet['longitude']
         new_altitude = packet['altitude']
 
-        # Update the GenericTrack object with the latest position.
-        payload_track.add_telemetry({'time':packet_dt, 'lat':new_latitude, 'lon':new_longitude, 'alt': new_altitude})
+        # Update this payload's track with the latest position, and grab the latest state of the payload.
+        _latest_state = payload_tracks.add_telemetry(packet.get('callsign', 'Payload'), {'time':packet_dt, 'lat':new_latitude, 'lon':new_longitude, 'alt': new_altitude})
 
-        # Grab the latest state out of the GenericTrack object, and extract the ascent rate from it.
-        _latest_state = payload_track.get_latest_state()
+        # Extract the ascent rate from the latest state.
         if _latest_state != None:
             ascent_rate = _latest_state['ascent_rate']
         else:
@@ -312,9 +313,17 @@ timer.start(100)
 
 ## Start Qt event loop unless running in interactive mode or using pyside.
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--archive", type=str, default=None, help="Save payload tracks to this directory, so ascent rates are available straight away after a restart.")
+    args = parser.parse_args()
+
+    if args.archive is not None:
+        payload_tracks = TrackRegistry(ttl=3600, retention=100, archive_directory=args.archive)
+
     if (sys.flags.interactive != 1) or not hasattr(QtCore, 'PYQT_VERSION'):
-        _udp_listener = UDPListener(callback=handle_listener_callback)
+        _udp_listener = UDPListener(summary_callback=handle_listener_callback, gps_callback=handle_listener_callback)
         _udp_listener.start()
 
         QtWidgets.QApplication.instance().exec_()
         _udp_listener.close()
+        payload_tracks.close()
@@ -22,6 +22,7 @@
 from horuslib import *
 from horuslib.packets import *
 from horuslib.habitat import *
+from horuslib.sockets import receive_datagrams, set_receive_buffer
 from threading import Thread
 from datetime import datetime
 import socket,json,sys,argparse,ConfigParser
@@ -33,6 +34,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument("callsign", help="Listener Callsign")
 parser.add_argument("-l","--log_file",default="telemetry.log",help="Log file for RX Telemetry")
 parser.add_argument("--summary",default=-1,type=int,help="Emit Payload Summary message on provided UDP broadcast on valid packet. Usual Horus UDP port is 55672.")
+parser.add_argument("--rcvbuf",default=None,type=int,help="Receive buffer size (bytes) for the UDP listener socket. Default: system default.")
 args = parser.parse_args()
 
 # Read in payload callsign from config file.
@@ -80,7 +82,7 @@ def emit_payload_summary(telemetry, packet):
 
 def process_udp(udp_packet):
     try:
-        packet = json.loads(udp_packet)
+        packet = decode_udp_packet(udp_packet)
         # Only process received telemetry packets.
         if packet['type'] != "RXPKT":
             return
@@ -91,7 +93,7 @@ def process_udp(udp_packet):
         if packet['pkt_flags']['crc_error'] != 0:
             return
 
-        payload = packet['payload']
+        payload = PacketBuffer(packet['payload'])
         payload_type = decode_payload_type(payload)
 
         # Only process payload telemetry packets.
@@ -113,24 +115,21 @@ def process_udp(udp_packet):
 def udp_rx_thread():
     global udp_listener_running
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
+    s.setblocking(0)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     # OSX Hack.
     try:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except:
         pass
+    if args.rcvbuf is not None:
+        set_receive_buffer(s, args.rcvbuf)
     s.bind(('',HORUS_UDP_PORT))
     print("Started UDP Listener Thread.")
     udp_listener_running = True
     while udp_listener_running:
-        try:
-            m = s.recvfrom(MAX_JSON_LEN)
-        except socket.timeout:
-            m = None
-        
-        if m != None:
-                process_udp(m[0])
+        for m in receive_datagrams(s, MAX_JSON_LEN):
+            process_udp(m)
     
     print("Closing UDP Listener")
     s.close()
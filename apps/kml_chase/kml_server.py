@@ -7,27 +7,33 @@
 #
 
 import time, argparse, math, traceback, json
-from datetime import datetime
-from dateutil.parser import parse
 from horuslib.listener import OziListener, UDPListener
 from horuslib.geometry import *
 from shapely.geometry import Point, LineString, asShape, mapping
-from flask import Flask
+from flask import Flask, request
 from threading import Thread
 
 # Create flask app
 app = Flask(__name__, static_url_path='')
 
-# Objects which store our track data.
-_payload_track = GenericTrack()
-_payload_data_valid = False
-_car_track = GenericTrack()
-_car_data_valid = False
+# Track data for each payload and car (replaced on startup, depending on the command-line options).
+_tracks = TrackRegistry(gps_key='Car')
+# The payload we are running predictions for (the most recently heard payload).
+_prediction_payload = None
 
 # Global settings
 absolute_tracks = True
 no_labels = False
 
+# Track detail levels, selected using ?detail=<level> on any of the URLs below.
+# Tracks are simplified so no position is more than this many metres from the served track.
+TRACK_DETAIL_LEVELS = {
+    'full'  : None,
+    'fine'  : 5.0,
+    'coarse': 50.0
+}
+default_detail = 'full'
+
 # Prediction Tracks
 _predictor = None # Predictor object, instantiated later on, if we are using the predictor.
 _run_abort_prediction = False
@@ -41,6 +47,12 @@ _abort_prediction = []
 _abort_prediction_valid = False
 
 
+def track_tolerance():
+    ''' Get the track simplification tolerance for the current request. '''
+    _detail = request.args.get('detail', default_detail)
+    return TRACK_DETAIL_LEVELS.get(_detail, TRACK_DETAIL_LEVELS[default_detail])
+
+
 # FLASK Server Functions
 # Route / to index.html in static/
 @app.route('/')
@@ -50,26 +62,28 @@ def server_index():
 @app.route('/payload.json')
 def serve_geojson_payload():
     ''' Generate a GeoJSON blob containing the track data '''
-    global _payload_track, _payload_data_valid
 
-    #return json.dumps({'features':[{'geometry':null, 'type':'Feature', 'properties':{'name':'Payload Track'}}]})
+    _latest_positions = _tracks.latest_positions(kind='payload')
 
-    if _payload_data_valid == False:
+    if len(_latest_positions) == 0:
         return json.dumps({})
 
-    # Otherwise, compile a Feature containing the track and latest position.
-    _latest = _payload_track.get_latest_state()
-    _latest_point = Point(_latest['lon'], _latest['lat'], _latest['alt'])
-
-    _payload_mapping = mapping(_payload_track.to_line_string())
+    # Otherwise, compile a Feature containing the track of each payload.
+    _tolerance = track_tolerance()
+    _features = []
+    for _latest in _latest_positions:
+        _track = _tracks.get(_latest['key'])
+        if _track is None:
+            continue
 
-    _features = {'features':[{  'geometry': mapping(_payload_track.to_line_string()),
-                                'type': 'Feature',
-                                'properties': {
-                                    'name': 'Payload Track'
-                                }}]}
+        _features.append({  'geometry': mapping(_track.to_line_string(tolerance=_tolerance, full_history=True)),
+                            'type': 'Feature',
+                            'properties': {
+                                'id': str(_latest['key']),
+                                'name': '%s Track' % str(_latest['key'])
+                            }})
 
-    return json.dumps(_features)
+    return json.dumps({'features':_features})
 
 @app.route('/prediction.json')
 def serve_geojson_prediction():
@@ -80,7 +94,7 @@ def serve_geojson_prediction():
         return json.dumps({})
 
     # Otherwise, compile a Feature containing the track and latest position.
-    _pred_ls = flight_path_to_linestring(_flight_prediction)
+    _pred_ls = flight_path_to_linestring(_flight_prediction, tolerance=track_tolerance())
 
 
     _features = {'features':[{  'geometry': mapping(_pred_ls),
@@ -96,50 +110,50 @@ def serve_geojson_prediction():
 @app.route('/track.kml')
 def serve_kml():
     ''' Generate a KML file, and pass it to the client '''
-    global _payload_track, _payload_data_valid, _car_track, _car_data_valid
+    _latest_positions = _tracks.latest_positions()
+
     # If we have no data, return nothing.
-    if (_payload_data_valid == False) and (_car_data_valid == False):
+    if (len(_latest_positions) == 0) and (_flight_prediction_valid == False):
         return ""
 
     # Array for storing payload/car track geometery data.
     _geom_data = []
+    _tolerance = track_tolerance()
+
+    # Generate position and track data for each payload and car.
+    for _latest in _latest_positions:
+        _track = _tracks.get(_latest['key'])
+        if _track is None:
+            continue
+
+        _key = str(_latest['key'])
+        _placemark = new_placemark(_latest['lat'],
+                                    _latest['lon'],
+                                    _latest['alt'],
+                                    placemark_id=_key,
+                                    name="" if no_labels else _key,
+                                    absolute=absolute_tracks,
+                                    icon="http://maps.google.com/mapfiles/kml/shapes/track.png",
+                                    heading=_latest['heading'])
+
+        if _latest['kind'] == 'payload':
+            _track_ls = flight_path_to_geometry(_track.to_line_string(tolerance=_tolerance, full_history=True),
+                                    placemark_id=_key + " Track",
+                                    name="%s Flight Path" % _key,
+                                    absolute=absolute_tracks,
+                                    track_color="ab02ff00")
+        else:
+            _track_ls = flight_path_to_geometry(_track.to_line_string(tolerance=_tolerance, full_history=True),
+                                    placemark_id=_key + " Track",
+                                    name="%s Track" % _key,
+                                    absolute=absolute_tracks)
 
-    # Generate Payload positon data.
-    if _payload_data_valid:
-        _latest_payload_position = _payload_track.get_latest_state()
-        _payload_placemark = new_placemark(_latest_payload_position['lat'],
-                                            _latest_payload_position['lon'],
-                                            _latest_payload_position['alt'],
-                                            name="" if no_labels else "Payload",
-                                            absolute=absolute_tracks,
-                                            icon="http://maps.google.com/mapfiles/kml/shapes/track.png",
-                                            heading=_latest_payload_position['heading'])
-        _payload_track_ls = flight_path_to_geometry(_payload_track.to_line_string(),
-                                            name="Flight Path",
-                                            absolute=absolute_tracks,
-                                            track_color="ab02ff00")
-        _geom_data.append(_payload_placemark)
-        _geom_data.append(_payload_track_ls)
-
-    # Generate Car Position Data.
-    if _car_data_valid:
-        _latest_car_position = _car_track.get_latest_state()
-        _car_placemark = new_placemark(_latest_car_position['lat'],
-                                            _latest_car_position['lon'],
-                                            _latest_car_position['alt'],
-                                            name="" if no_labels else "Car",
-                                            absolute=absolute_tracks,
-                                            icon="http://maps.google.com/mapfiles/kml/shapes/track.png",
-                                            heading=_latest_car_position['heading'])
-        _car_track_ls = flight_path_to_geometry(_car_track.to_line_string(),
-                                            name="Car Track",
-                                            absolute=absolute_tracks)
-        _geom_data.append(_car_placemark)
-        _geom_data.append(_car_track_ls)
+        _geom_data.append(_placemark)
+        _geom_data.append(_track_ls)
 
 
     if _flight_prediction_valid:
-        _flight_pred_ls = flight_path_to_linestring(_flight_prediction)
+        _flight_pred_ls = flight_path_to_linestring(_flight_prediction, tolerance=_tolerance)
         _flight_pred_geom = flight_path_to_geometry(_flight_pred_ls,
                                             name="Prediction",
                                             absolute=absolute_tracks,
@@ -147,7 +161,7 @@ def serve_kml():
         _geom_data.append(_flight_pred_geom)
 
     if _abort_prediction_valid:
-        _abort_pred_ls = flight_path_to_linestring(_abort_prediction)
+        _abort_pred_ls = flight_path_to_linestring(_abort_prediction, tolerance=_tolerance)
         _abort_pred_geom = flight_path_to_geometry(_abort_pred_ls,
                                             name="Abort Prediction",
                                             absolute=absolute_tracks,
@@ -159,12 +173,16 @@ def serve_kml():
 
 def run_prediction():
     ''' Run a Flight Path prediction '''
-    global _predictor, _payload_track, descent_rate, burst_alt, _flight_prediction, _flight_prediction_valid, _run_abort_prediction
+    global _predictor, descent_rate, burst_alt, _flight_prediction, _flight_prediction_valid, _run_abort_prediction
     global _abort_prediction, _abort_prediction_valid
 
     if _predictor == None:
         return
 
+    _payload_track = _tracks.get(_prediction_payload)
+    if _payload_track is None:
+        return
+
     _current_pos = _payload_track.get_latest_state()
     _current_pos_list = [0,_current_pos['lat'], _current_pos['lon'], _current_pos['alt']]
 
@@ -232,68 +250,31 @@ def spawn_predictor():
         pred_thread.start()
 
 
-# These callbacks pass data on to the different GenericTrack objects, for plotting on demand.
+# These callbacks pass data on to the track registry, for plotting on demand.
 def ozi_listener_callback(data):
     ''' Handle a telemetry dictionary from an OziListener Object '''
-    global _payload_track, _payload_data_valid
-    # Already in the right format, pass it into the payload_track object.
-    _state = _payload_track.add_telemetry(data)
-    _payload_data_valid = True
+    global _prediction_payload
+    # Already in the right format, pass it into the track registry.
+    _tracks.add_telemetry('Payload', data)
+    _prediction_payload = 'Payload'
     print(data)
 
 
 def udp_listener_summary_callback(data):
     ''' Handle a Payload Summary Message from UDPListener '''
-    global _payload_track, _payload_data_valid
-    # Extract the fields we need.
+    global _prediction_payload
     print("SUMMARY:" + str(data))
-    _lat = data['latitude']
-    _lon = data['longitude']
-    _alt = data['altitude']
-    _comment = data['callsign']
-
-    # Process the 'short time' value if we have been provided it.
-    if 'time' in data.keys():
-        _full_time = datetime.utcnow().strftime("%Y-%m-%dT") + data['time'] + "Z"
-        _time_dt = parse(_full_time)
-    else:
-        # Otherwise use the current UTC time.
-        _time_dt = datetime.utcnow()
-
-    _payload_position_update = {
-        'time'  :   _time_dt,
-        'lat'   :   _lat,
-        'lon'   :   _lon,
-        'alt'   :   _alt,
-        'comment':  _comment
-    }
 
-    _payload_track.add_telemetry(_payload_position_update)
-    _payload_data_valid = True
-
-    spawn_predictor()
+    _state = _tracks.add_message(data)
+    if _state is not None:
+        _prediction_payload = _state['key']
+        spawn_predictor()
 
 
 def udp_listener_car_callback(data):
     ''' Handle car position data '''
-    global _car_track, _car_data_valid
     print("CAR:" + str(data))
-    _lat = data['latitude']
-    _lon = data['longitude']
-    _alt = data['altitude']
-    _comment = "Car"
-    _time_dt = datetime.utcnow()
-
-    _car_position_update = {
-        'time'  :   _time_dt,
-        'lat'   :   _lat,
-        'lon'   :   _lon,
-        'alt'   :   _alt,
-        'comment':  _comment
-    }
-
-    _car_track.add_telemetry(_car_position_update)
-    _car_data_valid = True
+    _tracks.add_message(data)
 
 
 
@@ -305,6 +286,10 @@ if __name__ == "__main__":
     group.add_argument("--summary", action="store_true", default=False, help="Take payload input data via Payload Summary Broadcasts.")
     parser.add_argument("--clamp", action="store_false", default=True, help="Clamp all tracks to ground.")
     parser.add_argument("--nolabels", action="store_true", default=False, help="Inhibit labels on placemarks.")
+    parser.add_argument("--archive", type=str, default=None, help="Save tracks to this directory. Tracks are reloaded when a payload/car is next heard (i.e. after a restart).")
+    parser.add_argument("--retention", type=int, default=None, help="Maximum number of positions per track to keep in memory. With --archive, the full tracks are still served (read from the archive), otherwise only the most recent positions are. Default = No limit.")
+    parser.add_argument("--ttl", type=int, default=None, help="Stop displaying payloads/cars which haven't been heard from in this many seconds. Default = Never.")
+    parser.add_argument("--detail", type=str, default="full", choices=sorted(TRACK_DETAIL_LEVELS.keys()), help="Default track detail level, if not given in the request (?detail=). Default = full")
     parser.add_argument("--predict", action="store_true", help="Enable Flight Path Predictions.")
     parser.add_argument("--predict_binary", type=str, default="./pred", help="Location of the CUSF predictor binary. Defaut = ./pred")
     parser.add_argument("--burst_alt", type=float, default=30000.0, help="Expected Burst Altitude (m). Default = 30000")
@@ -316,6 +301,9 @@ if __name__ == "__main__":
     # Set some global variables
     absolute_tracks = args.clamp
     no_labels = args.nolabels
+    default_detail = args.detail
+
+    _tracks = TrackRegistry(ttl=args.ttl, gps_key='Car', archive_directory=args.archive, retention=args.retention)
     burst_alt = args.burst_alt
     descent_rate = math.fabs(args.descent_rate)
     _run_abort_prediction = args.abort
@@ -355,4 +343,6 @@ if __name__ == "__main__":
         _broadcast_listener.close()
         _listener.close()
     except:
-        pass
\ No newline at end of file
+        pass
+
+    _tracks.close()
\ No newline at end of file
@@ -10,16 +10,19 @@
 #   See: https://learn.pimoroni.com/tutorial/sandyj/getting-started-with-four-letter-phat
 #
 
-import time, sys
+import time, sys, argparse
 from horuslib import *
 from horuslib.listener import *
-from horuslib.geometry import GenericTrack
+from horuslib.timestamps import short_time_to_datetime
+from horuslib.geometry import TrackRegistry
 from horuslib.atmosphere import time_to_landing
 import fourletterphat as flp
 
 
 car_altitude = 0.0
-payload_track = GenericTrack()
+# Tracks (by callsign) of the payloads heard, for the ascent rate used in the time-to-landing display.
+# Re-created on startup if --archive is supplied.
+payload_tracks = TrackRegistry(ttl=3600, retention=100)
 landing_time = -1
 
 display_mode = 'alt' # or 'time-to-landing'
@@ -27,13 +30,12 @@ display_mode = 'alt' # or 'time-to-landing'
 
 def handle_payload_summary(packet):
     ''' Handle a 'payload summary' packet, received by the UDP Listener below '''
-    global car_altitude, display_mode, payload_track, landing_time
+    global car_altitude, display_mode, payload_tracks, landing_time
 
     # Attempt to parse a timestamp from the supplied packet.
     try:
-        packet_time = datetime.strptime(packet['time'], "%H:%M:%S")
         # Insert the hour/minute/second data into the current UTC time.
-        packet_dt = datetime.utcnow().replace(hour=packet_time.hour, minute=packet_time.minute, second=packet_time.second, microsecond=0)
+        packet_dt = short_time_to_datetime(packet['time'])
 
     except:
         # If no timestamp is provided, use system time instead.
@@ -45,11 +47,10 @@ def handle_payload_summary(packet):
     new_longitude = packet['longitude']
     new_altitude = packet['altitude']
 
-    # Update the GenericTrack object with the latest position.
-    payload_track.add_telemetry({'time':packet_dt, 'lat':new_latitude, 'lon':new_longitude, 'alt': new_altitude})
+    # Update this payload's track with the latest position, and grab the latest state of the payload.
+    _latest_state = payload_tracks.add_telemetry(packet.get('callsign', 'Payload'), {'time':packet_dt, 'lat':new_latitude, 'lon':new_longitude, 'alt': new_altitude})
 
-    # Grab the latest state out of the GenericTrack object, and extract the ascent rate from it.
-    _latest_state = payload_track.get_latest_state()
+    # Extract the ascent rate from the latest state.
     if _latest_state != None:
         ascent_rate = _latest_state['ascent_rate']
     else:
@@ -107,11 +108,18 @@ def handle_car_telemetry(packet):
 
 if __name__ == "__main__":
 
-    if len(sys.argv) > 1:
-        if sys.argv[1] == 'ttl':
-            display_mode = 'ttl'
-        else:
-            display_mode = 'alt'
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", nargs='?', default='alt', help="Display mode, either 'alt' (altitude) or 'ttl' (time to landing). Default = alt")
+    parser.add_argument("--archive", type=str, default=None, help="Save payload tracks to this directory, so they are reloaded after a restart.")
+    args = parser.parse_args()
+
+    if args.mode == 'ttl':
+        display_mode = 'ttl'
+    else:
+        display_mode = 'alt'
+
+    if args.archive is not None:
+        payload_tracks = TrackRegistry(ttl=3600, retention=100, archive_directory=args.archive)
 
     udp_rx = UDPListener(summary_callback=handle_payload_summary, gps_callback=handle_car_telemetry)
     udp_rx.start()
@@ -125,4 +133,5 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         udp_rx.close()
+        payload_tracks.close()
         print("Closing.")
\ No newline at end of file
@@ -79,7 +79,7 @@ if __name__ == '__main__':
 
     # Instantiate the UDP Broadcast listener.
     udp_rx = UDPListener(
-        callback = handle_udp_packet
+        subscriptions = {'RXPKT': handle_udp_packet}
         )
     # and start it
     udp_rx.start()
@@ -6,8 +6,8 @@
 #   Released under GNU GPL v3 or later
 #
 import argparse, time, datetime, serial, sys
-from dateutil.parser import parse
 from horuslib.listener import UDPListener
+from horuslib.timestamps import short_time_to_datetime
 
 
 # Output object (either a serial object, or a file object). We instantiate this in __main__
@@ -83,7 +83,7 @@ def handle_payload_summary(packet):
     # There are also 'speed' and 'heading' fields, but currently nothing provides useful data in these.
 
     # Convert the 'short' time field into a datetime object.
-    _time_dt = parse(_time)
+    _time_dt = short_time_to_datetime(_time)
 
     # Generate the GPGGA sentence and print it
     _gpgga = pos_to_nmea(_lat,_lon,_alt,_time_dt)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Batch Packet Decoders
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Vectorised decoders for large numbers of packets, i.e. when replaying
+#   a flight's worth of telemetry for post-flight analysis.
+#
+import numpy as np
+from .packets import *
+
+
+# NumPy structured dtype matching PAYLOAD_TELEMETRY_STRUCT ("<BBBHBBBffHBBBBBBBB").
+# Field names match the keys produced by decode_horus_payload_telemetry, with the exception
+# of the raw RSSI byte, which is converted to the 'RSSI' column below.
+PAYLOAD_TELEMETRY_DTYPE = np.dtype([
+    ('packet_type',         'u1'),
+    ('payload_flags',       'u1'),
+    ('payload_id',          'u1'),
+    ('counter',             '<u2'),
+    ('hour',                'u1'),
+    ('minute',              'u1'),
+    ('second',              'u1'),
+    ('latitude',            '<f4'),
+    ('longitude',           '<f4'),
+    ('altitude',            '<u2'),
+    ('speed',               'u1'),
+    ('sats',                'u1'),
+    ('temp',                'u1'),
+    ('batt_voltage_raw',    'u1'),
+    ('pyro_voltage_raw',    'u1'),
+    ('rxPktCount',          'u1'),
+    ('rssi_raw',            'u1'),
+    ('uplinkSlots',         'u1')
+    ])
+
+assert PAYLOAD_TELEMETRY_DTYPE.itemsize == PAYLOAD_TELEMETRY_STRUCT.size
+
+
+def decode_horus_payload_telemetry_batch(frames):
+    """ Decode many Horus binary telemetry packets at once, into columnar arrays.
+
+    Keyword Arguments:
+    frames: Either a string/bytearray containing back-to-back 26-byte telemetry packets (which is viewed
+            without copying), or a list of packets in any form accepted by decode_horus_payload_telemetry.
+            Packets which are not payload telemetry, and packets in a list which are not the correct length, are skipped.
+
+    Return value:
+            A dictionary of numpy arrays, one entry per decoded packet, with the same keys as the output
+            of decode_horus_payload_telemetry, except for the 'time' string field. Use the 'hour', 'minute',
+            'second' or 'seconds_in_day' columns instead.
+            The 'index' column gives the position of each decoded packet in the input, so skipped packets can be identified.
+    """
+
+    if isinstance(frames, (str, bytearray)):
+        if len(frames) % PAYLOAD_TELEMETRY_DTYPE.itemsize != 0:
+            raise ValueError("Buffer length is not a multiple of the telemetry packet length.")
+        _data = np.frombuffer(frames, dtype=PAYLOAD_TELEMETRY_DTYPE)
+        _index = np.arange(len(_data))
+    else:
+        # Copy all the valid frames into a single contiguous buffer.
+        _buffer = bytearray()
+        _index = []
+        for (_i, _frame) in enumerate(frames):
+            _frame = packet_buffer(_frame)
+            if len(_frame) == PAYLOAD_TELEMETRY_DTYPE.itemsize:
+                _buffer += _frame
+                _index.append(_i)
+        _data = np.frombuffer(_buffer, dtype=PAYLOAD_TELEMETRY_DTYPE)
+        _index = np.array(_index, dtype=np.int64)
+
+    _valid = _data['packet_type'] == HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY
+    if not _valid.all():
+        _data = _data[_valid]
+        _index = _index[_valid]
+
+    telemetry = {'index': _index}
+    for _field in PAYLOAD_TELEMETRY_DTYPE.names:
+        if _field != 'rssi_raw':
+            telemetry[_field] = _data[_field]
+
+    # Derived fields, as per decode_horus_payload_telemetry.
+    telemetry['RSSI'] = _data['rssi_raw'].astype(np.int16) - 164
+    # Uplink timeslot stuff.
+    telemetry['used_timeslots'] = (_data['uplinkSlots'] & 0xF0) >> 4 # High Nibble
+    telemetry['current_timeslot'] = _data['uplinkSlots'] & 0x0F # Low Nibble
+
+    # Convert some of the fields into more useful units.
+    telemetry['seconds_in_day'] = _data['hour'].astype(np.int32)*3600 + _data['minute'].astype(np.int32)*60 + _data['second']
+    telemetry['batt_voltage'] = 0.5 + 1.5*_data['batt_voltage_raw']/255.0
+    telemetry['pyro_voltage'] = 5.0*_data['pyro_voltage_raw']/255.0
+
+    return telemetry
+
+
+# NumPy structured dtype matching WENET_GPS_TELEMETRY_STRUCT ('>BHIBffffffBBB').
+# The raw iTOW (milliseconds) field is converted to seconds in the 'iTOW' column below.
+WENET_GPS_TELEMETRY_DTYPE = np.dtype([
+    ('packet_type',     'u1'),
+    ('week',            '>u2'),
+    ('iTOW_ms',         '>u4'),
+    ('leapS',           'u1'),
+    ('latitude',        '>f4'),
+    ('longitude',       '>f4'),
+    ('altitude',        '>f4'),
+    ('ground_speed',    '>f4'),
+    ('heading',         '>f4'),
+    ('ascent_rate',     '>f4'),
+    ('numSV',           'u1'),
+    ('gpsFix',          'u1'),
+    ('dynamic_model',   'u1')
+    ])
+
+assert WENET_GPS_TELEMETRY_DTYPE.itemsize == WENET_GPS_TELEMETRY_STRUCT.size
+
+NP_GPS_EPOCH = np.datetime64(GPS_EPOCH.isoformat(), 'us')
+
+
+def gps_weeksecondstoutc_batch(gpsweek, gpsseconds, leapseconds):
+    """ Vectorised version of gps_weeksecondstoutc.
+
+    Keyword Arguments:
+    gpsweek, gpsseconds, leapseconds: Arrays (or scalars) of GPS week number, seconds-of-week and leap seconds.
+
+    Return value:
+            A numpy datetime64[us] array of UTC times. Use np.datetime_as_string to produce ISO-8601 strings
+            (note these always include microseconds, unlike datetime.isoformat()).
+    """
+    _gpsweek = np.asarray(gpsweek, dtype=np.int64)
+    _gpsseconds = np.asarray(gpsseconds, dtype=np.float64)
+    _leapseconds = np.asarray(leapseconds, dtype=np.int64)
+
+    # Work in integer microseconds, rounding as per datetime.timedelta.
+    _elapsed_us = _gpsweek*(7*86400*1000000) + np.round((_gpsseconds - _leapseconds)*1e6).astype(np.int64)
+    return NP_GPS_EPOCH + _elapsed_us.astype('timedelta64[us]')
+
+
+def decode_wenet_gps_telemetry_batch(frames):
+    """ Decode many Wenet GPS telemetry packets at once, into columnar arrays.
+
+    Keyword Arguments:
+    frames: A list of GPS telemetry packets, in any form accepted by gps_telemetry_decoder. Packets may be
+            padded (as received from the modem). Packets which are too short, or are not GPS telemetry, are skipped.
+
+    Return value:
+            A dictionary of numpy arrays, one entry per packet, with the same numeric keys as the output
+            of gps_telemetry_decoder. The 'timestamp' column is a datetime64[us] array.
+    """
+
+    _buffer = bytearray()
+    for _frame in frames:
+        _frame = packet_buffer(_frame)
+        if (len(_frame) >= WENET_GPS_TELEMETRY_DTYPE.itemsize) and (decode_wenet_packet_type(_frame) == WENET_PACKET_TYPES.GPS_TELEMETRY):
+            _buffer += _frame[:WENET_GPS_TELEMETRY_DTYPE.itemsize]
+
+    _data = np.frombuffer(_buffer, dtype=WENET_GPS_TELEMETRY_DTYPE)
+
+    gps_data = {}
+    for _field in WENET_GPS_TELEMETRY_DTYPE.names:
+        if _field not in ('packet_type', 'iTOW_ms'):
+            gps_data[_field] = _data[_field]
+
+    gps_data['iTOW'] = _data['iTOW_ms']/1000.0 # iTOW provided as milliseconds, convert to seconds.
+    gps_data['timestamp'] = gps_weeksecondstoutc_batch(gps_data['week'], gps_data['iTOW'], gps_data['leapS'])
+
+    return gps_data
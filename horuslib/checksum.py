@@ -0,0 +1,200 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Checksum Utilities
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   CRC16-CCITT (start 0xFFFF, poly 0x1021) as used on UKHAS telemetry sentences,
+#   i.e. $$CALLSIGN,count,HH:MM:SS,lat,lon,alt,other,fields*CRC16
+#
+import re
+import crcmod
+import crcmod.predefined
+
+# Build the CRC function (and its lookup table) once, at import time.
+# Building these is far more expensive than actually calculating a checksum.
+_crc16_ccitt_template = crcmod.predefined.Crc('crc-ccitt-false')
+_crc16_ccitt_fun = crcmod.predefined.mkCrcFun('crc-ccitt-false')
+
+
+def crc16_ccitt(data):
+    """
+    Calculate the CRC16 CCITT checksum of *data*.
+
+    (CRC16 CCITT: start 0xFFFF, poly 0x1021)
+    """
+    return "%04X" % _crc16_ccitt_fun(data)
+
+
+class CRC16CCITT(object):
+    """
+    Incremental CRC16 CCITT calculator, for when data arrives a piece at a time (i.e. character by
+    character from fldigi). Re-uses the lookup table built at import time.
+    """
+
+    def __init__(self, data=None):
+        self.reset()
+        if data is not None:
+            self.update(data)
+
+    def reset(self):
+        ''' Restart the checksum calculation. '''
+        self._crc = _crc16_ccitt_template.new()
+
+    def update(self, data):
+        ''' Add data (a string) to the checksum calculation. '''
+        self._crc.update(data)
+
+    @property
+    def crc(self):
+        ''' Current checksum value, as an integer. '''
+        return self._crc.crcValue
+
+    def hexdigest(self):
+        ''' Current checksum value, as a 4-character upper-case hex string (as used in UKHAS sentences). '''
+        return "%04X" % self._crc.crcValue
+
+
+class SentenceChecker(object):
+    """
+    Check UKHAS telemetry sentences as they stream in, one or more characters at a time.
+
+    The checksum of the sentence body is updated (using CRC16CCITT) as each piece of data arrives, so the
+    result is available as soon as the trailing CRC16 has been received. A '$' always (re)starts a sentence,
+    which also handles sentences preceded by more than two '$' characters.
+
+    update() returns a list of (sentence, crc_ok) tuples for any sentences completed by the supplied
+    data, where sentence is the text between the '$$' and the '*'.
+    """
+
+    # Characters which end a run of sentence body characters.
+    _special = re.compile(r'[$*\r\n]')
+
+    def __init__(self):
+        self._state = 'idle'
+        self._sentence = []
+        self._crc = CRC16CCITT()
+        self._calc_crc = ""
+        self._checksum = []
+
+    def update(self, data):
+        _results = []
+        _i = 0
+
+        while _i < len(data):
+            _char = data[_i]
+
+            if _char == '$':
+                # Start of a new sentence.
+                self._sentence = []
+                self._crc.reset()
+                self._state = 'sentence'
+
+            elif self._state == 'sentence':
+                if _char == '*':
+                    self._sentence = ''.join(self._sentence)
+                    self._calc_crc = self._crc.hexdigest()
+                    self._checksum = []
+                    self._state = 'checksum'
+                elif _char in '\r\n':
+                    # Sentence ended without a checksum.
+                    self._state = 'idle'
+                else:
+                    # Add everything up to the next special character to the sentence and checksum in one go.
+                    _match = self._special.search(data, _i)
+                    _end = _match.start() if _match else len(data)
+                    self._sentence.append(data[_i:_end])
+                    self._crc.update(data[_i:_end])
+                    _i = _end
+                    continue
+
+            elif self._state == 'checksum':
+                self._checksum.append(_char)
+                if len(self._checksum) == 4:
+                    _results.append((self._sentence, ''.join(self._checksum).upper() == self._calc_crc))
+                    self._state = 'idle'
+
+            _i += 1
+
+        return _results
+
+
+def split_sentence(line):
+    """
+    Split a line containing a UKHAS telemetry sentence into a (telemetry, checksum) tuple.
+    Any data preceding the last '$$' in the line is discarded.
+    Returns None if the line does not contain a checksum.
+    """
+    _sentence = line.strip().split('$$')[-1]
+    # Handle odd numbers of $'s at the start of a sentence.
+    if _sentence.startswith('$'):
+        _sentence = _sentence[1:]
+
+    if '*' not in _sentence:
+        return None
+
+    (_telem, _crc) = _sentence.split('*')[:2]
+    return (_telem, _crc.strip())
+
+
+def verify_sentence(line):
+    """ Check the CRC16 of a UKHAS telemetry sentence. Returns True if the checksum is valid. """
+    _fields = split_sentence(line)
+    if _fields is None:
+        return False
+
+    return crc16_ccitt(_fields[0]) == _fields[1].upper()
+
+
+def verify_sentences(lines):
+    """ Check the CRC16 of each of a list of UKHAS telemetry sentences. Returns a list of booleans. """
+    return [verify_sentence(_line) for _line in lines]
+
+
+def verify_sentence_log(filename):
+    """
+    Check every line in a telemetry log file (i.e. as written by FldigiBridge or TelemetryUpload).
+    Lines which do not contain a sentence (no '$$' or checksum) are not counted.
+    Returns a tuple of (number of valid sentences, number of invalid sentences).
+    """
+    _valid = 0
+    _invalid = 0
+
+    with open(filename, 'r') as _log:
+        for _line in _log:
+            if '$$' not in _line or '*' not in _line:
+                continue
+
+            if verify_sentence(_line):
+                _valid += 1
+            else:
+                _invalid += 1
+
+    return (_valid, _invalid)
+
+
+if __name__ == '__main__':
+    # Benchmark the cached CRC function against building the CRC function on every call,
+    # as was previously done in horuslib.packets and FldigiBridge.
+    import timeit
+
+    _sentence = "HORUSLORA1,1234,12:34:56,-34.50000,138.50000,30000,20,9,1.56,1.96,-44,5"
+    _iterations = 10000
+
+    def _uncached_crc16_ccitt(data):
+        crc16 = crcmod.predefined.mkCrcFun('crc-ccitt-false')
+        return hex(crc16(data))[2:].upper().zfill(4)
+
+    def _streaming_check():
+        SentenceChecker().update("$$" + _sentence + "*" + crc16_ccitt(_sentence) + "\n")
+
+    assert _uncached_crc16_ccitt(_sentence) == crc16_ccitt(_sentence)
+
+    _uncached_time = timeit.timeit(lambda: _uncached_crc16_ccitt(_sentence), number=_iterations)
+    _cached_time = timeit.timeit(lambda: crc16_ccitt(_sentence), number=_iterations)
+    _streaming_time = timeit.timeit(_streaming_check, number=_iterations)
+
+    print("Uncached CRC16: %.2f us/sentence" % (_uncached_time*1e6/_iterations))
+    print("Cached CRC16: %.2f us/sentence (%.1fx speedup)" % (_cached_time*1e6/_iterations, _uncached_time/_cached_time))
+    print("Streaming check: %.2f us/sentence" % (_streaming_time*1e6/_iterations))
@@ -0,0 +1,290 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Callback Dispatch
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Run listener callbacks on worker threads, so a slow callback (i.e. a Habitat upload,
+#   or a KML rebuild) doesn't hold up the receive thread, and cause datagrams to be dropped.
+#
+#   Each wrapped callback has a bounded queue. If a callback falls behind and its queue fills,
+#   new messages for that callback are dropped (and counted), rather than blocking the receiver
+#   or any other callback.
+#
+#   Usage:
+#       # A dedicated worker thread for a callback:
+#       upload = QueuedCallback(upload_to_habitat, maxsize=16)
+#       # Or, callbacks sharing a pool of worker threads. Messages for each callback are
+#       # still processed in order, as they are always handled by the same worker.
+#       pool = CallbackPool(workers=4)
+#       kml = pool.wrap(update_kml)
+#
+#   Wrapped callbacks are called just like the original callback, so can be passed to any
+#   listener. UDPListener and OziListener can also wrap their callbacks automatically (see their dispatch argument).
+#
+#   Once a wrapped callback is closed, further calls are dropped (and counted). reopen() returns a new
+#   wrapper for the same callback.
+#
+import Queue
+import traceback
+from threading import Lock, Thread
+
+
+class DispatchedCallback(object):
+    ''' Base class for callbacks run on a worker thread. Keeps queue depth and drop counters. '''
+
+    def __init__(self, callback, name=None):
+        self.callback = callback
+        self.name = name if name is not None else getattr(callback, '__name__', repr(callback))
+
+        self.depth = 0 # Messages queued, or being processed.
+        self.max_depth = 0
+        self.processed = 0
+        self.dropped = 0
+        self.closed = False
+        self._count_lock = Lock()
+
+
+    def _queued(self):
+        with self._count_lock:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+
+    def _dropped(self):
+        with self._count_lock:
+            self.dropped += 1
+
+
+    def _run(self, args, kwargs):
+        ''' Run the callback. Called from a worker thread. '''
+        try:
+            self.callback(*args, **kwargs)
+        except:
+            print("ERROR: Exception in callback %s" % self.name)
+            traceback.print_exc()
+
+        with self._count_lock:
+            self.depth -= 1
+            self.processed += 1
+
+
+    def reopen(self):
+        ''' Return a new wrapper (with the same settings) for the callback, i.e. to replace this one once closed. '''
+        raise NotImplementedError()
+
+
+    def stats(self):
+        ''' Return the queue counters as a dictionary. '''
+        with self._count_lock:
+            return {
+                'name'      : self.name,
+                'depth'     : self.depth,
+                'max_depth' : self.max_depth,
+                'processed' : self.processed,
+                'dropped'   : self.dropped
+            }
+
+
+class QueuedCallback(DispatchedCallback):
+    """
+    A callback with its own bounded queue and worker thread.
+    Calling this object queues the call and returns immediately.
+    """
+
+    def __init__(self, callback, maxsize=32, name=None):
+        DispatchedCallback.__init__(self, callback, name=name)
+        self.queue = Queue.Queue(maxsize)
+        self.running = True
+
+        self.worker = Thread(target=self.worker_thread)
+        self.worker.daemon = True
+        self.worker.start()
+
+
+    def __call__(self, *args, **kwargs):
+        if self.closed:
+            # Anything queued now would be behind the worker's stop marker, so would never be run.
+            self._dropped()
+            return
+
+        self._queued()
+        try:
+            self.queue.put_nowait((args, kwargs))
+        except Queue.Full:
+            with self._count_lock:
+                self.depth -= 1
+            self._dropped()
+
+
+    def worker_thread(self):
+        while self.running:
+            _item = self.queue.get()
+            if _item is None:
+                break
+            self._run(*_item)
+
+
+    def close(self, wait=True):
+        """
+        Stop the worker thread.
+        If wait is True, block until any queued calls have been processed. Otherwise return immediately -
+        queued calls are still processed unless the queue is full, in which case they are discarded.
+        Calls made after this are dropped.
+        """
+        self.closed = True
+        if wait:
+            self.queue.put(None)
+            self.worker.join()
+        else:
+            try:
+                self.queue.put_nowait(None)
+            except Queue.Full:
+                self.running = False
+
+
+    def reopen(self):
+        return QueuedCallback(self.callback, maxsize=self.queue.maxsize, name=self.name)
+
+
+class PooledCallback(DispatchedCallback):
+    ''' A callback run by a CallbackPool. Created using CallbackPool.wrap(). '''
+
+    def __init__(self, pool, callback, worker, maxsize, key=None, name=None):
+        DispatchedCallback.__init__(self, callback, name=name)
+        self.pool = pool
+        self.worker = worker
+        self.maxsize = maxsize
+        self.key = key
+
+
+    def __call__(self, *args, **kwargs):
+        # The worker queues are unbounded, so limit on our own depth instead. This way a slow
+        # callback only drops its own messages, and can't fill the queue it shares with other callbacks.
+        with self._count_lock:
+            if self.closed or self.depth >= self.maxsize:
+                self.dropped += 1
+                return
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+        self.pool.queues[self.worker].put((self, args, kwargs))
+
+
+    def close(self, wait=True):
+        """
+        Detach the callback from the pool. Calls made after this are dropped. Calls already queued are still
+        processed by the pool's workers (wait is accepted for compatibility with QueuedCallback, and ignored).
+        """
+        with self._count_lock:
+            self.closed = True
+        self.pool.detach(self)
+
+
+    def reopen(self):
+        return self.pool.wrap(self.callback, key=self.key, maxsize=self.maxsize, name=self.name)
+
+
+class CallbackPool(object):
+    """
+    A fixed pool of worker threads, shared between any number of callbacks.
+
+    Each callback is assigned to one worker (by its key), so calls to the same callback are always
+    processed in the order they were made. Each callback has its own queue limit (maxsize), so a
+    slow callback only drops its own messages.
+    """
+
+    def __init__(self, workers=4, maxsize=32):
+        """
+        Keyword Arguments:
+        workers: Number of worker threads.
+        maxsize: Default number of calls which can be queued for each callback before calls are dropped.
+        """
+        self.maxsize = maxsize
+        self.callbacks = []
+        self.callbacks_lock = Lock()
+        # Number of callbacks wrapped so far, used to spread callbacks without a key across the workers.
+        self.wrapped_count = 0
+        self.queues = []
+        self.workers = []
+
+        for _i in range(workers):
+            _queue = Queue.Queue()
+            _worker = Thread(target=self.worker_thread, args=(_queue,))
+            _worker.daemon = True
+            _worker.start()
+            self.queues.append(_queue)
+            self.workers.append(_worker)
+
+
+    def wrap(self, callback, key=None, maxsize=None, name=None):
+        """
+        Return a callable which runs callback on the pool.
+        Callbacks with the same key are run by the same worker, so are also processed in order relative to each other.
+        By default each callback gets its own key, with callbacks spread across the workers.
+        """
+        if maxsize is None:
+            maxsize = self.maxsize
+
+        with self.callbacks_lock:
+            if key is None:
+                _worker = self.wrapped_count % len(self.queues)
+            else:
+                _worker = hash(key) % len(self.queues)
+            self.wrapped_count += 1
+
+            _callback = PooledCallback(self, callback, _worker, maxsize, key=key, name=name)
+            self.callbacks.append(_callback)
+
+        return _callback
+
+
+    def detach(self, callback):
+        ''' Remove a (closed) callback from the pool, so it's no longer included in stats(). '''
+        with self.callbacks_lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+
+    def worker_thread(self, queue):
+        while True:
+            _item = queue.get()
+            if _item is None:
+                break
+            (_callback, _args, _kwargs) = _item
+            _callback._run(_args, _kwargs)
+
+
+    def stats(self):
+        ''' Return a list of the queue counters of each callback on the pool. '''
+        with self.callbacks_lock:
+            _callbacks = list(self.callbacks)
+        return [_callback.stats() for _callback in _callbacks]
+
+
+    def close(self, wait=True):
+        ''' Stop the worker threads, once they have processed any queued calls. '''
+        for _queue in self.queues:
+            _queue.put(None)
+
+        if wait:
+            for _worker in self.workers:
+                _worker.join()
+
+
+def dispatch_callback(callback, dispatch):
+    """
+    Wrap a callback according to a listener's dispatch argument:
+        None - Return the callback unchanged (it is run on the receive thread).
+        'thread' - Run the callback on its own worker thread (QueuedCallback).
+        A CallbackPool - Run the callback on the pool.
+    """
+    if dispatch is None or callback is None:
+        return callback
+    elif dispatch == 'thread':
+        return QueuedCallback(callback)
+    elif isinstance(dispatch, CallbackPool):
+        return dispatch.wrap(callback)
+    else:
+        raise ValueError("Unknown dispatch type: %s" % str(dispatch))
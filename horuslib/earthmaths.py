@@ -83,6 +83,32 @@ def position_info(listener, balloon):
         "elevation_radians": elevation
     }
 
+def bearing_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate just the bearing and great circle distance between two positions, as per position_info.
+    Used where these are calculated for every new position, and the other fields are not needed.
+
+    Returns a tuple of (bearing, great circle distance), in degrees and meters.
+    """
+    radius = 6364963.0 # As per position_info
+
+    lat1 = radians(lat1)
+    lat2 = radians(lat2)
+    d_lon = radians(lon2) - radians(lon1)
+
+    cos_lat2 = cos(lat2)
+    cos_d_lon = cos(d_lon)
+    sa = cos_lat2 * sin(d_lon)
+    sb = (cos(lat1) * sin(lat2)) - (sin(lat1) * cos_lat2 * cos_d_lon)
+    bearing = atan2(sa, sb)
+    aa = sqrt((sa ** 2) + (sb ** 2))
+    ab = (sin(lat1) * sin(lat2)) + (cos(lat1) * cos_lat2 * cos_d_lon)
+
+    if bearing < 0:
+        bearing += 2 * pi
+
+    return (degrees(bearing), atan2(aa, ab) * radius)
+
 # Convert a bearing in degrees to a 16-point cardinal direction.
 def bearing_to_cardinal(bearing):
     bearing = bearing % 360.0
@@ -11,7 +11,7 @@ import sys
 import time
 import datetime
 import traceback
-from dateutil.parser import *
+from .timestamps import parse_iso_datetime
 
 def read_telemetry_csv(filename,
     datetime_field = 0,
@@ -28,7 +28,7 @@ def read_telemetry_csv(filename,
     2017-12-27T23:21:59.560,M2913374,982,-34.95143,138.52471,719.9,-273.0,RS92,401.520
     <datetime>,<serial>,<frame_no>,<lat>,<lon>,<alt>,<temp>,<sonde_type>,<freq>
 
-    Note that the datetime field must be parsable by dateutil.parsers.parse.
+    Note that the datetime field should be an ISO-8601 timestamp (other formats are passed to dateutil.parser.parse).
 
     If any fields are missing, or invalid, this function will return None.
 
@@ -50,7 +50,7 @@ def read_telemetry_csv(filename,
             _fields = line.split(delimiter)
 
             # Attempt to parse fields.
-            _datetime = parse(_fields[datetime_field])
+            _datetime = parse_iso_datetime(_fields[datetime_field])
             _latitude = float(_fields[latitude_field])
             _longitude = float(_fields[longitude_field])
             _altitude = float(_fields[altitude_field])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Decoded Telemetry Frame Objects
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+
+
+class TelemetryFrame(object):
+    """
+    Base class for compact, decoded telemetry packets.
+
+    Frames store the fields decoded from a packet in __slots__ (so there is no per-object dict),
+    and compute derived fields (unit conversions, human-readable strings) only when they are accessed.
+    Frames provide a read-only dictionary-style interface, so they can be used in place of the
+    dictionaries previously returned by the packet decoders, i.e. telemetry['latitude'].
+
+    Subclasses must define:
+        __slots__ - Attributes used to store decoded fields, and to cache expensive derived fields.
+        fields - Names of the decoded fields, in the order they should be listed by keys().
+        derived_fields - Names of the derived fields (implemented as properties or class attributes).
+        key_set - frozenset(fields + derived_fields), used for fast key lookups.
+    """
+
+    __slots__ = ()
+    fields = ()
+    derived_fields = ()
+    key_set = frozenset()
+
+    def __getitem__(self, key):
+        if key in self.key_set:
+            return getattr(self, key)
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self.key_set:
+            return getattr(self, key)
+        else:
+            return default
+
+    def __contains__(self, key):
+        return key in self.key_set
+
+    def has_key(self, key):
+        return key in self.key_set
+
+    def keys(self):
+        return list(self.fields + self.derived_fields)
+
+    def __iter__(self):
+        return iter(self.fields + self.derived_fields)
+
+    def __len__(self):
+        return len(self.key_set)
+
+    def values(self):
+        return [getattr(self, _key) for _key in self]
+
+    def items(self):
+        return [(_key, getattr(self, _key)) for _key in self]
+
+    def to_dict(self):
+        ''' Return all fields (including derived fields) as a dictionary. '''
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, TelemetryFrame)):
+            return self.to_dict() == dict(other.items())
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        _equal = self.__eq__(other)
+        return _equal if _equal is NotImplemented else not _equal
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
+
+    def __getstate__(self):
+        # Required to pickle objects without a __dict__.
+        return dict((_slot, getattr(self, _slot)) for _slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for _slot, _value in state.items():
+            setattr(self, _slot, _value)
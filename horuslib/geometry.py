@@ -8,9 +8,18 @@
 import traceback
 import logging
 import fastkml
+import time
 import numpy as np
+from collections import deque, OrderedDict
+from datetime import datetime
+from threading import Lock
 from .atmosphere import *
-from .earthmaths import position_info
+from .earthmaths import bearing_distance
+from .packets import HORUS_PACKET_TYPES, decode_payload_type, decode_horus_payload_telemetry, decode_car_telemetry_packet
+from .simplify import *
+from .trackarchive import *
+from .timestamps import short_time_to_datetime
+from .trackstore import *
 from shapely.geometry import Point, LineString
 
 
@@ -21,12 +30,27 @@ class GenericTrack(object):
     This object performs a running average of the ascent/descent rate, and calculates the predicted landing rate if the payload
     is in descent.
     The track history can be exported to a LineString using the to_line_string method.
+
+    Positions are held in a columnar TrackStore (see horuslib.trackstore), available as the 'store' attribute.
+    They can also be saved to a TrackArchive (see horuslib.trackarchive), so the track survives restarts.
     """
 
     def __init__(self,
         ascent_averaging = 6,
-        landing_rate = 5.0):
-        ''' Create a GenericTrack Object. '''
+        landing_rate = 5.0,
+        archive = None,
+        retention = None):
+        '''
+        Create a GenericTrack Object.
+
+        Keyword Arguments:
+        ascent_averaging: Number of positions the ascent rate is averaged over.
+        landing_rate: Initial (sea level) landing rate.
+        archive: A TrackArchive, or the filename of one, to save all positions to. Positions already in the archive are loaded.
+        retention: Maximum number of positions to hold in memory (at least this many, and at most twice this many, are kept).
+                   If an archive is used, older positions can still be read using full_history(), or exported by passing
+                   full_history=True to to_line_string/to_polyline. Defaults to no limit.
+        '''
 
         # Averaging rate.
         self.ASCENT_AVERAGING = ascent_averaging
@@ -38,8 +62,74 @@ class GenericTrack(object):
         self.is_descending = False
 
         # Internal store of track history data.
-        # Data is stored as a list-of-lists, with elements of [datetime, lat, lon, alt, comment]
-        self.track_history = []
+        # Times are stored as unix timestamps. The time of the latest position is also kept as it was supplied,
+        # so get_latest_state() returns the same object.
+        self.store = TrackStore()
+        self.latest_time = None
+
+        # State used by update_states to update the above incrementally, as each position is added.
+        # The previous position, as (time, lat, lon, alt).
+        self._previous = None
+        # Ascent rates between the last ASCENT_AVERAGING positions, and their sum.
+        self._ascent_rates = deque(maxlen=max(self.ASCENT_AVERAGING-1, 1))
+        self._ascent_rate_sum = 0.0
+
+        # Incremental track simplifiers (for to_line_string/to_polyline), one for each tolerance requested.
+        self.simplifiers = {}
+        # As above, but for the full history read from the archive (which is never trimmed).
+        self.archive_simplifiers = {}
+        self.simplifier_lock = Lock()
+        # Value of store.trimmed when the simplifiers were created. If positions are removed from the
+        # start of the store, the simplifiers have to start again.
+        self.simplifier_trimmed = 0
+
+        self.retention = retention
+        if archive is None or isinstance(archive, TrackArchive):
+            self.archive = archive
+        else:
+            self.archive = TrackArchive(archive)
+
+        if self.archive is not None and len(self.archive) > 0:
+            self.load_archive()
+
+
+    def load_archive(self):
+        ''' Load positions from the archive (up to the retention limit) into memory, and recalculate the payload state. '''
+        _start = 0
+        if self.retention is not None:
+            _start = max(len(self.archive) - self.retention, 0)
+
+        self.store.clear()
+        self.store.extend(self.archive.positions(_start), self.archive.comments(_start))
+        self.latest_time = datetime.utcfromtimestamp(self.store.row(-1)[TRACK_TIME])
+        self.update_states()
+
+
+    def full_history(self, start=0, end=None):
+        '''
+        Return positions start:end of the full track history, as an array of (time, lat, lon, alt) rows.
+        If an archive is being used, positions are read from it (so include positions no longer held in memory).
+        '''
+        if self.archive is not None:
+            return self.archive.positions(start, end)
+        else:
+            return self.store.view(start, end)
+
+
+    def close(self):
+        ''' Close the archive (if used). '''
+        if self.archive is not None:
+            self.archive.close()
+
+
+    @property
+    def track_history(self):
+        ''' The track history as a list-of-lists, with elements of [datetime, lat, lon, alt, comment]. Built on each access. '''
+        with self.store.lock:
+            _data = self.store.data[:self.store.count]
+            _comments = self.store.comments
+        return [[datetime.utcfromtimestamp(_row[TRACK_TIME]), _row[TRACK_LAT], _row[TRACK_LON], _row[TRACK_ALT], _comments[_i]]
+            for (_i, _row) in enumerate(_data.tolist())]
 
 
     def add_telemetry(self,data_dict):
@@ -58,8 +148,15 @@ class GenericTrack(object):
             else:
                 _comment = ""
 
-            self.track_history.append([_datetime, _lat, _lon, _alt, _comment])
-            self.update_states()
+            _time = datetime_to_timestamp(_datetime)
+            self.store.append(_time, _lat, _lon, _alt, _comment)
+            if self.archive is not None:
+                self.archive.append(_time, _lat, _lon, _alt, _comment)
+            if self.retention is not None and len(self.store) >= 2*self.retention:
+                self.store.trim(self.retention)
+
+            self.latest_time = _datetime
+            self.update_states((_time, _lat, _lon, _alt))
             return self.get_latest_state()
         except:
             logging.error("Error reading input data: %s" % traceback.format_exc())
@@ -68,15 +165,15 @@ class GenericTrack(object):
     def get_latest_state(self):
         ''' Get the latest position of the payload '''
 
-        if len(self.track_history) == 0:
+        if len(self.store) == 0:
             return None
         else:
-            _latest_position = self.track_history[-1]
+            _latest_position = self.store.row(-1)
             _state = {
-                'time'  : _latest_position[0],
-                'lat'   : _latest_position[1],
-                'lon'   : _latest_position[2],
-                'alt'   : _latest_position[3],
+                'time'  : self.latest_time,
+                'lat'   : _latest_position[TRACK_LAT],
+                'lon'   : _latest_position[TRACK_LON],
+                'alt'   : _latest_position[TRACK_ALT],
                 'ascent_rate': self.ascent_rate,
                 'is_descending': self.is_descending,
                 'landing_rate': self.landing_rate,
@@ -86,113 +183,361 @@ class GenericTrack(object):
             return _state
 
 
-    def calculate_ascent_rate(self):
-        ''' Calculate the ascent/descent rate of the payload based on the available data '''
-        if len(self.track_history) <= 1:
-            return 5.0
-        elif len(self.track_history) == 2:
-            # Basic ascent rate case - only 2 samples.
-            _time_delta = (self.track_history[-1][0] - self.track_history[-2][0]).total_seconds()
-            _altitude_delta = self.track_history[-1][3] - self.track_history[-2][3]
-            return _altitude_delta/_time_delta
+    def update_states(self, position=None):
+        '''
+        Update internal states with a new position, supplied as a tuple of (time, lat, lon, alt) (time as a unix timestamp).
+        This takes constant time: the ascent rate is a running average over the last ASCENT_AVERAGING positions, and the
+        heading and speed are calculated from the previous position only.
+        If position is not supplied, all states are recalculated from the stored track history.
+        '''
+        if position is None:
+            self._reset_states()
+            return
+
+        if self._previous is not None:
+            _time_delta = position[0] - self._previous[0]
 
-        else:
-            _num_samples = min(len(self.track_history), self.ASCENT_AVERAGING)
-            _asc_rates = []
+            if _time_delta <= 0:
+                # Repeated (or out of order) position. Keep the current states, as we can't calculate any rates from it.
+                return
 
-            for _i in range(-1*(_num_samples-1), 0):
-                _time_delta = (self.track_history[_i][0] - self.track_history[_i-1][0]).total_seconds()
-                _altitude_delta = self.track_history[_i][3] - self.track_history[_i-1][3]
-                _asc_rates.append(_altitude_delta/_time_delta)
+            _ascent_rate = (position[3] - self._previous[3])/_time_delta
+            if len(self._ascent_rates) == self._ascent_rates.maxlen:
+                self._ascent_rate_sum -= self._ascent_rates[0]
+            self._ascent_rates.append(_ascent_rate)
+            self._ascent_rate_sum += _ascent_rate
+            self.ascent_rate = self._ascent_rate_sum/len(self._ascent_rates)
 
-            return np.mean(_asc_rates)
+            (self.heading, _distance) = bearing_distance(self._previous[1], self._previous[2], position[1], position[2])
+            self.speed = _distance/_time_delta
 
-    def calculate_heading(self):
-        ''' Calculate the heading of the payload '''
-        if len(self.track_history) <= 1:
-            return 0.0
-        else:
-            _pos_1 = self.track_history[-2]
-            _pos_2 = self.track_history[-1]
+        self._previous = position
+        self.is_descending = self.ascent_rate < 0.0
 
-            _pos_info = position_info((_pos_1[1],_pos_1[2],_pos_1[3]), (_pos_2[1],_pos_2[2],_pos_2[3]))
+        if self.is_descending:
+            self.landing_rate = seaLevelDescentRate(self.ascent_rate, position[3])
 
-            return _pos_info['bearing']
 
-    def calculate_speed(self):
-        """ Calculate Payload Speed in metres per second """
-        if len(self.track_history)<=1:
-            return 0.0
-        else:
-            _time_delta = (self.track_history[-1][0] - self.track_history[-2][0]).total_seconds()
-            _pos_1 = self.track_history[-2]
-            _pos_2 = self.track_history[-1]
+    def _reset_states(self):
+        ''' Recalculate all states (and the running averages used by update_states) from the stored track history. '''
+        self._previous = None
+        self._ascent_rates.clear()
+        self._ascent_rate_sum = 0.0
+        self.ascent_rate = 5.0
+        self.heading = 0.0
+        self.speed = 0.0
 
-            _pos_info = position_info((_pos_1[1],_pos_1[2],_pos_1[3]), (_pos_2[1],_pos_2[2],_pos_2[3]))
+        _num_samples = min(len(self.store), self.ASCENT_AVERAGING)
+        for _position in self.store.view(len(self.store) - _num_samples).tolist():
+            self.update_states(tuple(_position))
 
-            _speed = _pos_info['great_circle_distance']/_time_delta
 
-            return _speed
+    def simplified_positions(self, tolerance, full_history=False):
+        '''
+        Return an array of the track positions kept when the track is simplified to the supplied tolerance (metres).
+        If full_history is True, the full history is simplified (see full_history()), rather than the positions in memory.
+        '''
+        if full_history and self.archive is not None:
+            _track = self.archive.positions()
+            _simplifiers = self.archive_simplifiers
+        else:
+            (_trimmed, _track) = self.store.snapshot()
+            _simplifiers = None
 
+        with self.simplifier_lock:
+            if _simplifiers is None:
+                if _trimmed != self.simplifier_trimmed:
+                    self.simplifiers = {}
+                    self.simplifier_trimmed = _trimmed
+                _simplifiers = self.simplifiers
 
-    def update_states(self):
-        ''' Update internal states based on the current data '''
-        self.ascent_rate = self.calculate_ascent_rate()
-        self.heading = self.calculate_heading()
-        self.speed = self.calculate_speed()
-        self.is_descending = self.ascent_rate < 0.0
+            if tolerance not in _simplifiers:
+                _simplifiers[tolerance] = TrackSimplifier(tolerance)
 
-        if self.is_descending:
-            _current_alt = self.track_history[-1][3]
-            self.landing_rate = seaLevelDescentRate(self.ascent_rate, _current_alt)
+            _indices = _simplifiers[tolerance].update(_track[:, TRACK_LAT:TRACK_ALT+1])
 
+        return _track[_indices]
 
-    def to_line_string(self):
-        ''' Generate and return a LineString object representation of the track history '''
 
-        # Copy array into a numpy representation for easier slicing.
-        if len(self.track_history) == 0:
-            return None
-        elif len(self.track_history) == 1:
+    def track_points(self, columns, tolerance=None, full_history=False):
+        '''
+        Return an array of the track positions, with the supplied columns (i.e. [TRACK_LON, TRACK_LAT, TRACK_ALT]).
+        If a tolerance (metres) is supplied, the track is simplified (see horuslib.simplify) so no position is further
+        than this from the returned track.
+        If full_history is True and an archive is being used, the track is read from the archive, so includes positions
+        no longer held in memory (see the retention argument). Otherwise only the positions in memory are returned.
+        '''
+        if tolerance:
+            _track = self.simplified_positions(tolerance, full_history=full_history)
+        elif full_history:
+            _track = self.full_history()
+        else:
+            _track = self.store.view()
+
+        if len(_track) == 1:
             # LineStrings need at least 2 points. If we only have a single point,
             # fudge it by duplicating the single point.
-            _track_data_np = np.array([self.track_history[0], self.track_history[0]])
-        else:
-            _track_data_np = np.array(self.track_history)
-        # Produce new array with required ordering: lon, lat, alt (thanks KML...)
-        _track_points = np.column_stack((_track_data_np[:,2], _track_data_np[:,1], _track_data_np[:,3]))
+            _track = np.repeat(_track, 2, axis=0)
+
+        return _track[:, columns]
+
+
+    def to_line_string(self, tolerance=None, full_history=False):
+        ''' Generate and return a LineString object representation of the track history, optionally simplified (see track_points) '''
+        if len(self.store) == 0:
+            return None
 
-        return LineString(_track_points.tolist())
+        # Required ordering: lon, lat, alt (thanks KML...)
+        return LineString(self.track_points([TRACK_LON, TRACK_LAT, TRACK_ALT], tolerance=tolerance, full_history=full_history))
 
 
-    def to_polyline(self):
-        ''' Generate and return a Leaflet PolyLine compatible array '''
-        # Copy array into a numpy representation for easier slicing.
-        if len(self.track_history) == 0:
+    def to_polyline(self, tolerance=None, full_history=False):
+        ''' Generate and return a Leaflet PolyLine compatible array, optionally simplified (see track_points) '''
+        if len(self.store) == 0:
             return []
-        elif len(self.track_history) == 1:
-            # LineStrings need at least 2 points. If we only have a single point,
-            # fudge it by duplicating the single point.
-            _track_data_np = np.array([self.track_history[0], self.track_history[0]])
+
+        return self.track_points([TRACK_LAT, TRACK_LON, TRACK_ALT], tolerance=tolerance, full_history=full_history).tolist()
+
+
+class TrackRegistry(object):
+    """
+    Keeps a GenericTrack for each vehicle (payload or chase car), created on demand as telemetry arrives.
+
+    Vehicles are identified by a key: the callsign (PAYLOAD_SUMMARY and car telemetry), the source name (OZIMUX),
+    the payload ID (payload telemetry in RXPKT messages), or gps_key (GPS messages, which don't identify the car).
+    Vehicles which have not been heard from in ttl seconds are removed, as are the least recently heard vehicles
+    if there are more than max_tracks.
+
+    As a payload's telemetry (keyed by payload ID) and its summaries (keyed by callsign) can't be matched up, feed the
+    registry one or the other. Feeding it both results in each payload being tracked twice.
+
+    Usage:
+        registry = TrackRegistry(ttl=3600)
+        listener = UDPListener(summary_callback=registry.add_message, gps_callback=registry.add_message)
+        for _state in registry.latest_positions(kind='payload'):
+            print(_state['key'], _state['lat'], _state['lon'], _state['alt'])
+    """
+
+    def __init__(self, max_tracks=32, ttl=None, gps_key='GPS', archive_directory=None, **kwargs):
+        """
+        Keyword Arguments:
+        max_tracks: Maximum number of vehicles to track.
+        ttl: Remove vehicles which haven't been heard from in this many seconds. Defaults to never.
+        gps_key: Key used for the vehicle position in GPS messages (i.e. the local chase car).
+        archive_directory: If supplied, each vehicle's track is saved to (and reloaded from) an archive in this directory.
+        Other keyword arguments are passed on to each GenericTrack (i.e. retention=1000).
+        """
+        self.max_tracks = max_tracks
+        self.ttl = ttl
+        self.gps_key = gps_key
+        self.archive_directory = archive_directory
+        self.track_args = kwargs
+
+        # Vehicle key -> GenericTrack, least recently heard first.
+        self.tracks = OrderedDict()
+        # Vehicle key -> (Time last heard, latest state)
+        self.latest = {}
+        # Vehicle key -> Type of vehicle
+        self.kinds = {}
+        self.lock = Lock()
+
+
+    def __len__(self):
+        return len(self.tracks)
+
+
+    def __contains__(self, key):
+        return key in self.tracks
+
+
+    def keys(self):
+        ''' Return a list of the vehicles being tracked, least recently heard first. '''
+        with self.lock:
+            return list(self.tracks.keys())
+
+
+    def get(self, key):
+        ''' Return the GenericTrack for a vehicle, or None if it isn't being tracked. '''
+        return self.tracks.get(key, None)
+
+
+    def add_telemetry(self, key, data_dict, kind='payload'):
+        """
+        Add a position (a dictionary with time/lat/lon/alt and optionally comment, as per GenericTrack.add_telemetry)
+        for a vehicle, creating its track if required. Returns the vehicle's latest state, with additional key and kind fields.
+
+        Keyword Arguments:
+        key: Vehicle key (i.e. a callsign).
+        data_dict: Position.
+        kind: Type of vehicle, i.e. 'payload' or 'car'. Only used when the vehicle's track is created.
+        """
+        _now = time.time()
+        _new_track = None
+
+        while True:
+            with self.lock:
+                _track = self.tracks.pop(key, None)
+                if _track is None and _new_track is not None:
+                    (_track, _new_track) = (_new_track, None)
+                    self.kinds[key] = kind
+
+                if _track is not None:
+                    # Re-insert at the end, so the tracks stay in least-recently heard order.
+                    self.tracks[key] = _track
+
+                    _state = _track.add_telemetry(data_dict)
+                    if _state is not None:
+                        _state['key'] = key
+                        _state['kind'] = self.kinds[key]
+                        # Keep our own copy, so callers can modify the returned state.
+                        self.latest[key] = (_now, dict(_state))
+
+                    self._expire(_now)
+                    break
+
+            # Creating a track may load its archive from disk, so this is done without holding the lock.
+            _new_track = self.new_track(key)
+
+        if _new_track is not None:
+            # Another thread created this vehicle's track while we were creating ours.
+            _new_track.close()
+
+        return _state
+
+
+    def new_track(self, key):
+        ''' Create a track for a vehicle. '''
+        if self.archive_directory is not None:
+            if not isinstance(key, basestring):
+                # i.e. a payload ID.
+                key = str(key)
+            return GenericTrack(archive=archive_filename(self.archive_directory, key), **self.track_args)
         else:
-            _track_data_np = np.array(self.track_history)
-        # Produce new array
-        _track_points = np.column_stack((_track_data_np[:,1], _track_data_np[:,2], _track_data_np[:,3]))
+            return GenericTrack(**self.track_args)
+
+
+    def add_message(self, message):
+        """
+        Add a position from a received message, if it contains one. Accepts PAYLOAD_SUMMARY, OZIMUX, GPS and RXPKT UDP messages
+        (the latter carrying payload or car telemetry), or decoded car telemetry (decode_car_telemetry_packet).
+        Returns the vehicle's latest state (see add_telemetry), or None if the message was not a position.
+        """
+        try:
+            _type = message.get('type', None)
+
+            if _type == 'PAYLOAD_SUMMARY':
+                if 'time' in message:
+                    _time = short_time_to_datetime(message['time'])
+                else:
+                    _time = datetime.utcnow()
+                return self.add_telemetry(message['callsign'],
+                    {'time': _time, 'lat': message['latitude'], 'lon': message['longitude'], 'alt': message['altitude'], 'comment': message['callsign']})
+
+            elif _type == 'OZIMUX':
+                if 'time' in message:
+                    _time = short_time_to_datetime(message['time'])
+                else:
+                    _time = datetime.utcnow()
+                return self.add_telemetry(message['source_name'],
+                    {'time': _time, 'lat': message['latitude'], 'lon': message['longitude'], 'alt': message['altitude'], 'comment': message['source_name']})
+
+            elif _type == 'GPS':
+                if message.get('valid', True) == False:
+                    return None
+                return self.add_telemetry(self.gps_key,
+                    {'time': datetime.utcnow(), 'lat': message['latitude'], 'lon': message['longitude'], 'alt': message['altitude'], 'comment': self.gps_key},
+                    kind='car')
+
+            elif _type == 'RXPKT':
+                if message['pkt_flags']['crc_error'] != 0:
+                    return None
+
+                _payload_type = decode_payload_type(message['payload'])
+                if _payload_type == HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY:
+                    _telemetry = decode_horus_payload_telemetry(message['payload'])
+                    if not _telemetry:
+                        return None
+                    return self.add_telemetry(_telemetry['payload_id'],
+                        {'time': short_time_to_datetime(_telemetry['time']), 'lat': _telemetry['latitude'], 'lon': _telemetry['longitude'],
+                        'alt': _telemetry['altitude'], 'comment': str(_telemetry['payload_id'])})
+                elif _payload_type == HORUS_PACKET_TYPES.CAR_TELEMETRY:
+                    return self.add_message(decode_car_telemetry_packet(message['payload']))
+
+            elif message.get('packet_type', None) == HORUS_PACKET_TYPES.CAR_TELEMETRY:
+                # Car telemetry doesn't include an altitude.
+                return self.add_telemetry(message['callsign'],
+                    {'time': datetime.utcnow(), 'lat': message['latitude'], 'lon': message['longitude'], 'alt': 0.0, 'comment': message['message']},
+                    kind='car')
+
+        except:
+            logging.error("Error adding message to track registry: %s" % traceback.format_exc())
+
+        return None
+
 
-        return _track_points.tolist()
+    def latest_positions(self, kind=None):
+        ''' Return a list of the latest state of each vehicle (see add_telemetry), optionally only those of a kind (i.e. 'payload'). '''
+        with self.lock:
+            self._expire(time.time())
+            _latest = list(self.latest.values())
+
+        return [dict(_state) for (_heard, _state) in _latest if (kind is None) or (_state['kind'] == kind)]
+
+
+    def expire(self):
+        ''' Remove vehicles which have not been heard from in ttl seconds. '''
+        with self.lock:
+            self._expire(time.time())
+
+
+    def _expire(self, now):
+        ''' Remove idle (and excess) vehicles, least recently heard first. Must be called with the lock held. '''
+        while len(self.tracks) > 0:
+            _key = next(iter(self.tracks))
+            _heard = self.latest[_key][0] if _key in self.latest else 0
+
+            if len(self.tracks) > self.max_tracks or (self.ttl is not None and (now - _heard) > self.ttl):
+                self._remove(_key)
+            else:
+                break
+
+
+    def remove(self, key):
+        ''' Stop tracking a vehicle. '''
+        with self.lock:
+            if key in self.tracks:
+                self._remove(key)
+
+
+    def _remove(self, key):
+        self.tracks.pop(key).close()
+        self.latest.pop(key, None)
+        self.kinds.pop(key, None)
+
+
+    def close(self):
+        ''' Remove all vehicles, closing any archives. '''
+        with self.lock:
+            for _key in list(self.tracks.keys()):
+                self._remove(_key)
 
 
 # Geometry-to-KML methods
 ns = '{http://www.opengis.net/kml/2.2}'
 
-def flight_path_to_linestring(flight_path):
-    ''' Convert a predicted flight path to a LineString geometry object '''
+def flight_path_to_linestring(flight_path, tolerance=None):
+    ''' Convert a predicted flight path to a LineString geometry object, optionally simplified to a tolerance (metres) '''
 
     track_points = []
     for _point in flight_path:
         # Flight path array is in lat,lon,alt order, needs to be in lon,lat,alt
         track_points.append([_point[2],_point[1],_point[3]])
 
+    if tolerance and len(track_points) > 2:
+        _points = np.array(track_points, dtype=np.float64)
+        _indices = douglas_peucker(_points[:, [1, 0, 2]], tolerance)
+        track_points = _points[_indices]
+
     return LineString(track_points)
 
 
@@ -0,0 +1,217 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Image Geotag Index
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Links Wenet image telemetry (the position and attitude of the payload when each
+#   image was captured) to SSDV images, keyed by (callsign, image_id).
+#
+#   The index is held in memory, and optionally persisted to a file (one JSON record per line,
+#   appended as records are added), which is re-loaded on startup.
+#
+#   Usage:
+#       index = GeotagIndex("geotags.log")
+#       index.add_packet(wenet_packet) # Image telemetry packets, other packets are ignored.
+#       record = index.get("VK5QI", 12)
+#       records = index.bbox(-35.0, -34.5, 138.0, 139.0)
+#
+import calendar
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from threading import Lock
+from .packetbuffer import *
+from .wenet import *
+
+# Fields copied from the image telemetry into each geotag record.
+GEOTAG_FIELDS = ('callsign', 'image_id', 'sequence_number', 'timestamp',
+    'latitude', 'longitude', 'altitude', 'ground_speed', 'heading', 'ascent_rate', 'numSV', 'gpsFix',
+    'euler_heading', 'euler_roll', 'euler_pitch',
+    'quaternion_x', 'quaternion_y', 'quaternion_z', 'quaternion_w')
+
+# Fields every record must have to be indexed.
+GEOTAG_REQUIRED_FIELDS = ('callsign', 'image_id', 'time', 'latitude', 'longitude')
+
+
+def _unix_time(t):
+    ''' Convert a datetime (assumed UTC) to a unix timestamp. Numbers are passed through. '''
+    if isinstance(t, datetime):
+        return calendar.timegm(t.utctimetuple()) + t.microsecond/1e6
+    else:
+        return t
+
+
+class _SortedIndex(object):
+    ''' Keys, sorted by an associated value, for range queries. '''
+
+    def __init__(self):
+        self.values = []
+        self.keys = []
+
+    def insert(self, value, key):
+        _i = bisect_right(self.values, value)
+        self.values.insert(_i, value)
+        self.keys.insert(_i, key)
+
+    def remove(self, value, key):
+        _i = bisect_left(self.values, value)
+        while self.keys[_i] != key:
+            _i += 1
+        del self.values[_i]
+        del self.keys[_i]
+
+    def range(self, low=None, high=None):
+        ''' Return the keys with values between low and high (inclusive), in value order. '''
+        _lo = 0 if low is None else bisect_left(self.values, low)
+        _hi = len(self.values) if high is None else bisect_right(self.values, high)
+        return self.keys[_lo:_hi]
+
+
+class GeotagIndex(object):
+    """
+    Index of image positions and attitudes, keyed by (callsign, image_id).
+
+    Records are dictionaries containing GEOTAG_FIELDS, plus 'time' (unix timestamp of the image capture).
+    Lookups by image are a dictionary lookup, and time-range and bounding-box queries use sorted
+    indexes (by time, and by latitude) so only nearby records are examined.
+    If an image ID is re-used (image IDs wrap around), the newer record replaces the older one.
+    """
+
+    def __init__(self, filename=None):
+        """
+        Keyword Arguments:
+        filename: File used to persist the index. Existing records in this file are loaded,
+                  and new records are appended to it. If None, the index is only held in memory.
+        """
+        self.filename = filename
+        self.records = {}
+
+        # Record keys, sorted by time and latitude, for range queries.
+        self._time_index = _SortedIndex()
+        self._lat_index = _SortedIndex()
+
+        self._file = None
+        self.lock = Lock()
+
+        if filename is not None:
+            if os.path.exists(filename):
+                self.load(filename)
+            self._file = open(filename, 'a')
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def _insert(self, record):
+        ''' Add a record to the in-memory indexes. Must be called with the lock held. '''
+        _key = (record['callsign'], record['image_id'])
+
+        _old = self.records.get(_key, None)
+        if _old is not None:
+            self._time_index.remove(_old['time'], _key)
+            self._lat_index.remove(_old['latitude'], _key)
+
+        self.records[_key] = record
+        self._time_index.insert(record['time'], _key)
+        self._lat_index.insert(record['latitude'], _key)
+
+
+    def add_record(self, record):
+        """ Add a geotag record (a dictionary containing at least callsign, image_id, time, latitude and longitude). """
+        with self.lock:
+            self._insert(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+
+
+    def add_image_telemetry(self, image_data):
+        """ Add the output of image_telemetry_decoder to the index. Returns the new record, or None if the telemetry is not valid. """
+        if image_data['error'] != 'None':
+            return None
+
+        _record = dict((_field, image_data[_field]) for _field in GEOTAG_FIELDS)
+        _record['time'] = GPS_EPOCH_UNIX + image_data['week']*604800 + image_data['iTOW'] - image_data['leapS']
+
+        self.add_record(_record)
+        return _record
+
+
+    def add_packet(self, packet):
+        """ Add a Wenet packet to the index. Packets other than image telemetry are ignored. Returns the new record or None. """
+        packet = packet_buffer(packet)
+        if decode_wenet_packet_type(packet) != WENET_PACKET_TYPES.IMAGE_TELEMETRY:
+            return None
+
+        return self.add_image_telemetry(image_telemetry_decoder(packet))
+
+
+    def load(self, filename):
+        ''' Load records from a file. Lines which cannot be parsed are skipped. '''
+        _count = 0
+        with open(filename, 'r') as _f:
+            for _line in _f:
+                try:
+                    _record = json.loads(_line)
+                    for _field in GEOTAG_REQUIRED_FIELDS:
+                        if _field not in _record:
+                            raise KeyError(_field)
+                    # JSON turns strings into unicode, convert the callsign back so keys match.
+                    _record['callsign'] = str(_record['callsign'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+                with self.lock:
+                    self._insert(_record)
+                _count += 1
+
+        return _count
+
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+    def get(self, callsign, image_id):
+        ''' Return the record for an image, or None if it is not in the index. '''
+        return self.records.get((callsign, image_id), None)
+
+
+    def time_range(self, start=None, end=None):
+        """
+        Return records for images captured between start and end (inclusive), in time order.
+        start and end may be unix timestamps or (UTC) datetime objects. None means unbounded.
+        """
+        with self.lock:
+            _keys = self._time_index.range(_unix_time(start), _unix_time(end))
+            return [self.records[_key] for _key in _keys]
+
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Return records for images captured within a bounding box.
+        If lon_min > lon_max, the box is assumed to cross the 180 degree meridian.
+        """
+        with self.lock:
+            _candidates = [self.records[_key] for _key in self._lat_index.range(lat_min, lat_max)]
+
+        if lon_min <= lon_max:
+            return [_r for _r in _candidates if lon_min <= _r['longitude'] <= lon_max]
+        else:
+            return [_r for _r in _candidates if _r['longitude'] >= lon_min or _r['longitude'] <= lon_max]
+
+
+    def latest(self, count=1):
+        ''' Return the most recently captured images, newest last. '''
+        if count <= 0:
+            return []
+
+        with self.lock:
+            return [self.records[_key] for _key in self._time_index.keys[-count:]]
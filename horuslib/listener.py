@@ -6,94 +6,514 @@
 #   Released under GNU GPL v3 or later
 #
 
-import socket, json, sys, traceback
-from threading import Thread
-from dateutil.parser import parse
+import socket, select, json, sys, time, traceback
+from threading import Thread, Event, Lock
 from datetime import datetime
 from . import *
+from .dispatch import *
 from .packets import *
+from .timestamps import *
+from .transport import *
 
 
 class UDPListener(object):
     ''' UDP Broadcast Packet Listener 
-    Listens for Horus Lib UDP broadcast packets, and passes them onto a callback function
+    Listens for Horus Lib UDP broadcast packets, and passes them onto callback functions.
+
+    Callbacks can be subscribed to all messages (callback), or to particular message types
+    (summary_callback, gps_callback, the subscriptions dictionary, or subscribe()).
+    If no callbacks are subscribed to all messages, datagrams are checked for their message type
+    before being decoded, and those which no-one has subscribed to are discarded without decoding them.
+
+    If a horuslib.topics.TopicMap is supplied (topics), the listener joins the multicast groups for the
+    message types which have been subscribed to, and leaves them once they are no longer subscribed to.
+
+    By default callbacks are run on the receive thread. If dispatch is 'thread' or a
+    horuslib.dispatch.CallbackPool, they are run on worker threads instead (see dispatch_stats()).
+    close() stops the workers, and start() creates new ones, so a listener can be restarted.
     '''
 
     def __init__(self,
         callback=None,
         summary_callback = None,
         gps_callback = None,
-        port=HORUS_UDP_PORT):
+        port=HORUS_UDP_PORT,
+        subscriptions = None,
+        dispatch = None,
+        rcvbuf = None,
+        topics = None):
+        """
+        Keyword Arguments:
+        callback: Function called with every received message.
+        summary_callback: Function called with received PAYLOAD_SUMMARY messages.
+        gps_callback: Function called with received GPS messages.
+        port: UDP port to listen on.
+        subscriptions: Dictionary of message type -> function (or list of functions) to call with messages of that type.
+        dispatch: How callbacks are run: None (on the receive thread), 'thread' (each callback gets its own
+                  worker thread and queue), or a horuslib.dispatch.CallbackPool.
+        rcvbuf: If supplied, set the socket's receive buffer (SO_RCVBUF) to this many bytes.
+        topics: horuslib.topics.TopicMap, if receiving messages by multicast.
+        """
 
         self.udp_port = port
-        self.callback = callback
-        self.summary_callback = summary_callback
-        self.gps_callback = gps_callback
+        self.dispatch = dispatch
+        self.rcvbuf = rcvbuf
+        self.topics = topics
+        self.joined_groups = set()
 
         self.listener_thread = None
+        self.endpoint = None
         self.s = None
         self.udp_listener_running = False
 
+        self.callback = callback
+        self.summary_callback = summary_callback
+        self.gps_callback = gps_callback
+
+        # Subscribed callbacks. These are replaced (rather than modified) when subscriptions change,
+        # so the receive thread never sees them part-way through an update.
+        self.all_callbacks = ()
+        self.type_callbacks = {}
+        self.subscription_lock = Lock()
+
+        if callback is not None:
+            self.subscribe(None, callback)
+        if summary_callback is not None:
+            self.subscribe('PAYLOAD_SUMMARY', summary_callback)
+        if gps_callback is not None:
+            self.subscribe('GPS', gps_callback)
+        if subscriptions is None:
+            subscriptions = {}
+        for _type, _callbacks in subscriptions.items():
+            if not isinstance(_callbacks, (list, tuple)):
+                _callbacks = [_callbacks]
+            for _callback in _callbacks:
+                self.subscribe(_type, _callback)
+
+        # Number of datagrams discarded without being decoded.
+        self.filtered_count = 0
+
+
+    def subscribe(self, packet_type, callback):
+        ''' Call callback(message) for each received message of type packet_type, or for all messages if packet_type is None. '''
+        callback = dispatch_callback(callback, self.dispatch)
+
+        with self.subscription_lock:
+            if packet_type is None:
+                self.all_callbacks = self.all_callbacks + (callback,)
+            else:
+                _type_callbacks = dict(self.type_callbacks)
+                _type_callbacks[packet_type] = _type_callbacks.get(packet_type, ()) + (callback,)
+                self.type_callbacks = _type_callbacks
+
+        self.update_topics()
+
+
+    def update_topics(self):
+        ''' Join the multicast groups for the subscribed message types (if not already joined), and leave any others. '''
+        if self.topics is None:
+            return
+
+        with self.subscription_lock:
+            if self.endpoint is not None:
+                _sock = self.endpoint.socket
+            elif self.s is not None:
+                _sock = self.s
+            else:
+                # Not listening yet, groups are joined on startup.
+                return
+
+            _types = None if len(self.all_callbacks) > 0 else self.type_callbacks.keys()
+            _wanted = self.topics.groups_for(_types)
+            self.joined_groups |= self.topics.join(_sock, _wanted - self.joined_groups)
+            self.joined_groups -= self.topics.leave(_sock, self.joined_groups - _wanted)
+
+
+    def unsubscribe(self, packet_type, callback):
+        ''' Remove a callback added with subscribe(). '''
+        # Subscribed callbacks may be wrapped for dispatch, so also match on the wrapped callback.
+        _match = lambda _c: (_c == callback) or (getattr(_c, 'callback', None) == callback)
+
+        with self.subscription_lock:
+            if packet_type is None:
+                _removed = [_c for _c in self.all_callbacks if _match(_c)]
+                self.all_callbacks = tuple(_c for _c in self.all_callbacks if not _match(_c))
+            else:
+                _type_callbacks = dict(self.type_callbacks)
+                _removed = [_c for _c in _type_callbacks.get(packet_type, ()) if _match(_c)]
+                _remaining = tuple(_c for _c in _type_callbacks.get(packet_type, ()) if not _match(_c))
+                if len(_remaining) > 0:
+                    _type_callbacks[packet_type] = _remaining
+                else:
+                    _type_callbacks.pop(packet_type, None)
+                self.type_callbacks = _type_callbacks
+
+        for _c in _removed:
+            if isinstance(_c, DispatchedCallback):
+                _c.close(wait=False)
+
+        self.update_topics()
+
+
+    def subscribers(self):
+        ''' Return a list of all subscribed callbacks. '''
+        _callbacks = list(self.all_callbacks)
+        for _type_callbacks in self.type_callbacks.values():
+            _callbacks.extend(_type_callbacks)
+        return _callbacks
+
+
+    def dispatch_stats(self):
+        ''' Return the queue depth and drop counters of each subscribed callback (if callbacks are being dispatched to worker threads). '''
+        return [_c.stats() for _c in self.subscribers() if isinstance(_c, DispatchedCallback)]
+
+
+    def wanted(self, packet):
+        ''' Check if anyone is subscribed to a received datagram, without decoding it. '''
+        if len(self.all_callbacks) > 0:
+            return True
+
+        _types = udp_packet_type_candidates(packet)
+        if _types is None:
+            # Couldn't tell what this is, so it will have to be decoded.
+            return True
+
+        _type_callbacks = self.type_callbacks
+        for _type in _types:
+            if _type in _type_callbacks:
+                return True
+
+        return False
+
 
     def handle_udp_packet(self, packet):
         ''' Process a received UDP packet '''
-        try:
-            packet_dict = json.loads(packet)
+        if not self.wanted(packet):
+            self.filtered_count += 1
+            return
 
-            if self.callback is not None:
-                self.callback(packet_dict)
+        try:
+            packet_dict = decode_udp_packet(packet)
 
-            if packet_dict['type'] == 'PAYLOAD_SUMMARY':
-                if self.summary_callback is not None:
-                    self.summary_callback(packet_dict)
+            for _callback in self.all_callbacks:
+                _callback(packet_dict)
 
-            if packet_dict['type'] == 'GPS':
-                if self.gps_callback is not None:
-                    self.gps_callback(packet_dict)
+            for _callback in self.type_callbacks.get(packet_dict['type'], ()):
+                _callback(packet_dict)
 
         except Exception as e:
             print("Could not parse packet: %s" % str(e))
             traceback.print_exc()
 
 
+    def handle_udp_packets(self, packets):
+        ''' Process a batch of received UDP packets '''
+        for _packet in packets:
+            self.handle_udp_packet(_packet)
+
+
     def udp_rx_thread(self):
         ''' Listen for Broadcast UDP packets '''
 
         self.s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        self.s.settimeout(1)
+        self.s.setblocking(0)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         except:
             pass
+        if self.rcvbuf is not None:
+            set_receive_buffer(self.s, self.rcvbuf)
         self.s.bind(('',self.udp_port))
+        self.update_topics()
         print("Started UDP Listener Thread.")
         self.udp_listener_running = True
 
         while self.udp_listener_running:
+            # Wait for the socket to become readable, then read everything waiting on it in one go.
             try:
-                m = self.s.recvfrom(MAX_JSON_LEN)
-            except socket.timeout:
-                m = None
-            except:
-                traceback.print_exc()
-            
-            if m != None:
-                self.handle_udp_packet(m[0])
+                (_readable, _w, _x) = select.select([self.s], [], [], 1)
+            except select.error:
+                continue
+
+            if len(_readable) > 0:
+                self.handle_udp_packets(drain_socket(self.s, MAX_JSON_LEN))
         
         print("Closing UDP Listener")
         self.s.close()
 
 
-    def start(self):
-        if self.listener_thread is None:
+    def socket_stats(self):
+        ''' Kernel receive queue and drop counters for the listening socket (see horuslib.sockets.udp_socket_stats). '''
+        if self.endpoint is not None:
+            return self.endpoint.stats()
+        elif self.s is not None:
+            return udp_socket_stats(self.s)
+        else:
+            return {}
+
+
+    def start(self, event_loop=None):
+        ''' Start listening, either in a new thread, or (if supplied) using a horuslib.transport.EventLoop. '''
+        self.reopen_callbacks()
+
+        if event_loop is not None:
+            if self.endpoint is None:
+                self.endpoint = DatagramEndpoint(event_loop, self.udp_port, self.handle_udp_packets, batch=True, rcvbuf=self.rcvbuf)
+                self.update_topics()
+        elif self.listener_thread is None:
             self.listener_thread = Thread(target=self.udp_rx_thread)
             self.listener_thread.start()
 
 
     def close(self):
-        self.udp_listener_running = False
-        self.listener_thread.join()
+        if self.endpoint is not None:
+            self.endpoint.loop.call_soon_threadsafe(self.endpoint.close)
+            self.endpoint = None
+        elif self.listener_thread is not None:
+            self.udp_listener_running = False
+            self.listener_thread.join()
+            self.listener_thread = None
+
+        # Memberships go with the socket, so are joined again if the listener is restarted.
+        with self.subscription_lock:
+            self.s = None
+            self.joined_groups = set()
+
+        for _callback in self.subscribers():
+            if isinstance(_callback, DispatchedCallback):
+                _callback.close(wait=False)
+
+
+    def reopen_callbacks(self):
+        ''' Replace any subscribed callbacks whose workers have been closed (i.e. by close()) with new ones. '''
+        _reopen = lambda _c: _c.reopen() if (isinstance(_c, DispatchedCallback) and _c.closed) else _c
+
+        with self.subscription_lock:
+            self.all_callbacks = tuple(_reopen(_c) for _c in self.all_callbacks)
+            self.type_callbacks = dict((_type, tuple(_reopen(_c) for _c in _callbacks)) for (_type, _callbacks) in self.type_callbacks.items())
+
+
+class TXHandle(object):
+    """
+    Tracks a packet submitted for transmission using TXTracker.submit().
+
+    state is one of:
+        'PENDING' - Sent to the LoRa-UDP server, no response yet.
+        'QUEUED' - The server has queued the packet for transmission.
+        'DONE' - The packet has been transmitted.
+        'ERROR' - The server could not transmit the packet (see error).
+        'TIMEOUT' - No transmit confirmation was received in time.
+        'CANCELLED' - The TXTracker was closed before the packet was transmitted.
+    """
+
+    FINAL_STATES = ('DONE', 'ERROR', 'TIMEOUT', 'CANCELLED')
+
+    def __init__(self, tx_id, payload, timeout):
+        self.tx_id = tx_id
+        self.payload = payload
+        self.deadline = time.time() + timeout
+
+        self.state = 'PENDING'
+        self.error = None
+        self.txqueuesize = None
+        self.queued_timestamp = None
+        self.tx_timestamp = None
+
+        self._event = Event()
+        self._lock = Lock()
+        self._callbacks = []
+
+
+    def done(self):
+        ''' Returns True once the packet has been transmitted, or has failed. '''
+        return self._event.is_set()
+
+
+    def wait(self, timeout=None):
+        """
+        Wait for the packet to be transmitted, up to timeout seconds (or until the handle's deadline).
+        Returns True if the packet has been transmitted.
+        """
+        _remaining = self.deadline - time.time()
+        if timeout is not None:
+            _remaining = min(_remaining, timeout)
+
+        self._event.wait(max(_remaining, 0))
+
+        if (not self._event.is_set()) and (time.time() >= self.deadline):
+            self.resolve('TIMEOUT')
+
+        return self.state == 'DONE'
+
+
+    def add_done_callback(self, callback):
+        ''' Call callback(handle) when the handle is resolved, or immediately if it already has been. '''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+
+    def queued(self, packet):
+        ''' Update the handle with the contents of a TXQUEUED message. '''
+        with self._lock:
+            if self.state == 'PENDING':
+                self.state = 'QUEUED'
+                self.queued_timestamp = packet.get('timestamp', None)
+                self.txqueuesize = packet.get('txqueuesize', None)
+
+
+    def resolve(self, state, packet={}):
+        ''' Move the handle into one of its final states, and run any callbacks. Returns False if already resolved. '''
+        with self._lock:
+            if self._event.is_set():
+                return False
+
+            self.state = state
+            if state == 'DONE':
+                self.tx_timestamp = packet.get('timestamp', None)
+                self.txqueuesize = packet.get('txqueuesize', None)
+            elif state == 'ERROR':
+                self.error = packet.get('str', None)
+
+            self._event.set()
+            _callbacks = self._callbacks
+            self._callbacks = []
+
+        for _callback in _callbacks:
+            try:
+                _callback(self)
+            except:
+                traceback.print_exc()
+
+        return True
+
+
+class TXTracker(object):
+    """
+    Submit packets to the LoRa-UDP server for transmission without waiting for each transmission
+    to complete, and track their progress.
+
+    A single UDPListener watches the bus for TXQUEUED, TXDONE and ERROR messages, and matches them
+    (using the transmit ID carried through from the TXPKT message) to the TXHandle returned by submit().
+    Any number of transmissions can be in flight at once.
+
+    Usage:
+        tracker = TXTracker()
+        handles = [tracker.submit(_packet, destination=1) for _packet in packets]
+        for _handle in handles:
+            _handle.wait()
+        tracker.close()
+    """
+
+    def __init__(self, port=HORUS_UDP_PORT, timeout=20, expire_interval=0.5):
+        """
+        Keyword Arguments:
+        port: UDP port used by the LoRa-UDP server.
+        timeout: Default time (seconds) to wait for a packet to be transmitted, before marking it as timed out.
+        expire_interval: How often (seconds) to check for timed out transmissions, so handles are resolved
+                (and their callbacks run) even if no messages are being received.
+        """
+        self.udp_port = port
+        self.default_timeout = timeout
+        self.expire_interval = expire_interval
+
+        self.handles = {}
+        self.handles_lock = Lock()
+
+        self.listener = UDPListener(callback=self.handle_packet, port=port)
+        self.listener.start()
+
+        self.expire_stop = Event()
+        self.expire_thread = Thread(target=self.expire_thread_loop)
+        self.expire_thread.daemon = True
+        self.expire_thread.start()
+
+
+    def expire_thread_loop(self):
+        while not self.expire_stop.wait(self.expire_interval):
+            try:
+                self.expire()
+            except:
+                traceback.print_exc()
+
+
+    def submit(self, payload, destination=None, tx_timeout=15, timeout=None):
+        """
+        Request transmission of a packet, returning a TXHandle immediately.
+        destination and tx_timeout are as per horuslib.packets.tx_packet.
+        timeout overrides the default time to wait for the packet to be transmitted. If a destination is
+        given, the default is extended to cover the time the server may hold the packet (tx_timeout).
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+            if destination is not None:
+                timeout += tx_timeout
+
+        _handle = TXHandle(new_tx_id(), payload, timeout)
+
+        # Register the handle before sending, so we can't miss a fast response.
+        with self.handles_lock:
+            self.handles[_handle.tx_id] = _handle
+
+        _handle.add_done_callback(self._remove_handle)
+
+        tx_packet(payload, destination=destination, tx_timeout=tx_timeout, tx_id=_handle.tx_id)
+
+        return _handle
+
+
+    def submit_many(self, payloads, **kwargs):
+        ''' Submit a list of packets for transmission. Returns a list of TXHandles. '''
+        return [self.submit(_payload, **kwargs) for _payload in payloads]
+
+
+    def _remove_handle(self, handle):
+        with self.handles_lock:
+            self.handles.pop(handle.tx_id, None)
+
+
+    def pending(self):
+        ''' Return a list of the handles which are still in flight. '''
+        with self.handles_lock:
+            return self.handles.values()
+
+
+    def expire(self):
+        ''' Mark handles which have passed their deadline as timed out. '''
+        _now = time.time()
+        for _handle in self.pending():
+            if _now >= _handle.deadline:
+                _handle.resolve('TIMEOUT')
+
+
+    def handle_packet(self, packet):
+        ''' Match a received UDP message to an in-flight transmission. '''
+        if 'tx_id' in packet:
+            with self.handles_lock:
+                _handle = self.handles.get(packet['tx_id'], None)
+
+            if _handle is not None:
+                if packet['type'] == 'TXQUEUED':
+                    _handle.queued(packet)
+                elif packet['type'] == 'TXDONE':
+                    _handle.resolve('DONE', packet)
+                elif packet['type'] == 'ERROR':
+                    _handle.resolve('ERROR', packet)
+
+        self.expire()
+
+
+    def close(self):
+        ''' Stop the listener, and cancel any transmissions still in flight. '''
+        self.expire_stop.set()
+        self.expire_thread.join()
+        self.listener.close()
+        for _handle in self.pending():
+            _handle.resolve('CANCELLED')
 
 
 class OziListener(object):
@@ -111,18 +531,35 @@ class OziListener(object):
                 hostname = '',
                 port = 8942,
                 telemetry_callback = None,
-                waypoint_callback = None):
+                waypoint_callback = None,
+                event_loop = None,
+                dispatch = None,
+                rcvbuf = None):
 
         self.input_host = hostname
         self.input_port = port
-        self.telemetry_callback = telemetry_callback
-        self.waypoint_callback = waypoint_callback
+        self.rcvbuf = rcvbuf
+        self.s = None
+        # Callbacks can optionally be run on worker threads (see horuslib.dispatch.dispatch_callback)
+        self.telemetry_callback = dispatch_callback(telemetry_callback, dispatch)
+        self.waypoint_callback = dispatch_callback(waypoint_callback, dispatch)
+        self.endpoint = None
 
-        self.start()
+        self.start(event_loop)
 
 
-    def start(self):
-        ''' Start the UDP Listener Thread. '''
+    def start(self, event_loop=None):
+        ''' Start the UDP Listener Thread, or if supplied, listen using a horuslib.transport.EventLoop. '''
+        # Replace any callback workers stopped by close().
+        if isinstance(self.telemetry_callback, DispatchedCallback) and self.telemetry_callback.closed:
+            self.telemetry_callback = self.telemetry_callback.reopen()
+        if isinstance(self.waypoint_callback, DispatchedCallback) and self.waypoint_callback.closed:
+            self.waypoint_callback = self.waypoint_callback.reopen()
+
+        if event_loop is not None:
+            self.endpoint = DatagramEndpoint(event_loop, self.input_port, self.handle_packet, host=self.input_host, max_size=1024, rcvbuf=self.rcvbuf)
+            return
+
         self.udp_listener_running = True
 
         self.t = Thread(target=self.udp_rx_thread)
@@ -135,25 +572,29 @@ class OziListener(object):
         """
 
         self.s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        self.s.settimeout(1)
+        self.s.setblocking(0)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         except:
             pass
+        if self.rcvbuf is not None:
+            set_receive_buffer(self.s, self.rcvbuf)
         self.s.bind((self.input_host, self.input_port))
         
         while self.udp_listener_running:
+            # Wait for the socket to become readable, then read everything waiting on it in one go.
             try:
-                m = self.s.recvfrom(1024)
-            except socket.timeout:
-                m = None
-            except:
-                traceback.print_exc()
-            
-            if m != None:
+                (_readable, _w, _x) = select.select([self.s], [], [], 1)
+            except select.error:
+                continue
+
+            if len(_readable) == 0:
+                continue
+
+            for _packet in drain_socket(self.s, 1024):
                 try:
-                    self.handle_packet(m[0])
+                    self.handle_packet(_packet)
                 except:
                     traceback.print_exc()
                     print("ERROR: Couldn't handle packet correctly.")
@@ -163,10 +604,29 @@ class OziListener(object):
         self.s.close()
 
 
+    def socket_stats(self):
+        ''' Kernel receive queue and drop counters for the listening socket (see horuslib.sockets.udp_socket_stats). '''
+        if self.endpoint is not None:
+            return self.endpoint.stats()
+        elif self.s is not None:
+            return udp_socket_stats(self.s)
+        else:
+            return {}
+
+
     def close(self):
         """
         Close the UDP listener thread.
         """
+        for _callback in (self.telemetry_callback, self.waypoint_callback):
+            if isinstance(_callback, DispatchedCallback):
+                _callback.close(wait=False)
+
+        if self.endpoint is not None:
+            self.endpoint.loop.call_soon_threadsafe(self.endpoint.close)
+            self.endpoint = None
+            return
+
         self.udp_listener_running = False
         try:
             self.t.join()
@@ -185,9 +645,9 @@ class OziListener(object):
 
         # Timestamp Handling
         # The 'short' timestamp (HH:MM:SS) is always assumed to be in UTC time.
-        # To build up a complete datetime object, we use the system's current UTC time, and replace the HH:MM:SS part.
-        _full_time = datetime.utcnow().strftime("%Y-%m-%dT") + _short_time + "Z"
-        _time_dt = parse(_full_time)
+        # To build up a complete datetime object, we use the system's current UTC time, and replace the HH:MM:SS part
+        # (taking care of times either side of midnight).
+        _time_dt = short_time_to_datetime(_short_time)
 
         _output = {
             'time'  : _time_dt,
@@ -248,6 +708,76 @@ class OziListener(object):
             traceback.print_exc()
 
 
+class ListenerReactor(EventLoop):
+    """
+    Run any number of UDP and TCP listeners on a single thread.
+
+    A ListenerReactor is a horuslib.transport.EventLoop, so it can be passed as the event_loop
+    argument to UDPListener.start(), OziListener, and other listeners which accept one. Stopping the
+    reactor wakes its thread immediately, so close() does not wait for a socket timeout.
+
+    Usage:
+        reactor = ListenerReactor()
+        reactor.register(UDPListener(callback=process_packet))
+        reactor.add_udp(8942, process_ozi_sentence)
+        reactor.add_tcp(8943, process_ozi_sentence)
+        reactor.start()
+        ...
+        reactor.close()
+    """
+
+    def __init__(self):
+        EventLoop.__init__(self)
+        self.thread = None
+        self.listeners = []
+
+
+    def add_udp(self, port, handler, host='', max_size=MAX_JSON_LEN, batch=False, rcvbuf=None):
+        """
+        Pass each datagram received on a UDP port to handler(datagram), or if batch is True, each batch of
+        datagrams to handler(datagrams). Returns the endpoint, which can be closed to stop listening.
+        """
+        return DatagramEndpoint(self, port, handler, host=host, max_size=max_size, batch=batch, rcvbuf=rcvbuf)
+
+
+    def add_tcp(self, port, handler, host='', max_size=MAX_JSON_LEN):
+        ''' Accept TCP connections on a port, and pass each line received to handler(line). Returns the server, which can be closed to stop listening. '''
+        return StreamServer(self, port, handler, host=host, max_size=max_size)
+
+
+    def register(self, listener):
+        ''' Start a listener object (anything with a start(event_loop) method, i.e. UDPListener) on this reactor. '''
+        listener.start(event_loop=self)
+        self.listeners.append(listener)
+        return listener
+
+
+    def unregister(self, listener):
+        ''' Stop a registered listener. '''
+        listener.close()
+        self.listeners.remove(listener)
+
+
+    def start(self):
+        ''' Start the reactor thread. '''
+        if self.thread is None:
+            self.thread = self.run_in_thread()
+
+
+    def close(self):
+        ''' Stop the reactor thread, and close all endpoints. '''
+        self.stop()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        for _listener in self.listeners:
+            _listener.endpoint = None
+        self.listeners = []
+
+        EventLoop.close(self)
+
+
 if __name__ == '__main__':
     # Example script, essentially repeats functionality of PacketSniffer.py
     import time, sys
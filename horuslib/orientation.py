@@ -0,0 +1,215 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Orientation Telemetry Time Series
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Stores Wenet orientation telemetry samples in a fixed-capacity NumPy ring buffer,
+#   and provides vectorised attitude calculations over windows of recent samples.
+#
+#   Usage:
+#       orientation = OrientationBuffer(capacity=4096)
+#       orientation.add_packet(wenet_packet) # Orientation and image telemetry, other packets are ignored.
+#       stats = orientation.rolling_stats(seconds=10)
+#       window = orientation.window(seconds=60) # Zero-copy view, for plotting.
+#
+import numpy as np
+from threading import Lock
+from .packetbuffer import *
+from .wenet import *
+
+
+# Columns stored for each orientation sample.
+ORIENTATION_DTYPE = np.dtype([
+    ('time',            'f8'), # Unix timestamp, from the GPS week/iTOW/leap-seconds fields.
+    ('sys_status',      'u1'),
+    ('sys_error',       'u1'),
+    ('sys_cal',         'u1'),
+    ('gyro_cal',        'u1'),
+    ('accel_cal',       'u1'),
+    ('magnet_cal',      'u1'),
+    ('temp',            'i1'),
+    ('euler_heading',   'f4'),
+    ('euler_roll',      'f4'),
+    ('euler_pitch',     'f4'),
+    ('quaternion_x',    'f4'),
+    ('quaternion_y',    'f4'),
+    ('quaternion_z',    'f4'),
+    ('quaternion_w',    'f4')
+    ])
+
+
+def quaternion_to_euler(x, y, z, w):
+    """ Vectorised quaternion to Euler angle conversion (aerospace Z-Y-X rotation sequence).
+
+    Keyword Arguments:
+    x, y, z, w: Arrays (or scalars) of quaternion components.
+
+    Return value:
+            A tuple of (heading, roll, pitch) arrays, in degrees. Heading is in the range 0-360.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+
+    _roll = np.arctan2(2.0*(w*x + y*z), 1.0 - 2.0*(x*x + y*y))
+    _pitch = np.arcsin(np.clip(2.0*(w*y - z*x), -1.0, 1.0))
+    _heading = np.arctan2(2.0*(w*z + x*y), 1.0 - 2.0*(y*y + z*z))
+
+    return (np.degrees(_heading) % 360.0, np.degrees(_roll), np.degrees(_pitch))
+
+
+def tilt_angle(roll, pitch):
+    ''' Angle (degrees) between the payload's vertical axis and the local vertical, given roll and pitch in degrees. '''
+    return np.degrees(np.arccos(np.clip(np.cos(np.radians(roll))*np.cos(np.radians(pitch)), -1.0, 1.0)))
+
+
+def window_spin_rate(window):
+    """
+    Average rotation rate of the payload about its vertical axis over a window of samples, in
+    degrees/second (positive = clockwise, viewed from above). Returns None if there are not enough samples.
+    """
+    if len(window) < 2:
+        return None
+
+    (_heading, _roll, _pitch) = quaternion_to_euler(window['quaternion_x'], window['quaternion_y'], window['quaternion_z'], window['quaternion_w'])
+    _times = window['time'] - window['time'][0]
+    if _times[-1] <= 0:
+        return None
+
+    # Unwrap the heading so we can fit a straight line through it, even if the payload has spun more than 360 degrees.
+    _unwrapped = np.degrees(np.unwrap(np.radians(_heading)))
+    return np.polyfit(_times, _unwrapped, 1)[0]
+
+
+def window_swing_amplitude(window):
+    """
+    Swing of the payload away from vertical over a window of samples.
+    Returns a tuple of (peak, rms) tilt angles in degrees, or None if there are no samples.
+    """
+    if len(window) == 0:
+        return None
+
+    (_heading, _roll, _pitch) = quaternion_to_euler(window['quaternion_x'], window['quaternion_y'], window['quaternion_z'], window['quaternion_w'])
+    _tilt = tilt_angle(_roll, _pitch)
+    return (np.max(_tilt), np.sqrt(np.mean(_tilt**2)))
+
+
+class OrientationBuffer(object):
+    """
+    Fixed-capacity ring buffer of orientation samples, stored as NumPy columns (see ORIENTATION_DTYPE).
+
+    Every sample is written twice, to position i and i+capacity of a buffer twice the capacity in size,
+    so the most recent N samples are always contiguous. This means window() can return a view into
+    the buffer, rather than a copy. Views are only valid until the sample they contain is overwritten
+    (i.e. until another `capacity` samples have been added), so copy them if they need to be kept.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.buffer = np.zeros(2*capacity, dtype=ORIENTATION_DTYPE)
+        self.count = 0 # Total number of samples added.
+        self.lock = Lock()
+
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+    def add_sample(self, sample):
+        """ Add a sample. sample is a dictionary (i.e. the output of orientation_telemetry_decoder), or a tuple of ORIENTATION_DTYPE fields. """
+        if isinstance(sample, tuple):
+            _row = sample
+        else:
+            _row = (GPS_EPOCH_UNIX + sample['week']*604800 + sample['iTOW'] - sample['leapS'],) \
+                + tuple(sample[_field] for _field in ORIENTATION_DTYPE.names[1:])
+
+        with self.lock:
+            _i = self.count % self.capacity
+            self.buffer[_i] = _row
+            self.buffer[_i + self.capacity] = _row
+            self.count += 1
+
+
+    def add_packet(self, packet):
+        """ Add a Wenet orientation or image telemetry packet. Other packets are ignored. Returns True if a sample was added. """
+        packet = packet_buffer(packet)
+        _type = decode_wenet_packet_type(packet)
+
+        if _type == WENET_PACKET_TYPES.ORIENTATION_TELEMETRY:
+            _data = orientation_telemetry_decoder(packet)
+        elif _type == WENET_PACKET_TYPES.IMAGE_TELEMETRY:
+            _data = image_telemetry_decoder(packet)
+        else:
+            return False
+
+        if _data['error'] != 'None':
+            return False
+
+        self.add_sample(_data)
+        return True
+
+
+    def window(self, samples=None, seconds=None):
+        """
+        Return a view of the most recent samples, oldest first, as a NumPy structured array.
+
+        Keyword Arguments:
+        samples: Maximum number of samples to return. Defaults to all stored samples.
+        seconds: If supplied, only return samples within this many seconds of the most recent sample.
+        """
+        with self.lock:
+            _n = len(self)
+            if samples is not None:
+                _n = min(_n, samples)
+
+            _end = (self.count % self.capacity) + self.capacity
+            _window = self.buffer[_end - _n:_end]
+
+        if seconds is not None and _n > 0:
+            _times = _window['time']
+            _window = _window[np.searchsorted(_times, _times[-1] - seconds):]
+
+        return _window
+
+
+    def column(self, name, samples=None, seconds=None):
+        ''' Return a view of a single column over a window (see window()). '''
+        return self.window(samples=samples, seconds=seconds)[name]
+
+
+    def euler_from_quaternions(self, samples=None, seconds=None):
+        ''' Calculate Euler angles (heading, roll, pitch) from the stored quaternions, over a window. '''
+        _window = self.window(samples=samples, seconds=seconds)
+        return quaternion_to_euler(_window['quaternion_x'], _window['quaternion_y'], _window['quaternion_z'], _window['quaternion_w'])
+
+
+    def spin_rate(self, samples=None, seconds=None):
+        ''' Spin rate over a window, as per window_spin_rate. '''
+        return window_spin_rate(self.window(samples=samples, seconds=seconds))
+
+
+    def swing_amplitude(self, samples=None, seconds=None):
+        ''' Swing amplitude over a window, as per window_swing_amplitude. '''
+        return window_swing_amplitude(self.window(samples=samples, seconds=seconds))
+
+
+    def rolling_stats(self, samples=None, seconds=10):
+        ''' Summary statistics over a window, as a dictionary. '''
+        _window = self.window(samples=samples, seconds=seconds)
+        _stats = {
+            'samples'   : len(_window),
+            'spin_rate' : None,
+            'swing_peak': None,
+            'swing_rms' : None,
+            'temp'      : None
+        }
+
+        if len(_window) > 0:
+            (_stats['swing_peak'], _stats['swing_rms']) = window_swing_amplitude(_window)
+            _stats['spin_rate'] = window_spin_rate(_window)
+            _stats['temp'] = np.mean(_window['temp'])
+
+        return _stats
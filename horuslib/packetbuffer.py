@@ -0,0 +1,85 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Packet Buffer
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+
+
+class PacketBuffer(bytearray):
+    """
+    A received packet, normalised once at ingress (i.e. when raw bytes come off the radio, or when
+    a 'payload' list is pulled out of a UDP-broadcast JSON blob).
+
+    As this is a bytearray, it can be indexed, sliced and passed straight into struct.unpack_from
+    by any of the packet decoders without being copied again. The decoders also accept plain strings
+    and bytearrays, so it's only worth creating a PacketBuffer when the packet would otherwise be a list.
+    The common header fields are read once on creation, and cached as attributes:
+        packet_type - First byte of the packet (Horus or Wenet packet type)
+        payload_flags_byte - Second byte of the packet
+        payload_id - Third byte of the packet
+    Header fields which are not present (due to a short packet) are set to None.
+
+    The buffer should be treated as read-only once created.
+    """
+
+    def __init__(self, packet=b''):
+        bytearray.__init__(self, packet)
+
+        _len = len(self)
+        self.packet_type = self[0] if _len > 0 else None
+        self.payload_flags_byte = self[1] if _len > 1 else None
+        self.payload_id = self[2] if _len > 2 else None
+        self._payload_flags = None
+
+
+    @property
+    def payload_flags(self):
+        ''' Decoded payload flags, as per decode_payload_flags. Decoded on first access. '''
+        if self._payload_flags is None:
+            self._payload_flags = decode_flags_byte(self.payload_flags_byte)
+        return self._payload_flags
+
+
+    def to_list(self):
+        ''' Return the packet as a list of integers, for inclusion in a JSON blob. '''
+        return list(self)
+
+
+def decode_flags_byte(flags_byte):
+    ''' Decode the payload flags byte (the second byte of a Horus packet). '''
+    return {
+        'repeater_id'    : flags_byte >> 4,     # Repeating payload inserts a unique ID in here
+        'is_repeated' : flags_byte >> 0 & 0x01,   # Indicates a packet repeated off a payload.
+    }
+
+
+def packet_buffer(packet):
+    """
+    Return a packet in a form which can be sliced and passed to struct.unpack_from.
+    Strings and bytearrays (including PacketBuffers) are returned as-is, without being copied. Anything else
+    (i.e. a list of integers, as received in a UDP-broadcast JSON blob) is converted into a PacketBuffer.
+    Use packet_byte() to read individual bytes, as indexing a string returns a character.
+    """
+    if isinstance(packet, (str, bytearray)):
+        return packet
+    else:
+        return PacketBuffer(packet)
+
+
+def packet_byte(packet, index):
+    ''' Return byte index of a packet (string, bytearray or PacketBuffer) as an integer, or None if the packet is too short. '''
+    if index >= len(packet):
+        return None
+
+    _byte = packet[index]
+    if isinstance(_byte, str):
+        return ord(_byte)
+    else:
+        return _byte
+
+
+def packet_hex_dump(packet):
+    """ Produce a colon-separated hex representation of a packet, for debug output. """
+    return ":".join("{:02x}".format(c) for c in bytearray(packet))
@@ -5,13 +5,19 @@
 #   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
 #   Released under GNU GPL v3 or later
 #
-import crcmod
 import json
 import time
 import socket
 import struct
+import uuid
 from datetime import datetime
+from threading import Lock
 from . import *
+from .checksum import *
+from .frames import *
+from .packetbuffer import *
+from .wireformat import *
+from .topics import *
 from .wenet import *
 
 MAX_JSON_LEN = 2048
@@ -44,36 +50,34 @@ class HORUS_PAYLOAD_PARAMS:
     NUM_PAYLOADS          = 5
     RESET_SLOTS           = 6
 
+# Precompiled packet structures.
+# Compiling these once at import time avoids re-parsing the format string on every decode.
+PAYLOAD_TELEMETRY_STRUCT    = struct.Struct("<BBBHBBBffHBBBBBBBB")
+SHORT_TELEMETRY_STRUCT      = struct.Struct("<BBBBBffBBB")
+CAR_TELEMETRY_STRUCT        = struct.Struct(">BBB9sffB")
+SLOT_REQUEST_STRUCT         = struct.Struct(">BBB9sB")
+SNR_STRUCT                  = struct.Struct("b")
 
-def decode_payload_type(packet):
-    # This expects the payload as an integer list. Convert it to one if it isn't already
-    packet = list(bytearray(packet))
 
-    # First byte of every packet is the payload type.
-    payload_type = packet[0]
 
-    return payload_type
+# The header decoders below accept any packet representation. PacketBuffers have the header fields cached.
+def decode_payload_type(packet):
+    # First byte of every packet is the payload type.
+    if isinstance(packet, PacketBuffer):
+        return packet.packet_type
+    return packet_byte(packet_buffer(packet), 0)
 
 def decode_payload_id(packet):
-    # This expects the payload as an integer list. Convert it to one if it isn't already
-    packet = list(bytearray(packet))
-
     # 3rd byte is the payload ID.
-    payload_id = packet[2]
-
-    return payload_id
+    if isinstance(packet, PacketBuffer):
+        return packet.payload_id
+    return packet_byte(packet_buffer(packet), 2)
 
 def decode_payload_flags(packet):
-    # This expects the payload as an integer list. Convert it to one if it isn't already
-    packet = list(bytearray(packet))
-
     # Payload flags is always the second byte.
-    payload_flags_byte = packet[1]
-    payload_flags = {
-        'repeater_id'    : payload_flags_byte >> 4,     # Repeating payload inserts a unique ID in here
-        'is_repeated' : payload_flags_byte >> 0 & 0x01,   # Indicates a packet repeated off a payload.
-    }
-    return payload_flags
+    if isinstance(packet, PacketBuffer):
+        return packet.payload_flags
+    return decode_flags_byte(packet_byte(packet_buffer(packet), 1))
 
 
 # TEXT MESSAGE PACKET
@@ -101,7 +105,7 @@ def create_text_message_packet(source="N0CALL", message="CQ CQ CQ", destination=
 
 def read_text_message_packet(packet):
     # Convert packet into a string, if it isn't one already.
-    packet = str(bytearray(packet))
+    packet = str(packet_buffer(packet))
     source = packet[3:10].rstrip(' \t\r\n\0')
     message = packet[11:].rstrip('\n\0')
     return (source,message)
@@ -109,19 +113,20 @@ def read_text_message_packet(packet):
 # SSDV Packets
 # Generally we will just send this straight out to ssdv.habhub.org
 def read_ssdv_packet_info(packet):
-    packet = list(bytearray(packet))
+    packet = packet_buffer(packet)
     # Check packet is actually a SSDV packet.
     if len(packet) != 255:
         return "SSDV: Invalid Length"
 
 
     # We got this far, may as well try and extract the packet info.
+    _header = bytearray(packet[:10])
     callsign = "???"
-    packet_type = "FEC" if (packet[0]==0x66) else "No-FEC"
-    image_id = packet[5]
-    packet_id = (packet[6]<<8) + packet[7]
-    width = packet[8]*16
-    height = packet[9]*16
+    packet_type = "FEC" if (_header[0]==0x66) else "No-FEC"
+    image_id = _header[5]
+    packet_id = (_header[6]<<8) + _header[7]
+    width = _header[8]*16
+    height = _header[9]*16
 
     return "SSDV: %s, Img:%d, Pkt:%d, %dx%d" % (packet_type,image_id,packet_id,width,height)
 
@@ -145,16 +150,15 @@ def read_ssdv_packet_info(packet):
 # };  //  __attribute__ ((packed));
 
 def decode_short_payload_telemetry(packet):
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
 
-    horus_format_struct = "<BBBBBffBBB"
-    try:
-        unpacked = struct.unpack(horus_format_struct, packet)
-    except:
+    if len(packet) != SHORT_TELEMETRY_STRUCT.size:
         print "Wrong string length. Packet contents:"
-        print ":".join("{:02x}".format(ord(c)) for c in packet)
+        print packet_hex_dump(packet)
         return {}
 
+    unpacked = SHORT_TELEMETRY_STRUCT.unpack_from(packet)
+
     telemetry = {}
     telemetry['packet_type'] = unpacked[0]
     telemetry['payload_id'] = unpacked[1]
@@ -199,47 +203,70 @@ def decode_short_payload_telemetry(packet):
 # };  //  __attribute__ ((packed));
 
 
-def decode_horus_payload_telemetry(packet):
-    packet = str(bytearray(packet))
+class HorusPayloadTelemetry(TelemetryFrame):
+    """
+    Decoded Horus binary payload telemetry packet, as returned by decode_horus_payload_telemetry.
+    The unit conversions and the time string are only computed when accessed (the time string is then cached).
+    """
 
-    horus_format_struct = "<BBBHBBBffHBBBBBBBB"
-    try:
-        unpacked = struct.unpack(horus_format_struct, packet)
-    except:
-        print "Wrong string length. Packet contents:"
-        print ":".join("{:02x}".format(ord(c)) for c in packet)
-        return {}
+    fields = ('packet_type', 'payload_flags', 'payload_id', 'counter', 'hour', 'minute', 'second',
+        'latitude', 'longitude', 'altitude', 'speed', 'sats', 'temp', 'batt_voltage_raw', 'pyro_voltage_raw',
+        'rxPktCount', 'uplinkSlots')
+    derived_fields = ('RSSI', 'used_timeslots', 'current_timeslot', 'time', 'seconds_in_day',
+        'batt_voltage', 'pyro_voltage')
+    key_set = frozenset(fields + derived_fields)
+
+    __slots__ = fields + ('rssi_raw', '_time')
+
+    def __init__(self, unpacked):
+        (self.packet_type, self.payload_flags, self.payload_id, self.counter, self.hour, self.minute,
+            self.second, self.latitude, self.longitude, self.altitude, self.speed, self.sats, self.temp,
+            self.batt_voltage_raw, self.pyro_voltage_raw, self.rxPktCount, self.rssi_raw,
+            self.uplinkSlots) = unpacked
+        self._time = None
+
+    @property
+    def RSSI(self):
+        return self.rssi_raw - 164
 
-    telemetry = {}
-    telemetry['packet_type'] = unpacked[0]
-    telemetry['payload_flags'] = unpacked[1]
-    telemetry['payload_id'] = unpacked[2]
-    telemetry['counter'] = unpacked[3]
-    telemetry['hour'] = unpacked[4]
-    telemetry['minute'] = unpacked[5]
-    telemetry['second'] = unpacked[6]
-    telemetry['latitude'] = unpacked[7]
-    telemetry['longitude'] = unpacked[8]
-    telemetry['altitude'] = unpacked[9]
-    telemetry['speed'] = unpacked[10]
-    telemetry['sats'] = unpacked[11]
-    telemetry['temp'] = unpacked[12]
-    telemetry['batt_voltage_raw'] = unpacked[13]
-    telemetry['pyro_voltage_raw'] = unpacked[14]
-    telemetry['rxPktCount'] = unpacked[15]
-    telemetry['RSSI'] = unpacked[16]-164
-    telemetry['uplinkSlots'] = unpacked[17]
     # Uplink timeslot stuff.
-    telemetry['used_timeslots'] = (0xF0&unpacked[17])>>4 # High Nibble
-    telemetry['current_timeslot'] = (0x0F & unpacked[17]) # Low Nibble
+    @property
+    def used_timeslots(self):
+        return (0xF0 & self.uplinkSlots) >> 4 # High Nibble
+
+    @property
+    def current_timeslot(self):
+        return 0x0F & self.uplinkSlots # Low Nibble
 
     # Convert some of the fields into more useful units.
-    telemetry['time'] = "%02d:%02d:%02d" % (telemetry['hour'],telemetry['minute'],telemetry['second'])
-    telemetry['seconds_in_day'] = telemetry['hour']*3600 + telemetry['minute']*60 + telemetry['second']
-    telemetry['batt_voltage'] = 0.5 + 1.5*telemetry['batt_voltage_raw']/255.0
-    telemetry['pyro_voltage'] = 5.0*telemetry['pyro_voltage_raw']/255.0
+    @property
+    def time(self):
+        if self._time is None:
+            self._time = "%02d:%02d:%02d" % (self.hour, self.minute, self.second)
+        return self._time
 
-    return telemetry
+    @property
+    def seconds_in_day(self):
+        return self.hour*3600 + self.minute*60 + self.second
+
+    @property
+    def batt_voltage(self):
+        return 0.5 + 1.5*self.batt_voltage_raw/255.0
+
+    @property
+    def pyro_voltage(self):
+        return 5.0*self.pyro_voltage_raw/255.0
+
+
+def decode_horus_payload_telemetry(packet):
+    packet = packet_buffer(packet)
+
+    if len(packet) != PAYLOAD_TELEMETRY_STRUCT.size:
+        print "Wrong string length. Packet contents:"
+        print packet_hex_dump(packet)
+        return {}
+
+    return HorusPayloadTelemetry(PAYLOAD_TELEMETRY_STRUCT.unpack_from(packet))
 
 # Convert telemetry dictionary to a Habitat-compatible telemetry string.
 # The below is compatible with genpayload doc ID# f18a873592a77ed01ea432c3bcc16d0f
@@ -253,19 +280,10 @@ def telemetry_to_sentence(telemetry, payload_callsign="HORUSLORA", payload_id =
     output = sentence + "*" + checksum + "\n"
     return output
 
-# CRC16 function for the above.
-def crc16_ccitt(data):
-    """
-    Calculate the CRC16 CCITT checksum of *data*.
-    
-    (CRC16 CCITT: start 0xFFFF, poly 0x1021)
-    """
-    crc16 = crcmod.predefined.mkCrcFun('crc-ccitt-false')
-    return hex(crc16(data))[2:].upper().zfill(4)
-
 # Command ACK Packet. Sent by the payload to acknowledge a command (i.e. cutdown or param change) has been executed.
 def decode_command_ack(packet):
-    packet = list(bytearray(packet))
+    # Only 8 bytes long, so just take a bytearray copy to index into.
+    packet = bytearray(packet_buffer(packet))
     if len(packet) != 8:
         print "Invalid length for Command ACK."
         return {}
@@ -273,7 +291,7 @@ def decode_command_ack(packet):
     ack_packet = {}
     ack_packet['payload_id'] = packet[2]
     ack_packet['rssi'] = packet[3] - 164
-    ack_packet['snr'] = struct.unpack('b',str(bytearray([packet[4]])))[0]/4.
+    ack_packet['snr'] = SNR_STRUCT.unpack_from(packet, 4)[0]/4.
     if packet[5] == HORUS_PACKET_TYPES.CUTDOWN_COMMAND:
         ack_packet['command'] = "Cutdown"
         ack_packet['argument'] = "%d Seconds." % packet[6]
@@ -349,7 +367,7 @@ def create_car_telemetry_packet(destination=0,callsign="N0CALL", latitude=-34.5,
     else:
         pass
 
-    telem_packet = struct.pack(">BBB9sffB",
+    telem_packet = CAR_TELEMETRY_STRUCT.pack(
         HORUS_PACKET_TYPES.CAR_TELEMETRY,
         0,
         destination,
@@ -363,9 +381,9 @@ def create_car_telemetry_packet(destination=0,callsign="N0CALL", latitude=-34.5,
 
     return telem_packet
 
-CAR_TELEMETRY_BODY_LENGTH = 21
+CAR_TELEMETRY_BODY_LENGTH = CAR_TELEMETRY_STRUCT.size
 def decode_car_telemetry_packet(packet):
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
 
     if len(packet) < (CAR_TELEMETRY_BODY_LENGTH+1):
         print("Wrong string length")
@@ -375,12 +393,7 @@ def decode_car_telemetry_packet(packet):
         print("Not a Car Telemetry Packet")
         return {}
 
-    try:
-        unpacked = struct.unpack(">BBB9sffB", packet[:CAR_TELEMETRY_BODY_LENGTH])
-    except:
-        print("Wrong string length. Packet contents:")
-        print(":".join("{:02x}".format(ord(c)) for c in packet))
-        return {}
+    unpacked = CAR_TELEMETRY_STRUCT.unpack_from(packet)
 
     car_telem = {}
     car_telem['packet_type']    = unpacked[0]
@@ -390,7 +403,7 @@ def decode_car_telemetry_packet(packet):
     car_telem['latitude']       = unpacked[4]
     car_telem['longitude']      = unpacked[5]
     car_telem['speed']          = unpacked[6]
-    car_telem['message']        = packet[CAR_TELEMETRY_BODY_LENGTH:].rstrip('\t\r\n\0')
+    car_telem['message']        = str(packet[CAR_TELEMETRY_BODY_LENGTH:]).rstrip('\t\r\n\0')
 
     return car_telem
 
@@ -413,7 +426,7 @@ def car_telem_to_string(packet):
 
 
 def create_slot_request_packet(destination=0,callsign="N0CALL"):
-    telem_packet = struct.pack(">BBB9sB",
+    telem_packet = SLOT_REQUEST_STRUCT.pack(
         HORUS_PACKET_TYPES.SLOT_REQUEST,
         0,
         destination,
@@ -423,19 +436,19 @@ def create_slot_request_packet(destination=0,callsign="N0CALL"):
     return telem_packet
 
 def decode_slot_request_packet(packet):
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
 
     if decode_payload_type(packet) != HORUS_PACKET_TYPES.SLOT_REQUEST:
         print("Not a Slot Request Packet")
         return {}
 
-    try:
-        unpacked = struct.unpack(">BBB9sB", packet)
-    except:
+    if len(packet) != SLOT_REQUEST_STRUCT.size:
         print("Wrong string length. Packet contents:")
-        print(":".join("{:02x}".format(ord(c)) for c in packet))
+        print(packet_hex_dump(packet))
         return {}
 
+    unpacked = SLOT_REQUEST_STRUCT.unpack_from(packet)
+
     slot_request = {}
     slot_request['packet_type']    = unpacked[0]
     slot_request['payload_flags']  = unpacked[1]
@@ -457,6 +470,116 @@ def slot_request_to_string(packet):
         else:
             return "Slot Response: %s was given slot ID %d from #%d" % (slot_request['callsign'],slot_request['slot_id'],slot_request['source_id'])
 
+class HorusBroadcaster(object):
+    """
+    Sends messages onto the Horus UDP broadcast bus.
+
+    A single long-lived socket is used for all messages (to any port), rather than setting up
+    (and leaking) a new socket for every message. Sending is thread-safe.
+    Messages can be provided either as dictionaries, which are encoded using encode_udp_packet,
+    or as pre-serialised strings (i.e. for fixed messages which are sent repeatedly).
+    If a broadcast fails (i.e. no network connection), messages are sent to fallback_host instead.
+
+    If a horuslib.topics.TopicMap is supplied, messages are sent to the multicast group for their type,
+    falling back to broadcast if that fails.
+    """
+
+    def __init__(self, fallback_host='127.0.0.1', binary=False, topics=None):
+        self.fallback_host = fallback_host
+        self.binary = binary
+        self.topics = topics
+
+        self.s = None
+        self.lock = Lock()
+
+
+    def set_topics(self, topics):
+        ''' Change the TopicMap used to send messages (None = broadcast everything). '''
+        with self.lock:
+            self.topics = topics
+            # Re-open the socket, so it is set up for the new mode.
+            if self.s is not None:
+                self.s.close()
+                self.s = None
+
+
+    def _send_datagram(self, datagram, port, packet_type=None):
+        ''' Send a single datagram. Must be called with the lock held. '''
+        if self.s is None:
+            self.s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+            self.s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
+            if self.topics is not None:
+                self.topics.configure_sender(self.s)
+
+        if (self.topics is not None) and self.topics.multicast():
+            try:
+                self.s.sendto(datagram, self.topics.destination(packet_type, port))
+                return
+            except socket.error:
+                pass
+
+        try:
+            self.s.sendto(datagram, ('<broadcast>', port))
+        except socket.error:
+            self.s.sendto(datagram, (self.fallback_host, port))
+
+
+    def packet_type(self, packet, datagram):
+        ''' Find the type of a message, if it's needed to select a multicast group. '''
+        if (self.topics is None) or (not self.topics.multicast()):
+            return None
+        elif isinstance(packet, dict):
+            return packet.get('type', None)
+        else:
+            _types = udp_packet_type_candidates(datagram)
+            return _types[0] if _types is not None else None
+
+
+    def serialise(self, packet):
+        ''' Convert a message into a datagram, if it isn't one already. '''
+        if isinstance(packet, dict):
+            return encode_udp_packet(packet, binary=self.binary)
+        else:
+            return packet
+
+
+    def send(self, packet, port=HORUS_UDP_PORT):
+        ''' Send a message (dictionary or pre-serialised string) to the supplied UDP port. '''
+        _datagram = self.serialise(packet)
+        _type = self.packet_type(packet, _datagram)
+        with self.lock:
+            self._send_datagram(_datagram, port, _type)
+
+
+    def send_many(self, packets, port=HORUS_UDP_PORT):
+        ''' Send a list of messages to the supplied UDP port, in order. '''
+        _datagrams = [self.serialise(_packet) for _packet in packets]
+        _types = [self.packet_type(_packet, _datagram) for (_packet, _datagram) in zip(packets, _datagrams)]
+        with self.lock:
+            for (_datagram, _type) in zip(_datagrams, _types):
+                self._send_datagram(_datagram, port, _type)
+
+
+    def close(self):
+        ''' Close the socket. It will be re-opened if another message is sent. '''
+        with self.lock:
+            if self.s is not None:
+                self.s.close()
+                self.s = None
+
+
+# Broadcaster used by all the module-level send functions below.
+horus_broadcaster = HorusBroadcaster()
+
+
+def set_udp_topics(topics):
+    ''' Set the horuslib.topics.TopicMap used by the module-level send functions (None = broadcast). '''
+    horus_broadcaster.set_topics(topics)
+
+# Pre-serialised fixed messages.
+RESET_LOW_PRIORITY_SLOT_MESSAGE = json.dumps({'type': 'LOWPRIORITY', 'reset': 'reset'})
+
+
 # Update the LoRaUDPServer with low priority callsign and destination data,
 # so it triggers an uplink slot request.
 def update_low_priority_settings(callsign="blank", destination=-1):
@@ -468,45 +591,12 @@ def update_low_priority_settings(callsign="blank", destination=-1):
     }
     print(packet)
 
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+    horus_broadcaster.send(packet)
 
 # Resets the uplink slot ID on the ground station, triggering an uplink slot request, if we
 # already had a slot. Otherwise, does nothing.
 def reset_low_priority_slot():
-    packet = {
-        'type' : 'LOWPRIORITY',
-        'reset': 'reset'
-    }
-
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+    horus_broadcaster.send(RESET_LOW_PRIORITY_SLOT_MESSAGE)
 
 # Updates the payload stored in the low priority packet buffer.
 # This is what is uplinked in the low priority packet slot.
@@ -516,24 +606,34 @@ def set_low_priority_payload(payload):
         'payload': list(bytearray(payload))
     }
 
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+    horus_broadcaster.send(packet)
+
+def new_tx_id():
+    """
+    Generate a transmit ID, used to match a TXPKT request to the TXQUEUED and TXDONE
+    messages produced by the LoRa-UDP server when the packet is queued and transmitted.
+    """
+    return uuid.uuid4().hex[:12]
+
 
 # Transmit packet via UDP Broadcast
-def tx_packet(payload, blocking=False, timeout=4, destination=None, tx_timeout=15):
+def tx_packet(payload, blocking=False, timeout=4, destination=None, tx_timeout=15, tx_id=None):
+    """
+    Request the LoRa-UDP server transmit a packet.
+
+    Keyword Arguments:
+    payload: The packet to transmit.
+    blocking: If True, wait (up to timeout seconds) for the server to report the packet has been transmitted.
+    destination: Optional payload ID. If given, the server holds the packet until a telemetry packet from this
+            payload is received (or tx_timeout seconds elapse), then transmits it.
+    tx_id: Optional transmit ID, which is echoed back in the TXQUEUED and TXDONE messages for this packet.
+            One is generated automatically when blocking. Use horuslib.listener.TXTracker to track many
+            transmissions at once without blocking.
+
+    Return value:
+            Non-blocking: The transmit ID (None if none was supplied).
+            Blocking: True if the packet was transmitted before the timeout, otherwise False.
+    """
     packet = {
         'type' : 'TXPKT',
         'payload' : list(bytearray(payload)),
@@ -543,27 +643,37 @@ def tx_packet(payload, blocking=False, timeout=4, destination=None, tx_timeout=1
         packet['destination'] = destination
         packet['timeout'] = tx_timeout
 
+    if blocking and tx_id == None:
+        tx_id = new_tx_id()
+
+    if tx_id != None:
+        packet['tx_id'] = tx_id
+
     # Print some info about the packet.
+    datagram = json.dumps(packet)
     print(packet)
-    print(len(json.dumps(packet)))
-    # Set up our UDP socket
+    print(len(datagram))
+
+    if not blocking:
+        horus_broadcaster.send(datagram)
+        return tx_id
+
+    # If we are waiting for a TX confirmation, we need to be listening on the broadcast port
+    # before the packet is sent.
     s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
     s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
     try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error as e:
-        print(str(e))
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except:
+            pass
+        s.bind(('',HORUS_UDP_PORT))
+        if horus_broadcaster.topics is not None:
+            horus_broadcaster.topics.join(s, horus_broadcaster.topics.groups_for(['TXDONE']))
+
+        horus_broadcaster.send(datagram)
 
-    if blocking:
         start_time = time.time() # Start time for our timeout.
 
         while (time.time()-start_time) < timeout:
@@ -572,15 +682,15 @@ def tx_packet(payload, blocking=False, timeout=4, destination=None, tx_timeout=1
                 (m,a) = s.recvfrom(MAX_JSON_LEN)
             except socket.timeout:
                 m = None
-            
+
             if m != None:
                 try:
-                    packet = json.loads(m)
+                    packet = decode_udp_packet(m)
                     if packet['type'] == 'TXDONE':
-                        if packet['payload'] == list(bytearray(payload)):
+                        # Older LoRa-UDP servers do not echo the transmit ID, in which case match on the payload.
+                        if tx_id_matches(packet, tx_id, payload):
                             print("Packet Transmitted Successfuly!")
-                            s.close()
-                            return
+                            return True
                         else:
                             print("Not our payload!")
                     else:
@@ -590,9 +700,21 @@ def tx_packet(payload, blocking=False, timeout=4, destination=None, tx_timeout=1
             else:
                 print("Got no packet")
         print("TX Timeout!")
+        return False
+    finally:
+        # Always close the socket, even if the bind or send fails.
+        s.close()
+
 
+def tx_id_matches(packet, tx_id, payload):
+    """
+    Check if a TXQUEUED/TXDONE message refers to the packet with the given transmit ID and payload.
+    Messages from LoRa-UDP servers which do not support transmit IDs are matched on the payload alone.
+    """
+    if 'tx_id' in packet:
+        return packet['tx_id'] == tx_id
     else:
-        s.close()
+        return packet['payload'] == list(bytearray(payload))
 
 # Set new operating frequency on the UDP-LoRa bridge.
 def update_frequency(freq=431.650):
@@ -601,64 +723,87 @@ def update_frequency(freq=431.650):
         'frequency': freq
     }
 
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+    horus_broadcaster.send(packet)
+
+
+# Short string representations of each packet type.
+def payload_telemetry_to_string(packet):
+    telemetry = decode_horus_payload_telemetry(packet)
+    return "Balloon #%d Telemetry: %s,%d,%.5f,%.5f,%d,%d,%.2f,%.2f,%d,%d" % (telemetry['payload_id'], telemetry['time'],telemetry['counter'],
+        telemetry['latitude'],telemetry['longitude'],telemetry['altitude'],telemetry['sats'],telemetry['batt_voltage'],telemetry['pyro_voltage'],telemetry['rxPktCount'],telemetry['RSSI'])
+
+def short_telemetry_to_string(packet):
+    telemetry = decode_short_payload_telemetry(packet)
+    return "Short Telemetry: ID:%d %s,%.6f,%.6f,%d,%d" % (telemetry['payload_id'],telemetry['time'],
+        telemetry['latitude'],telemetry['longitude'],telemetry['sats'],telemetry['batt_voltage'])
+
+def text_message_to_string(packet):
+    (source, message) = read_text_message_packet(packet)
+    flags = decode_payload_flags(packet)
+    if flags['is_repeated']:
+        return "Repeated Text Message: <%s> %s" % (source,message)
+    else:
+        return "Text Message: <%s> %s" % (source,message)
+
+def command_ack_to_string(packet):
+    ack = decode_command_ack(packet)
+    return "Command ACK, Payload #%d : [R: %d dBm, S:%.1fdB] %s %s" % (ack['payload_id'],ack['rssi'], ack['snr'], ack['command'], ack['argument'])
+
+
+# Packet codec registry.
+# Maps a packet type byte to a (decoder, formatter) tuple, giving constant-time dispatch
+# in decode_payload and payload_to_string. The decoder returns a dictionary of packet fields
+# (or None if the packet type has no decoder), and the formatter produces a short string
+# representation of the packet.
+HORUS_PACKET_CODECS = {}
+
+def register_packet_codec(packet_type, decoder=None, formatter=None):
+    """ Register (or replace) the decoder and string formatter used for a packet type byte. """
+    HORUS_PACKET_CODECS[packet_type] = (decoder, formatter)
+
+register_packet_codec(HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY, decode_horus_payload_telemetry, payload_telemetry_to_string)
+register_packet_codec(HORUS_PACKET_TYPES.SHORT_TELEMETRY, decode_short_payload_telemetry, short_telemetry_to_string)
+register_packet_codec(HORUS_PACKET_TYPES.TEXT_MESSAGE, None, text_message_to_string)
+register_packet_codec(HORUS_PACKET_TYPES.CUTDOWN_COMMAND, None, lambda packet: "Cutdown Command")
+register_packet_codec(HORUS_PACKET_TYPES.COMMAND_ACK, decode_command_ack, command_ack_to_string)
+register_packet_codec(HORUS_PACKET_TYPES.PARAMETER_CHANGE, None, lambda packet: "Parameter Change")
+register_packet_codec(HORUS_PACKET_TYPES.SSDV_FEC, None, read_ssdv_packet_info)
+register_packet_codec(HORUS_PACKET_TYPES.SSDV_NOFEC, None, read_ssdv_packet_info)
+register_packet_codec(HORUS_PACKET_TYPES.SLOT_REQUEST, decode_slot_request_packet, slot_request_to_string)
+register_packet_codec(HORUS_PACKET_TYPES.CAR_TELEMETRY, decode_car_telemetry_packet, car_telem_to_string)
+
+
+def decode_payload(packet):
+    """ Decode a packet using the decoder registered for its packet type.
+    Returns None if the packet type is unknown, or has no decoder.
+    """
+    packet = packet_buffer(packet)
+    (decoder, formatter) = HORUS_PACKET_CODECS.get(decode_payload_type(packet), (None, None))
+
+    if decoder is None:
+        return None
+    else:
+        return decoder(packet)
 
 
 # Produce short string representation of packet payload contents.
 def payload_to_string(packet):
-    payload_type = decode_payload_type(packet)
-
-    if payload_type == HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY:
-        telemetry = decode_horus_payload_telemetry(packet)
-        data = "Balloon #%d Telemetry: %s,%d,%.5f,%.5f,%d,%d,%.2f,%.2f,%d,%d" % (telemetry['payload_id'], telemetry['time'],telemetry['counter'],
-            telemetry['latitude'],telemetry['longitude'],telemetry['altitude'],telemetry['sats'],telemetry['batt_voltage'],telemetry['pyro_voltage'],telemetry['rxPktCount'],telemetry['RSSI'])
-        return data
-    elif payload_type == HORUS_PACKET_TYPES.SHORT_TELEMETRY:
-        telemetry = decode_short_payload_telemetry(packet)
-        data = "Short Telemetry: ID:%d %s,%.6f,%.6f,%d,%d" % (telemetry['payload_id'],telemetry['time'],
-            telemetry['latitude'],telemetry['longitude'],telemetry['sats'],telemetry['batt_voltage'])
-        return data
-    elif payload_type == HORUS_PACKET_TYPES.TEXT_MESSAGE:
-        (source, message) = read_text_message_packet(packet)
-        flags = decode_payload_flags(packet)
-        if flags['is_repeated']:
-            data = "Repeated Text Message: <%s> %s" % (source,message)
-        else:
-            data = "Text Message: <%s> %s" % (source,message)
-        return data
-    elif payload_type == HORUS_PACKET_TYPES.CUTDOWN_COMMAND:
-        return "Cutdown Command"
-
-    elif payload_type == HORUS_PACKET_TYPES.COMMAND_ACK:
-        ack = decode_command_ack(packet)
-        data = "Command ACK, Payload #%d : [R: %d dBm, S:%.1fdB] %s %s" % (ack['payload_id'],ack['rssi'], ack['snr'], ack['command'], ack['argument'])
-        return data
-    elif payload_type == HORUS_PACKET_TYPES.PARAMETER_CHANGE:
-        return "Parameter Change"
-    elif (payload_type == HORUS_PACKET_TYPES.SSDV_FEC) or (payload_type == HORUS_PACKET_TYPES.SSDV_NOFEC):
-        return read_ssdv_packet_info(packet)
-    elif payload_type == HORUS_PACKET_TYPES.SLOT_REQUEST:
-        return slot_request_to_string(packet)
-    elif payload_type == HORUS_PACKET_TYPES.CAR_TELEMETRY:
-        return car_telem_to_string(packet)
-    else:
+    packet = packet_buffer(packet)
+    (decoder, formatter) = HORUS_PACKET_CODECS.get(decode_payload_type(packet), (None, None))
+
+    if formatter is None:
         return "Unknown Payload"
+    else:
+        return formatter(packet)
 
 def udp_packet_to_string(udp_packet):
+    # Accept raw datagrams (JSON or binary envelope) as well as decoded dictionaries.
+    if not isinstance(udp_packet, dict):
+        try:
+            udp_packet = decode_udp_packet(udp_packet)
+        except Exception as e:
+            return "Unknown UDP Packet"
+
     try:
         pkt_type = udp_packet['type']
     except Exception as e:
@@ -730,6 +875,7 @@ def udp_packet_to_string(udp_packet):
 
 
 # Send an update on the core payload telemetry statistics into the network via UDP broadcast.
+# (Or to the PAYLOAD_SUMMARY multicast group, if enabled using set_udp_topics)
 # This can be used by other devices hanging off the network to display vital stats about the payload.
 def send_payload_summary(callsign, latitude, longitude, altitude, speed=-1, heading=-1, comment=None, short_time=None, snr=-255.0, udp_port=HORUS_UDP_PORT):
     packet = {
@@ -750,21 +896,7 @@ def send_payload_summary(callsign, latitude, longitude, altitude, speed=-1, head
     if comment != None:
         packet['comment'] = comment
 
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',udp_port))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', udp_port))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', udp_port))
+    horus_broadcaster.send(packet, port=udp_port)
 
 
 # A quick add-on which allows OziMux to broadcast everything it is seeing into the local network via broadcast
@@ -783,19 +915,5 @@ def send_ozimux_broadcast_packet(source_name, latitude, longitude, altitude, sho
     if short_time != None:
         packet['time'] = short_time
 
-    # Set up our UDP socket
-    s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    s.settimeout(1)
-    # Set up socket for broadcast, and allow re-use of the address
-    s.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-    except:
-        pass
-    s.bind(('',HORUS_UDP_PORT))
-    try:
-        s.sendto(json.dumps(packet), ('<broadcast>', HORUS_UDP_PORT))
-    except socket.error:
-        s.sendto(json.dumps(packet), ('127.0.0.1', HORUS_UDP_PORT))
+    horus_broadcaster.send(packet)
 
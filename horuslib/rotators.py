@@ -10,6 +10,7 @@ import time
 import logging
 import traceback
 from threading import Thread
+from .sockets import receive_datagrams, set_receive_buffer
 
 class ROTCTLD(object):
     """ rotctld (hamlib) communication class """
@@ -99,11 +100,12 @@ class PSTRotator(object):
     azel_thread_running = False
     last_poll_time = 0
 
-    def __init__(self, hostname='localhost', port=12000, poll_rate=1):
-        """ Start a PSTRotator connection instance """
+    def __init__(self, hostname='localhost', port=12000, poll_rate=1, rcvbuf=None):
+        """ Start a PSTRotator connection instance. rcvbuf optionally sets the receive buffer size of the listening socket. """
         self.hostname = hostname
         self.port = port
         self.poll_rate = poll_rate
+        self.rcvbuf = rcvbuf
         self.azel_thread_running = True
 
         self.t_rx = Thread(target=self.azel_rx_loop)
@@ -160,20 +162,16 @@ class PSTRotator(object):
     def azel_rx_loop(self):
         """ Listen for Azimuth and Elevation reports from PSTRotator"""
         s = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-        s.settimeout(1)
+        s.setblocking(0)
+        if self.rcvbuf is not None:
+            set_receive_buffer(s, self.rcvbuf)
         s.bind(('',(self.port+1)))
         logging.debug("Started PST Rotator Listener Thread.")
         while self.azel_thread_running:
-            try:
-                m = s.recvfrom(512)
-            except socket.timeout:
-                m = None
-            
-            if m != None:
+            for data in receive_datagrams(s, 512):
                 # Attempt to parse Azimuth / Elevation
-                logging.debug("Received: %s" % m[0])
+                logging.debug("Received: %s" % data)
 
-                data = m[0]
                 if data[:2] == 'EL':
                     self.current_elevation = float(data[3:])
                 elif data[:2] == 'AZ':
@@ -0,0 +1,161 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Track Simplification
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Reduces the number of points in a track (i.e. for KML/GeoJSON export) using the Douglas-Peucker
+#   algorithm, so that no removed point is more than a given tolerance (in metres, including altitude)
+#   from the simplified track.
+#
+#   TrackSimplifier does this incrementally for a growing track. Points are simplified in fixed-size chunks
+#   once a chunk is complete, and the result kept, so only the most recent (incomplete) chunk is simplified
+#   on each update. The first and last point of each chunk are always kept.
+#
+#   Usage:
+#       _indices = douglas_peucker(points, 10.0) # points is an array of (lat, lon, alt) rows.
+#       _simplified = points[_indices]
+#
+import numpy as np
+
+# Earth radius used to convert latitude/longitude differences to metres.
+EARTH_RADIUS = 6371000.0
+
+
+def project_points(points, reference=None):
+    """
+    Convert an array of (lat, lon, alt) rows to local x/y/z coordinates in metres (equirectangular projection),
+    around a reference (lat, lon). The reference defaults to the first point.
+    """
+    points = np.asarray(points, dtype=np.float64)
+
+    if reference is None:
+        reference = (points[0, 0], points[0, 1])
+
+    _projected = np.empty((len(points), 3), dtype=np.float64)
+    _projected[:, 0] = np.radians(points[:, 1] - reference[1]) * EARTH_RADIUS * np.cos(np.radians(reference[0]))
+    _projected[:, 1] = np.radians(points[:, 0] - reference[0]) * EARTH_RADIUS
+    _projected[:, 2] = points[:, 2]
+
+    return _projected
+
+
+def segment_distances(points, start, end):
+    ''' Distances from each of an array of (x, y, z) points to the line segment between start and end. '''
+    _segment = end - start
+    _length_squared = np.dot(_segment, _segment)
+    _offsets = points - start
+
+    if _length_squared == 0.0:
+        return np.sqrt(np.sum(_offsets**2, axis=1))
+
+    _t = np.clip(np.dot(_offsets, _segment)/_length_squared, 0.0, 1.0)
+    _closest = _offsets - _t[:, np.newaxis]*_segment
+    return np.sqrt(np.sum(_closest**2, axis=1))
+
+
+def douglas_peucker_projected(points, tolerance):
+    ''' Douglas-Peucker simplification of an array of projected (x, y, z) points. Returns a sorted array of the indices to keep. '''
+    _count = len(points)
+    if _count <= 2 or tolerance <= 0:
+        return np.arange(_count)
+
+    _keep = np.zeros(_count, dtype=bool)
+    _keep[0] = True
+    _keep[-1] = True
+
+    # Segments still to be checked, as (start, end) index pairs.
+    _stack = [(0, _count - 1)]
+    while _stack:
+        (_start, _end) = _stack.pop()
+        if _end - _start < 2:
+            continue
+
+        _distances = segment_distances(points[_start+1:_end], points[_start], points[_end])
+        _furthest = np.argmax(_distances)
+
+        if _distances[_furthest] > tolerance:
+            _split = _start + 1 + _furthest
+            _keep[_split] = True
+            _stack.append((_start, _split))
+            _stack.append((_split, _end))
+
+    return np.nonzero(_keep)[0]
+
+
+def douglas_peucker(points, tolerance, reference=None):
+    """
+    Simplify a track using the Douglas-Peucker algorithm.
+
+    Keyword Arguments:
+    points: Array (or list) of (lat, lon, alt) rows.
+    tolerance: Maximum distance (metres) of removed points from the simplified track. Points are not removed if this is <= 0.
+    reference: (lat, lon) used for the projection to metres. Defaults to the first point.
+
+    Return value:
+            A sorted array of the indices of the points to keep.
+    """
+    if len(points) <= 2 or tolerance <= 0:
+        return np.arange(len(points))
+
+    return douglas_peucker_projected(project_points(points, reference), tolerance)
+
+
+class TrackSimplifier(object):
+    """
+    Incrementally simplifies a growing track, for a single tolerance.
+    Call update() with the full track (oldest first) each time a simplified copy is needed.
+    """
+
+    def __init__(self, tolerance, chunk_size=256):
+        """
+        Keyword Arguments:
+        tolerance: Maximum distance (metres) of removed points from the simplified track.
+        chunk_size: Number of points simplified (and then kept) at a time.
+        """
+        self.tolerance = tolerance
+        self.chunk_size = chunk_size
+        self.reset()
+
+
+    def reset(self):
+        ''' Discard all simplified points. '''
+        # Indices of points kept from completed chunks, and the index of the first point of the current chunk.
+        self.indices = []
+        self.anchor = 0
+        self.reference = None
+
+
+    def update(self, points):
+        """
+        Simplify a track, re-using the results from previous calls.
+
+        Keyword Arguments:
+        points: Array of (lat, lon, alt) rows. This must be the same track as previous calls, with any new points appended.
+
+        Return value:
+                A sorted array of the indices of the points to keep.
+        """
+        _count = len(points)
+
+        if _count < self.anchor + 1:
+            # The track has been cleared (or replaced). Start again.
+            self.reset()
+
+        if _count == 0:
+            return np.arange(0)
+
+        if self.reference is None:
+            self.reference = (points[0][0], points[0][1])
+
+        # Simplify any newly completed chunks.
+        while _count - self.anchor > self.chunk_size:
+            _end = self.anchor + self.chunk_size
+            _kept = douglas_peucker(points[self.anchor:_end+1], self.tolerance, self.reference) + self.anchor
+            # The last point of this chunk is the first point of the next.
+            self.indices.extend(_kept[:-1].tolist())
+            self.anchor = _end
+
+        _tail = douglas_peucker(points[self.anchor:_count], self.tolerance, self.reference) + self.anchor
+        return np.concatenate((np.array(self.indices, dtype=_tail.dtype), _tail))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - UDP Socket Helpers
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Helpers for the thread-based UDP receive loops, which read every datagram waiting on a
+#   non-blocking socket in one pass, rather than one datagram per wakeup.
+#
+#   Usage:
+#       s.setblocking(0)
+#       set_receive_buffer(s, 1048576)
+#       while running:
+#           for _datagram in receive_datagrams(s, MAX_JSON_LEN):
+#               process_packet(_datagram)
+#
+import errno
+import os
+import select
+import socket
+
+
+# Maximum number of datagrams read from a socket in one pass.
+DRAIN_BATCH_SIZE = 64
+
+
+def drain_socket(sock, max_size, max_count=DRAIN_BATCH_SIZE, with_address=False):
+    '''
+    Read the datagrams waiting on a non-blocking socket (up to max_count of them). Returns a list of datagrams,
+    or of (datagram, address) tuples if with_address is set.
+    '''
+    _datagrams = []
+    while len(_datagrams) < max_count:
+        try:
+            if with_address:
+                _datagrams.append(sock.recvfrom(max_size))
+            else:
+                _datagrams.append(sock.recv(max_size))
+        except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                print("Error reading from socket: %s" % str(e))
+            break
+
+    return _datagrams
+
+
+def receive_datagrams(sock, max_size, timeout=1.0, with_address=False):
+    '''
+    Wait (up to timeout seconds) for a non-blocking socket to become readable, then read everything waiting on it.
+    Returns a list of datagrams (see drain_socket), which is empty if the wait timed out.
+    '''
+    try:
+        (_readable, _w, _x) = select.select([sock], [], [], timeout)
+    except select.error:
+        return []
+
+    if len(_readable) == 0:
+        return []
+
+    return drain_socket(sock, max_size, with_address=with_address)
+
+
+def set_receive_buffer(sock, size):
+    """
+    Set the receive buffer size (SO_RCVBUF) of a socket, so more datagrams can be held by the kernel
+    during bursts. The kernel may limit this (on Linux, to net.core.rmem_max).
+    Returns the buffer size actually in use, or None if it could not be set.
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    except socket.error as e:
+        print("Could not set receive buffer size: %s" % str(e))
+        return None
+
+
+def udp_socket_stats(sock=None, port=None):
+    """
+    Read the kernel's counters for a UDP socket from /proc/net/udp (Linux only).
+
+    Keyword Arguments:
+    sock: Socket to report on. If not supplied, the first socket found bound to port is used.
+    port: Local port, used if sock is not supplied.
+
+    Return value:
+            A dictionary containing 'rx_queue' (bytes waiting to be read) and 'drops' (datagrams dropped
+            by the kernel, i.e. because the receive buffer was full), or an empty dictionary if the socket was not found.
+    """
+    _inode = None
+    if sock is not None:
+        try:
+            # For sockets, the inode reported by fstat matches the inode column in /proc/net/udp.
+            _inode = os.fstat(sock.fileno()).st_ino
+        except (OSError, socket.error):
+            return {}
+
+    for _filename in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(_filename, 'r') as _f:
+                _lines = _f.readlines()[1:]
+        except IOError:
+            continue
+
+        for _line in _lines:
+            _fields = _line.split()
+            try:
+                if _inode is not None:
+                    _match = int(_fields[9]) == _inode
+                else:
+                    _match = int(_fields[1].split(':')[1], 16) == port
+            except (IndexError, ValueError):
+                continue
+
+            if _match:
+                return {
+                    'rx_queue'  : int(_fields[4].split(':')[1], 16),
+                    'drops'     : int(_fields[-1])
+                }
+
+    return {}
@@ -0,0 +1,433 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - SSDV Image Reassembly
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Collects SSDV packets (https://ukhas.org.uk/guides:ssdv) into images, keyed by
+#   (callsign, image_id), and writes out completed images as .bin files, which can be
+#   decoded to JPEGs using the ssdv utility (ssdv -d image.bin image.jpg).
+#
+#   Packets are accepted in either framing:
+#       Wenet - 256 bytes, starting with the 0x55 sync byte, then the packet type (0x66/0x67).
+#       LoRa (Horus) - 255 bytes, with the sync byte stripped, starting with the packet type.
+#   Packets are stored (and written out) in the full 256-byte form.
+#
+#   Usage:
+#       assembler = SSDVAssembler(output_dir="./rx_images/")
+#       image = assembler.add_packet(packet)
+#       if image is not None:
+#           print(image.status())
+#
+import os
+import struct
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from .packetbuffer import *
+from .wenet import ssdv_decode_callsign
+
+SSDV_PACKET_LENGTH = 256
+SSDV_SYNC_BYTE = 0x55
+SSDV_PACKET_TYPES = (0x66, 0x67) # FEC, No-FEC
+
+# SSDV header, following the sync byte.
+SSDV_HEADER_STRUCT = struct.Struct(">B4sBHBBB")
+SSDV_FLAG_EOI = 0x04 # Set on the last packet of an image.
+
+# Maximum number of packets in an image (the packet ID is 16 bits).
+SSDV_MAX_PACKETS = 65536
+# Number of packet slots allocated when an image is first seen. This doubles as required.
+SSDV_INITIAL_SLOTS = 64
+
+
+def ssdv_packet_header(packet):
+    """
+    Normalise a SSDV packet (in Wenet or LoRa framing) into its 256-byte form, and extract the header fields.
+
+    Return value:
+            A dictionary containing the 256-byte packet ('packet'), and the 'callsign', 'image_id', 'packet_id',
+            'width', 'height' and 'eoi' header fields, or None if this is not a SSDV packet.
+    """
+    packet = packet_buffer(packet)
+
+    if len(packet) == SSDV_PACKET_LENGTH - 1 and packet_byte(packet, 0) in SSDV_PACKET_TYPES:
+        # LoRa framing, re-insert the sync byte.
+        packet = bytearray([SSDV_SYNC_BYTE]) + packet
+    elif len(packet) == SSDV_PACKET_LENGTH and packet_byte(packet, 0) == SSDV_SYNC_BYTE and packet_byte(packet, 1) in SSDV_PACKET_TYPES:
+        pass
+    else:
+        return None
+
+    (_type, _callsign, _image_id, _packet_id, _width, _height, _flags) = SSDV_HEADER_STRUCT.unpack_from(packet, 1)
+
+    return {
+        'packet'    : packet,
+        'callsign'  : ssdv_decode_callsign(_callsign),
+        'image_id'  : _image_id,
+        'packet_id' : _packet_id,
+        'width'     : _width*16,
+        'height'    : _height*16,
+        'eoi'       : (_flags & SSDV_FLAG_EOI) != 0
+    }
+
+
+class SSDVImage(object):
+    """
+    A partially (or fully) received SSDV image.
+
+    Packets are stored in a pre-allocated buffer of 256-byte slots, indexed by packet ID, along with a
+    received-bitmap (one byte per slot). The list of missing packet ranges is kept up to date as packets
+    arrive, so completeness and missing ranges can be queried at any time without scanning the image.
+    The total number of packets in the image is only known once the last (EOI) packet has been received.
+    """
+
+    def __init__(self, callsign, image_id, width=0, height=0):
+        self.callsign = callsign
+        self.image_id = image_id
+        self.width = width
+        self.height = height
+
+        self.first_seen = time.time()
+        self.last_update = self.first_seen
+
+        self.capacity = SSDV_INITIAL_SLOTS
+        self.data = bytearray(self.capacity*SSDV_PACKET_LENGTH)
+        self.received = bytearray(self.capacity)
+
+        self.received_count = 0
+        self.duplicate_count = 0
+        self.highest_packet_id = -1
+        self.total_packets = None # Set once the EOI packet has been received.
+        self.written = False
+
+        # Gaps (inclusive packet ID ranges) below highest_packet_id, sorted by start ID.
+        self._gap_starts = []
+        self._gap_ends = []
+        self._gap_total = 0
+
+
+    @property
+    def key(self):
+        return (self.callsign, self.image_id)
+
+
+    @property
+    def memory_size(self):
+        ''' Approximate memory used by this image's buffers, in bytes. '''
+        return len(self.data) + len(self.received)
+
+
+    def _grow(self, packet_id):
+        ''' Expand the slot buffers so they can hold packet_id. '''
+        _capacity = self.capacity
+        while _capacity <= packet_id:
+            _capacity *= 2
+        _capacity = min(_capacity, SSDV_MAX_PACKETS)
+
+        self.data.extend(bytearray((_capacity - self.capacity)*SSDV_PACKET_LENGTH))
+        self.received.extend(bytearray(_capacity - self.capacity))
+        self.capacity = _capacity
+
+
+    def _fill_gap(self, packet_id):
+        ''' Remove packet_id from the list of gaps, splitting the gap it falls in if required. '''
+        _i = bisect_right(self._gap_starts, packet_id) - 1
+        _start = self._gap_starts[_i]
+        _end = self._gap_ends[_i]
+
+        if _start == _end:
+            del self._gap_starts[_i]
+            del self._gap_ends[_i]
+        elif packet_id == _start:
+            self._gap_starts[_i] = _start + 1
+        elif packet_id == _end:
+            self._gap_ends[_i] = _end - 1
+        else:
+            self._gap_ends[_i] = packet_id - 1
+            self._gap_starts.insert(_i+1, packet_id + 1)
+            self._gap_ends.insert(_i+1, _end)
+
+        self._gap_total -= 1
+
+
+    def add_packet(self, packet_id, packet, eoi=False):
+        """
+        Store a 256-byte SSDV packet.
+        Returns True if this is a new packet, or False if it is a duplicate.
+        """
+        self.last_update = time.time()
+
+        if eoi:
+            self.total_packets = packet_id + 1
+
+        if packet_id >= self.capacity:
+            self._grow(packet_id)
+
+        if self.received[packet_id]:
+            self.duplicate_count += 1
+            return False
+
+        _offset = packet_id*SSDV_PACKET_LENGTH
+        self.data[_offset:_offset+SSDV_PACKET_LENGTH] = packet
+        self.received[packet_id] = 1
+        self.received_count += 1
+
+        if packet_id > self.highest_packet_id:
+            if packet_id > self.highest_packet_id + 1:
+                # We've skipped over some packets.
+                self._gap_starts.append(self.highest_packet_id + 1)
+                self._gap_ends.append(packet_id - 1)
+                self._gap_total += packet_id - self.highest_packet_id - 1
+            self.highest_packet_id = packet_id
+        else:
+            self._fill_gap(packet_id)
+
+        return True
+
+
+    def has_packet(self, packet_id):
+        return packet_id < self.capacity and self.received[packet_id] == 1
+
+
+    def get_packet(self, packet_id):
+        ''' Return a stored packet, or None if it has not been received. '''
+        if not self.has_packet(packet_id):
+            return None
+        _offset = packet_id*SSDV_PACKET_LENGTH
+        return self.data[_offset:_offset+SSDV_PACKET_LENGTH]
+
+
+    @property
+    def complete(self):
+        return (self.total_packets is not None) and (self.received_count >= self.total_packets)
+
+
+    @property
+    def missing_count(self):
+        ''' Number of missing packets. If the EOI packet has not been received, only packets before the highest received packet are counted. '''
+        if self.total_packets is None:
+            return self._gap_total
+        else:
+            return self._gap_total + max(0, self.total_packets - self.highest_packet_id - 1)
+
+
+    def missing_ranges(self):
+        """
+        Return a list of (first, last) packet ID ranges (inclusive) which have not been received.
+        If the EOI packet has not been received, packets after the highest received packet are not included.
+        """
+        _ranges = zip(self._gap_starts, self._gap_ends)
+        if (self.total_packets is not None) and (self.highest_packet_id < self.total_packets - 1):
+            _ranges.append((self.highest_packet_id + 1, self.total_packets - 1))
+        return _ranges
+
+
+    def to_bin(self):
+        ''' Return the received packets, in order, as a SSDV .bin stream (missing packets are skipped). '''
+        _last = self.highest_packet_id + 1
+        if self.missing_count == 0 and self.received_count == _last:
+            return str(self.data[:_last*SSDV_PACKET_LENGTH])
+
+        _output = bytearray()
+        for _id in xrange(_last):
+            if self.received[_id]:
+                _output += self.data[_id*SSDV_PACKET_LENGTH:(_id+1)*SSDV_PACKET_LENGTH]
+        return str(_output)
+
+
+    def status(self):
+        ''' Summary of the image reception progress, as a dictionary. '''
+        return {
+            'callsign'  : self.callsign,
+            'image_id'  : self.image_id,
+            'width'     : self.width,
+            'height'    : self.height,
+            'received'  : self.received_count,
+            'total'     : self.total_packets,
+            'missing'   : self.missing_count,
+            'missing_ranges' : self.missing_ranges(),
+            'duplicates': self.duplicate_count,
+            'complete'  : self.complete
+        }
+
+
+class SSDVAssembler(object):
+    """
+    Reassemble SSDV images from a stream of packets, from any number of callsigns.
+
+    Images are kept in least-recently-updated order. When the memory used by the stored images
+    exceeds max_memory, the least-recently-updated images are evicted (after being written out,
+    if an output directory has been supplied and write_partial is set).
+    Completed images are written out to output_dir (if supplied) as soon as they are complete.
+
+    Image IDs are only 8 bits, so wrap around. A packet is treated as the start of a new image with the same ID
+    (and the stored image is evicted) if it doesn't fit the stored image (see is_new_image).
+    """
+
+    def __init__(self,
+                max_memory = 16*1024*1024,
+                output_dir = None,
+                write_partial = True,
+                image_callback = None,
+                eviction_callback = None,
+                image_timeout = 600):
+        """
+        Keyword Arguments:
+        max_memory: Maximum memory (bytes) to use for image buffers.
+        output_dir: Directory to write .bin files to. If None, images are not written out.
+        write_partial: Write out incomplete images when they are evicted.
+        image_callback: Called with the SSDVImage whenever an image is completed.
+        eviction_callback: Called with the SSDVImage whenever an image is evicted (or replaced by a new image with the same ID).
+        image_timeout: An image which hasn't been updated in this many seconds is replaced by a new image
+                       if another packet with its ID arrives.
+        """
+        self.max_memory = max_memory
+        self.output_dir = output_dir
+        self.write_partial = write_partial
+        self.image_callback = image_callback
+        self.eviction_callback = eviction_callback
+        self.image_timeout = image_timeout
+
+        self.images = OrderedDict()
+        self.memory_used = 0
+        self.packet_count = 0
+        self.invalid_count = 0
+        self.lock = Lock()
+
+
+    def add_packet(self, packet):
+        """
+        Add a SSDV packet (Wenet or LoRa framing, as a string, bytearray or list of integers).
+        Returns the SSDVImage the packet was added to, or None if it was not a valid SSDV packet.
+        """
+        _header = ssdv_packet_header(packet)
+        if _header is None:
+            self.invalid_count += 1
+            return None
+
+        _key = (_header['callsign'], _header['image_id'])
+        _completed = False
+
+        with self.lock:
+            self.packet_count += 1
+            _image = self.images.pop(_key, None)
+            _replaced = None
+
+            if (_image is not None) and self.is_new_image(_image, _header):
+                self.memory_used -= _image.memory_size
+                (_replaced, _image) = (_image, None)
+
+            if _image is None:
+                _image = SSDVImage(_header['callsign'], _header['image_id'], _header['width'], _header['height'])
+                self.memory_used += _image.memory_size
+
+            # Re-insert at the most-recently-used end.
+            self.images[_key] = _image
+
+            _size = _image.memory_size
+            _was_complete = _image.complete
+            _image.add_packet(_header['packet_id'], _header['packet'], _header['eoi'])
+            self.memory_used += _image.memory_size - _size
+
+            _completed = _image.complete and not _was_complete
+
+            _evicted = self._evict()
+            if _replaced is not None:
+                _evicted.append(_replaced)
+
+        if _completed:
+            if self.output_dir is not None:
+                self.write_image(_image)
+            if self.image_callback is not None:
+                self.image_callback(_image)
+
+        for _old_image in _evicted:
+            self._handle_eviction(_old_image)
+
+        return _image
+
+
+    def is_new_image(self, image, header):
+        """
+        Check if a packet (as per ssdv_packet_header) is from a new image, re-using the ID of a stored image.
+        This is the case if its dimensions differ, it's beyond the end of the stored image (or its EOI packet
+        is before packets we already have), it differs from the packet we have stored with the same ID, or the
+        stored image hasn't been updated in image_timeout seconds.
+        """
+        if (header['width'], header['height']) != (image.width, image.height):
+            return True
+
+        if (image.total_packets is not None) and (header['packet_id'] >= image.total_packets):
+            return True
+
+        if header['eoi'] and (header['packet_id'] < image.highest_packet_id):
+            return True
+
+        _stored = image.get_packet(header['packet_id'])
+        if (_stored is not None) and (_stored != header['packet']):
+            return True
+
+        return (time.time() - image.last_update) > self.image_timeout
+
+
+    def _evict(self):
+        ''' Remove least-recently-updated images until we are within the memory limit. Must be called with the lock held. '''
+        _evicted = []
+        # Always keep the most recently updated image.
+        while self.memory_used > self.max_memory and len(self.images) > 1:
+            (_key, _image) = self.images.popitem(last=False)
+            self.memory_used -= _image.memory_size
+            _evicted.append(_image)
+        return _evicted
+
+
+    def _handle_eviction(self, image):
+        if (self.output_dir is not None) and self.write_partial and (not image.written):
+            self.write_image(image)
+        if self.eviction_callback is not None:
+            self.eviction_callback(image)
+
+
+    def get_image(self, callsign, image_id):
+        with self.lock:
+            return self.images.get((callsign, image_id), None)
+
+
+    def status(self):
+        ''' Return the status of all stored images, most recently updated last. '''
+        with self.lock:
+            return [_image.status() for _image in self.images.values()]
+
+
+    def image_filename(self, image):
+        ''' Produce a filename for an image, i.e. 20180101-123456_VK5QI_12.bin '''
+        _timestamp = datetime.utcfromtimestamp(image.first_seen).strftime("%Y%m%d-%H%M%S")
+        return "%s_%s_%d.bin" % (_timestamp, image.callsign, image.image_id)
+
+
+    def write_image(self, image, filename=None):
+        ''' Write an image out as a .bin file. Returns the filename. '''
+        if filename is None:
+            filename = os.path.join(self.output_dir if self.output_dir is not None else '.', self.image_filename(image))
+
+        with open(filename, 'wb') as _f:
+            _f.write(image.to_bin())
+
+        image.written = True
+        return filename
+
+
+    def flush(self):
+        ''' Write out all stored images which have not already been written, and clear the assembler. '''
+        with self.lock:
+            _images = self.images.values()
+            self.images = OrderedDict()
+            self.memory_used = 0
+
+        for _image in _images:
+            if (self.output_dir is not None) and (_image.complete or self.write_partial) and (not _image.written):
+                self.write_image(_image)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Timestamp Utilities
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Fast parsing of the timestamps used throughout horuslib:
+#       - 'Short' times (HH:MM:SS or HHMMSS, UTC), as sent by payloads. These are converted to a full
+#         datetime using the nearest matching date, so times either side of UTC midnight are handled correctly.
+#       - ISO-8601 timestamps (i.e. 2018-01-02T03:04:05.678Z), as used in the UDP messages and log files.
+#
+#   All datetimes are naive, in UTC (as per datetime.utcnow()).
+#
+import re
+from datetime import datetime, timedelta
+
+# Short times more than this far from the current time are assumed to be from the previous (or next) day.
+SHORT_TIME_ROLLOVER = 43200
+
+
+def parse_short_time(short_time):
+    """
+    Parse a 'short' time string, of the form HH:MM:SS or HHMMSS.
+    Returns a tuple of (hour, minute, second). Raises a ValueError if the time is invalid.
+    """
+    short_time = short_time.strip()
+
+    if ':' in short_time:
+        _fields = short_time.split(':')
+        if len(_fields) != 3:
+            raise ValueError("Invalid short time: %s" % short_time)
+        _hour = int(_fields[0])
+        _minute = int(_fields[1])
+        _second = int(_fields[2])
+    elif len(short_time) == 6 and short_time.isdigit():
+        _hour = int(short_time[0:2])
+        _minute = int(short_time[2:4])
+        _second = int(short_time[4:6])
+    else:
+        raise ValueError("Invalid short time: %s" % short_time)
+
+    if _hour > 23 or _minute > 59 or _second > 59 or min(_hour, _minute, _second) < 0:
+        raise ValueError("Invalid short time: %s" % short_time)
+
+    return (_hour, _minute, _second)
+
+
+def short_time_to_datetime(short_time, now=None):
+    """
+    Convert a 'short' time (HH:MM:SS or HHMMSS, UTC) into a datetime, using the date which puts it closest to
+    the current time. i.e. a time of 23:59:58 received at 00:00:02 is dated to the previous day.
+
+    Keyword Arguments:
+    short_time: Time string.
+    now: Reference time (naive UTC datetime). Defaults to datetime.utcnow().
+    """
+    (_hour, _minute, _second) = parse_short_time(short_time)
+
+    if now is None:
+        now = datetime.utcnow()
+
+    _dt = now.replace(hour=_hour, minute=_minute, second=_second, microsecond=0)
+
+    _diff = (_dt - now).total_seconds()
+    if _diff > SHORT_TIME_ROLLOVER:
+        _dt -= timedelta(days=1)
+    elif _diff < -SHORT_TIME_ROLLOVER:
+        _dt += timedelta(days=1)
+
+    return _dt
+
+
+_ISO_REGEX = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?\s*(Z|[+-]\d{2}(?::?\d{2})?)?$')
+
+
+def parse_iso_datetime(timestamp):
+    """
+    Parse an ISO-8601 timestamp (YYYY-MM-DD[THH:MM[:SS[.ffffff]]][Z|+HH:MM]) into a naive UTC datetime.
+    Timestamps with a UTC offset are converted to UTC. Those without one are assumed to already be UTC.
+
+    Other formats are passed to dateutil (if installed). Raises a ValueError if the timestamp cannot be parsed.
+    """
+    _match = _ISO_REGEX.match(timestamp.strip())
+
+    if _match is None:
+        return _parse_datetime_fallback(timestamp)
+
+    (_year, _month, _day, _hour, _minute, _second, _fraction, _offset) = _match.groups()
+
+    _microsecond = 0
+    if _fraction is not None:
+        _microsecond = int((_fraction + '00000')[:6])
+
+    _dt = datetime(int(_year), int(_month), int(_day),
+        int(_hour or 0), int(_minute or 0), int(_second or 0), _microsecond)
+
+    if _offset is not None and _offset != 'Z':
+        _sign = -1 if _offset[0] == '-' else 1
+        _offset = _offset[1:].replace(':', '')
+        _offset_minutes = int(_offset[0:2])*60 + int(_offset[2:4] or 0)
+        _dt -= timedelta(minutes=_sign*_offset_minutes)
+
+    return _dt
+
+
+def _parse_datetime_fallback(timestamp):
+    ''' Parse a non-ISO-8601 timestamp using dateutil, converting to a naive UTC datetime. '''
+    try:
+        from dateutil.parser import parse
+    except ImportError:
+        raise ValueError("Invalid ISO-8601 timestamp: %s" % timestamp)
+
+    _dt = parse(timestamp)
+    if _dt.utcoffset() is not None:
+        _dt = (_dt - _dt.utcoffset()).replace(tzinfo=None)
+
+    return _dt
+
@@ -0,0 +1,169 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Per-Topic Multicast Transport
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   By default, all Horus UDP messages are broadcast on a single port, so every process on every
+#   host on the network is woken up for every message. As an alternative, each message type can be
+#   sent to its own multicast group (on the same port). Listeners join only the groups for the message
+#   types they handle, and the kernel discards the rest.
+#
+#   Modes:
+#       'broadcast' - Existing behaviour. Everything is broadcast.
+#       'multicast' - Messages are sent to the multicast group for their type. If this fails (i.e. there is
+#                     no multicast route), they are broadcast instead.
+#       'loopback'  - As for multicast, but only on the loopback interface, for single-host setups.
+#
+#   Listeners in multicast/loopback mode still receive broadcast messages, so they can be used alongside
+#   senders which have not been switched over.
+#
+#   Usage:
+#       topics = TopicMap('multicast')
+#       set_udp_topics(topics) # Module-level send functions in horuslib.packets (i.e. send_payload_summary)
+#       broadcaster = HorusBroadcaster(topics=topics)
+#       listener = UDPListener(summary_callback=handle_summary, topics=topics)
+#
+import socket
+from . import *
+
+# Multicast groups for each message type, within the IPv4 local scope (239.255.0.0/16).
+HORUS_MULTICAST_GROUPS = {
+    'TXPKT'             : '239.255.55.1',
+    'LOWPRIORITY'       : '239.255.55.2',
+    'RF'                : '239.255.55.3',
+    'PING'              : '239.255.55.4',
+    'PONG'              : '239.255.55.5',
+    'RXPKT'             : '239.255.55.6',
+    'TXQUEUED'          : '239.255.55.7',
+    'TXDONE'            : '239.255.55.8',
+    'ERROR'             : '239.255.55.9',
+    'STATUS'            : '239.255.55.10',
+    'PAYLOAD_SUMMARY'   : '239.255.55.11',
+    'OZIMUX'            : '239.255.55.12',
+    'GPS'               : '239.255.55.13',
+    'WENET'             : '239.255.55.14',
+}
+
+# Group used for message types not listed above.
+HORUS_MULTICAST_DEFAULT_GROUP = '239.255.55.0'
+
+# Socket option to only deliver multicast datagrams for groups joined by the socket itself.
+# Without this, Linux delivers datagrams for any group joined by any socket on the host.
+# (Not defined by the socket module in Python 2.7.)
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49)
+
+
+class TopicMap(object):
+    """
+    Maps Horus UDP message types to the address they should be sent to, and the multicast groups
+    a listener should join to receive them.
+    """
+
+    MODES = ('broadcast', 'multicast', 'loopback')
+
+    def __init__(self, mode='multicast', groups=HORUS_MULTICAST_GROUPS, default_group=HORUS_MULTICAST_DEFAULT_GROUP, interface='0.0.0.0', ttl=1):
+        """
+        Keyword Arguments:
+        mode: 'broadcast', 'multicast' or 'loopback' (see above).
+        groups: Dictionary of message type -> multicast group.
+        default_group: Multicast group used for message types not in groups.
+        interface: Local address of the interface used to send and receive multicast. Ignored in loopback mode.
+        ttl: Multicast time-to-live (number of router hops). Ignored in loopback mode.
+        """
+        if mode not in self.MODES:
+            raise ValueError("Unknown transport mode: %s" % str(mode))
+
+        self.mode = mode
+        self.groups = groups
+        self.default_group = default_group
+
+        if mode == 'loopback':
+            self.interface = '127.0.0.1'
+            self.ttl = 0
+        else:
+            self.interface = interface
+            self.ttl = ttl
+
+
+    def multicast(self):
+        ''' Returns True if messages are being sent using multicast. '''
+        return self.mode != 'broadcast'
+
+
+    def group(self, packet_type):
+        ''' Return the multicast group for a message type. '''
+        return self.groups.get(packet_type, self.default_group)
+
+
+    def destination(self, packet_type, port=HORUS_UDP_PORT):
+        ''' Return the (address, port) a message of the supplied type should be sent to. '''
+        if self.multicast():
+            return (self.group(packet_type), port)
+        else:
+            return ('<broadcast>', port)
+
+
+    def groups_for(self, packet_types=None):
+        ''' Return the set of multicast groups carrying the supplied message types (or all message types if None). '''
+        if not self.multicast():
+            return set()
+        elif packet_types is None:
+            return set(self.groups.values()) | set([self.default_group])
+        else:
+            return set(self.group(_type) for _type in packet_types)
+
+
+    def configure_sender(self, sock):
+        ''' Set up a socket for sending multicast messages. '''
+        if not self.multicast():
+            return
+
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+
+
+    def join(self, sock, groups):
+        """
+        Join a (bound) listening socket to a set of multicast groups.
+        Returns the set of groups which were joined. If a group can't be joined, the socket
+        still receives broadcast messages, so an error is printed and listening carries on.
+        """
+        if not self.multicast():
+            return set()
+
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+        except socket.error:
+            pass
+
+        _joined = set()
+        for _group in groups:
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(_group) + socket.inet_aton(self.interface))
+                _joined.add(_group)
+            except socket.error as e:
+                print("Could not join multicast group %s: %s" % (_group, str(e)))
+
+        return _joined
+
+
+    def leave(self, sock, groups):
+        """
+        Drop a listening socket's membership of a set of multicast groups (joined using join()).
+        Returns the set of groups which were left.
+        """
+        if not self.multicast():
+            return set()
+
+        _left = set()
+        for _group in groups:
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, socket.inet_aton(_group) + socket.inet_aton(self.interface))
+                _left.add(_group)
+            except socket.error as e:
+                print("Could not leave multicast group %s: %s" % (_group, str(e)))
+
+        return _left
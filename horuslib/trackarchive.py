@@ -0,0 +1,193 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Persistent Track Archive
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Stores track positions on disk as fixed-size binary records (see TRACK_RECORD_DTYPE), one file per vehicle.
+#   Records are appended to the end of the file as they arrive, and read back through a memory map, so
+#   re-opening an archive doesn't require the file to be parsed, and only the parts of the history
+#   which are actually read are loaded from disk.
+#
+#   File format: A 16 byte header (TRACK_ARCHIVE_HEADER), followed by records. If the last record is incomplete
+#   (i.e. the process was killed part-way through writing it), it is discarded when the archive is opened.
+#
+#   The file is opened in append mode, and locked (using flock, where available) while records are written, so
+#   several processes can safely add to the same archive. Records added by other processes are picked up by
+#   len() and view().
+#
+#   Usage:
+#       archive = TrackArchive(archive_filename('./tracks', 'HORUS1')) # i.e. ./tracks/HORUS1_0267c5c9.track
+#       archive.append(time.time(), -34.9, 138.6, 1000.0, "HORUS1")
+#       positions = archive.positions() # Array of (time, lat, lon, alt) rows.
+#
+#   Usually used through GenericTrack (see its archive and retention arguments).
+#
+import hashlib
+import os
+import re
+import struct
+import numpy as np
+from threading import Lock
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows. Only one process should write to an archive at a time there.
+    fcntl = None
+
+# Record stored for each position. Times are unix timestamps. Comments longer than 32 bytes are truncated.
+TRACK_RECORD_DTYPE = np.dtype([
+    ('time',    '<f8'),
+    ('lat',     '<f8'),
+    ('lon',     '<f8'),
+    ('alt',     '<f8'),
+    ('comment', 'S32')
+    ])
+
+# Header: Magic, format version, record size, (padding)
+TRACK_ARCHIVE_HEADER = struct.Struct('<4sHH8x')
+TRACK_ARCHIVE_MAGIC = 'HTRK'
+TRACK_ARCHIVE_VERSION = 1
+
+
+def archive_filename(directory, vehicle):
+    '''
+    Return the archive filename for a vehicle (i.e. a callsign), within a directory.
+    Unsafe characters in the name are replaced, so a hash of the exact vehicle name is appended, to keep
+    names which would otherwise map to the same file (i.e. 'A/1' and 'A_1', or 'HORUS1' and 'horus1' on
+    case-insensitive filesystems) separate.
+    '''
+    if isinstance(vehicle, unicode):
+        vehicle = vehicle.encode('utf-8')
+    _safe_name = re.sub(r'[^A-Za-z0-9_\-]', '_', vehicle)
+    return os.path.join(directory, '%s_%s.track' % (_safe_name, hashlib.sha1(vehicle).hexdigest()[:8]))
+
+
+class TrackArchive(object):
+    """
+    Append-only archive of track positions, stored in a file.
+    Raises an IOError if the file can't be opened, or a ValueError if it isn't a track archive.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = Lock()
+
+        # Append mode, so every write goes to the current end of the file, even if another process has added to it.
+        self.file = open(filename, 'a+b')
+        self._lock_file()
+        try:
+            if os.fstat(self.file.fileno()).st_size > 0:
+                self.file.seek(0)
+                try:
+                    (_magic, _version, _record_size) = TRACK_ARCHIVE_HEADER.unpack(self.file.read(TRACK_ARCHIVE_HEADER.size))
+                except struct.error:
+                    _magic = None
+
+                if _magic != TRACK_ARCHIVE_MAGIC or _version != TRACK_ARCHIVE_VERSION or _record_size != TRACK_RECORD_DTYPE.itemsize:
+                    raise ValueError("%s is not a valid track archive." % filename)
+            else:
+                self.file.write(TRACK_ARCHIVE_HEADER.pack(TRACK_ARCHIVE_MAGIC, TRACK_ARCHIVE_VERSION, TRACK_RECORD_DTYPE.itemsize))
+                self.file.flush()
+
+            # Discard any partially written record. Writers hold the file lock, so this can't be a record
+            # which another process is still writing.
+            _size = os.fstat(self.file.fileno()).st_size - TRACK_ARCHIVE_HEADER.size
+            if _size % TRACK_RECORD_DTYPE.itemsize != 0:
+                print("Discarding incomplete record at end of %s" % filename)
+                self.file.truncate(TRACK_ARCHIVE_HEADER.size + (_size // TRACK_RECORD_DTYPE.itemsize)*TRACK_RECORD_DTYPE.itemsize)
+
+            self.file.seek(0, os.SEEK_END)
+        except:
+            self.file.close()
+            raise
+        finally:
+            self._unlock_file()
+
+        self.count = 0
+        self._update_count()
+
+        # Memory map of the file, and the number of records it covers. Re-created when more records are needed.
+        self.map = None
+        self.map_count = 0
+
+
+    def _lock_file(self):
+        if fcntl is not None and not self.file.closed:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+
+    def _unlock_file(self):
+        if fcntl is not None and not self.file.closed:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+    def _update_count(self):
+        ''' Update the number of records from the file size, to pick up records added by other processes. Only whole records are counted. '''
+        self.count = max((os.fstat(self.file.fileno()).st_size - TRACK_ARCHIVE_HEADER.size) // TRACK_RECORD_DTYPE.itemsize, 0)
+
+
+    def __len__(self):
+        with self.lock:
+            if not self.file.closed:
+                self._update_count()
+            return self.count
+
+
+    def append(self, time, lat, lon, alt, comment=""):
+        ''' Add a position to the end of the archive. time is a unix timestamp. '''
+        if isinstance(comment, unicode):
+            comment = comment.encode('utf-8')
+
+        _record = np.array([(time, lat, lon, alt, comment)], dtype=TRACK_RECORD_DTYPE)
+
+        with self.lock:
+            self._lock_file()
+            try:
+                self.file.write(_record.tostring())
+                # Flush to the OS, so the record is visible to the memory map (and survives this process exiting).
+                self.file.flush()
+            finally:
+                self._unlock_file()
+            self._update_count()
+
+
+    def view(self, start=0, end=None):
+        """
+        Return a (zero-copy) view of records start:end, as a structured array (see TRACK_RECORD_DTYPE).
+        Records are only read from disk when they are accessed.
+        """
+        with self.lock:
+            if not self.file.closed:
+                self._update_count()
+            if self.map_count < self.count:
+                self.map = np.memmap(self.filename, dtype=TRACK_RECORD_DTYPE, mode='r', offset=TRACK_ARCHIVE_HEADER.size, shape=(self.count,))
+                self.map_count = self.count
+            _map = self.map
+            _count = self.map_count
+
+        if _count == 0:
+            return np.zeros(0, dtype=TRACK_RECORD_DTYPE)
+
+        if end is None or end > _count:
+            end = _count
+        return _map[start:end]
+
+
+    def positions(self, start=0, end=None):
+        ''' Return records start:end as an array of (time, lat, lon, alt) rows (as per TrackStore). '''
+        _records = self.view(start, end)
+        return np.column_stack((_records['time'], _records['lat'], _records['lon'], _records['alt']))
+
+
+    def comments(self, start=0, end=None):
+        ''' Return the comments of records start:end, as a list. '''
+        return self.view(start, end)['comment'].tolist()
+
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.map = None
+            self.map_count = 0
@@ -0,0 +1,161 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Columnar Track Storage
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Stores track positions (time, latitude, longitude, altitude) as rows of a preallocated
+#   float64 NumPy array, which is grown geometrically as positions are added, so appending is
+#   O(1) (amortised), and exports are a slice of the array rather than a conversion of
+#   a list of Python objects. Comments are held separately, in a list.
+#
+#   Times are stored as unix timestamps (seconds). Naive datetimes are assumed to be UTC.
+#
+import calendar
+from datetime import datetime
+import numpy as np
+from threading import Lock
+
+# Column indexes.
+TRACK_TIME = 0
+TRACK_LAT = 1
+TRACK_LON = 2
+TRACK_ALT = 3
+
+_UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def datetime_to_timestamp(dt):
+    ''' Convert a datetime (naive datetimes are assumed to be UTC) to a unix timestamp. Numbers are passed through. '''
+    if not isinstance(dt, datetime):
+        return float(dt)
+    elif dt.tzinfo is None:
+        return (dt - _UNIX_EPOCH).total_seconds()
+    else:
+        return calendar.timegm(dt.utctimetuple()) + dt.microsecond/1e6
+
+
+class TrackStore(object):
+    """
+    Columnar store of track positions.
+
+    Slices returned by view() (and the column accessors) are views into the store's array, not copies.
+    They are not affected by positions added later, and remain valid (if the array is grown or trimmed, the view
+    keeps referencing the old array).
+    """
+
+    def __init__(self, capacity=1024):
+        self.data = np.zeros((capacity, 4), dtype=np.float64)
+        self.comments = []
+        self.count = 0
+        # Number of positions removed from the start of the store by trim().
+        self.trimmed = 0
+        self.lock = Lock()
+
+
+    def __len__(self):
+        return self.count
+
+
+    def append(self, time, lat, lon, alt, comment=""):
+        ''' Add a position. time may be a datetime or a unix timestamp. '''
+        _row = (datetime_to_timestamp(time), lat, lon, alt)
+
+        with self.lock:
+            self._reserve(1)
+            self.data[self.count] = _row
+            self.comments.append(comment)
+            self.count += 1
+
+
+    def extend(self, positions, comments=None):
+        ''' Add an array of (time, lat, lon, alt) rows (times as unix timestamps), and optionally a list of their comments. '''
+        if comments is None:
+            comments = [""]*len(positions)
+
+        with self.lock:
+            self._reserve(len(positions))
+            self.data[self.count:self.count+len(positions)] = positions
+            self.comments.extend(comments)
+            self.count += len(positions)
+
+
+    def _reserve(self, rows):
+        ''' Grow the array (if required) to fit another number of rows. Must be called with the lock held. '''
+        _capacity = self.data.shape[0]
+        if self.count + rows <= _capacity:
+            return
+
+        while self.count + rows > _capacity:
+            _capacity *= 2
+
+        _data = np.zeros((_capacity, 4), dtype=np.float64)
+        _data[:self.count] = self.data[:self.count]
+        self.data = _data
+
+
+    def trim(self, keep):
+        ''' Remove all but the most recent keep positions. '''
+        with self.lock:
+            if self.count <= keep:
+                return
+
+            # Copy into a new array, so existing views are unaffected.
+            _data = np.zeros(self.data.shape, dtype=np.float64)
+            _data[:keep] = self.data[self.count-keep:self.count]
+            self.trimmed += self.count - keep
+            self.data = _data
+            self.comments = self.comments[self.count-keep:]
+            self.count = keep
+
+
+    def snapshot(self):
+        ''' Return a tuple of (trimmed, view of all rows), taken at the same time. '''
+        with self.lock:
+            return (self.trimmed, self.data[:self.count])
+
+
+    def view(self, start=0, end=None):
+        ''' Return a (zero-copy) view of rows start:end, with columns time, lat, lon, alt. '''
+        with self.lock:
+            _count = self.count
+            _data = self.data
+
+        if end is None or end > _count:
+            end = _count
+        return _data[start:end]
+
+
+    def row(self, index):
+        ''' Return a single position as a tuple of (time, lat, lon, alt, comment). '''
+        with self.lock:
+            if index < 0:
+                index += self.count
+            if index < 0 or index >= self.count:
+                raise IndexError("Track position index out of range")
+            _row = self.data[index]
+            _comment = self.comments[index]
+        return (_row[TRACK_TIME], _row[TRACK_LAT], _row[TRACK_LON], _row[TRACK_ALT], _comment)
+
+
+    def times(self):
+        return self.view()[:, TRACK_TIME]
+
+    def latitudes(self):
+        return self.view()[:, TRACK_LAT]
+
+    def longitudes(self):
+        return self.view()[:, TRACK_LON]
+
+    def altitudes(self):
+        return self.view()[:, TRACK_ALT]
+
+
+    def clear(self):
+        ''' Remove all positions. '''
+        with self.lock:
+            self.trimmed += self.count
+            self.count = 0
+            self.comments = []
+            self.data = np.zeros(self.data.shape, dtype=np.float64)
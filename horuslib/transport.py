@@ -0,0 +1,422 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - Event-Loop UDP Transport
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   A single-threaded event loop (built on asyncore) which can host any number of UDP
+#   listeners and senders, so many bridges and consumers can run within one process,
+#   rather than each running a thread around a blocking socket.
+#
+#   Usage:
+#       loop = EventLoop()
+#       UDPListener(callback=process_packet).start(event_loop=loop)
+#       OziListener(port=8942, telemetry_callback=process_telemetry, event_loop=loop)
+#       sender = DatagramSender(loop)
+#       loop.call_later(1.0, sender.send, {'type':'PING', 'data':'hello'})
+#       loop.run_forever()
+#
+#   TCP listeners (StreamServer) are also supported, for sources which send newline-delimited messages.
+#
+#   All handlers and callbacks are run on the loop's thread. Use call_soon_threadsafe() (or
+#   DatagramSender.send(), which is thread-safe) to interact with the loop from other threads.
+#
+#   The socket helpers used by the thread-based listeners (drain_socket(), set_receive_buffer() and
+#   udp_socket_stats()) live in horuslib.sockets, and are re-exported from here.
+#
+import asyncore
+import errno
+import fcntl
+import heapq
+import os
+import socket
+import time
+import traceback
+from collections import deque
+from threading import Lock, Thread
+from .packets import *
+from .sockets import *
+
+
+class _Waker(asyncore.file_dispatcher):
+    """
+    Self-pipe, used to wake the event loop from other threads.
+    Only one byte is written until the loop reads it, and the write end is non-blocking, so wake()
+    never blocks, however often it is called (or if the loop isn't running).
+    """
+
+    def __init__(self, socket_map):
+        (self._read_fd, self._write_fd) = os.pipe()
+        fcntl.fcntl(self._write_fd, fcntl.F_SETFL, fcntl.fcntl(self._write_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, self._read_fd, map=socket_map)
+        os.close(self._read_fd) # file_dispatcher works on a duplicate of the file descriptor.
+        self._pending = False
+
+    def wake(self):
+        if self._pending:
+            return
+
+        self._pending = True
+        try:
+            os.write(self._write_fd, b'x')
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                print("Error waking event loop: %s" % str(e))
+
+    def handle_read(self):
+        # Clear the flag before reading, so a wake() from here on writes a new byte.
+        self._pending = False
+        while True:
+            try:
+                if len(self.recv(1024)) == 0:
+                    break
+            except (OSError, socket.error):
+                # EAGAIN - The pipe is empty.
+                break
+
+    def writable(self):
+        return False
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        os.close(self._write_fd)
+
+
+class EventLoop(object):
+    """
+    Single-threaded event loop, hosting asyncore dispatchers (i.e. DatagramEndpoint and DatagramSender),
+    immediate callbacks (call_soon) and timed callbacks (call_later).
+    """
+
+    def __init__(self):
+        self.socket_map = {}
+        self.running = False
+
+        self._ready = deque()
+        self._timers = []
+        self._timer_count = 0
+        self._lock = Lock()
+        self._waker = _Waker(self.socket_map)
+
+
+    def call_soon(self, callback, *args):
+        ''' Run callback(*args) on the next pass of the loop. '''
+        with self._lock:
+            self._ready.append((callback, args))
+
+
+    def call_soon_threadsafe(self, callback, *args):
+        ''' As per call_soon, but may be called from any thread. '''
+        self.call_soon(callback, *args)
+        self._waker.wake()
+
+
+    def call_later(self, delay, callback, *args):
+        ''' Run callback(*args) after delay seconds. Returns a timer, which can be passed to cancel(). '''
+        with self._lock:
+            self._timer_count += 1
+            _timer = [time.time() + delay, self._timer_count, callback, args]
+            heapq.heappush(self._timers, _timer)
+        self._waker.wake()
+        return _timer
+
+
+    def cancel(self, timer):
+        ''' Cancel a timer returned by call_later. '''
+        timer[2] = None
+
+
+    def _run_callback(self, callback, args):
+        try:
+            callback(*args)
+        except:
+            traceback.print_exc()
+
+
+    def _run_once(self):
+        # Work out how long we can block for.
+        with self._lock:
+            if len(self._ready) > 0:
+                _timeout = 0
+            elif len(self._timers) > 0:
+                _timeout = max(0, self._timers[0][0] - time.time())
+            else:
+                _timeout = None
+
+        asyncore.loop(timeout=_timeout, use_poll=True, map=self.socket_map, count=1)
+
+        # Collect any due timers, and run them along with the callbacks which were ready.
+        _now = time.time()
+        with self._lock:
+            while len(self._timers) > 0 and self._timers[0][0] <= _now:
+                _timer = heapq.heappop(self._timers)
+                if _timer[2] is not None:
+                    self._ready.append((_timer[2], _timer[3]))
+
+            _ready = self._ready
+            self._ready = deque()
+
+        for (_callback, _args) in _ready:
+            self._run_callback(_callback, _args)
+
+
+    def run_forever(self):
+        ''' Run the loop until stop() is called. '''
+        self.running = True
+        while self.running:
+            self._run_once()
+
+
+    def run_in_thread(self):
+        ''' Run the loop in a new thread. Returns the thread. '''
+        _thread = Thread(target=self.run_forever)
+        _thread.start()
+        return _thread
+
+
+    def stop(self):
+        ''' Stop the loop. Safe to call from any thread. The loop exits immediately, rather than on a poll timeout. '''
+        self.running = False
+        self._waker.wake()
+
+
+    def close(self):
+        ''' Close all the dispatchers attached to this loop. '''
+        for _dispatcher in self.socket_map.values():
+            try:
+                _dispatcher.close()
+            except:
+                traceback.print_exc()
+
+
+class DatagramEndpoint(asyncore.dispatcher):
+    """
+    Listen on a UDP port, and pass each received datagram to handler(datagram).
+    If batch is True, the handler is instead passed a list of the datagrams read in each pass.
+
+    All the datagrams waiting on the socket are read as soon as it is readable, and the handler is run
+    via the loop's call_soon, so the socket is drained before any (potentially slow) handlers are run.
+    """
+
+    def __init__(self, loop, port, handler, host='', max_size=MAX_JSON_LEN, batch=False, rcvbuf=None):
+        asyncore.dispatcher.__init__(self, map=loop.socket_map)
+        self.loop = loop
+        self.port = port
+        self.handler = handler
+        self.max_size = max_size
+        self.batch = batch
+
+        self.create_socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except:
+            pass
+        if rcvbuf is not None:
+            set_receive_buffer(self.socket, rcvbuf)
+        self.bind((host, port))
+
+
+    def writable(self):
+        return False
+
+
+    def handle_read(self):
+        _datagrams = drain_socket(self.socket, self.max_size)
+
+        if self.batch:
+            if len(_datagrams) > 0:
+                self.loop.call_soon(self.handler, _datagrams)
+        else:
+            for _datagram in _datagrams:
+                self.loop.call_soon(self.handler, _datagram)
+
+
+    def stats(self):
+        ''' Kernel counters for this endpoint's socket (see udp_socket_stats). '''
+        return udp_socket_stats(self.socket)
+
+
+    def handle_connect(self):
+        pass
+
+
+    def handle_error(self):
+        traceback.print_exc()
+
+
+class DatagramSender(asyncore.dispatcher):
+    """
+    Send messages onto the Horus UDP broadcast bus from an event loop.
+
+    send() queues the message and returns immediately; it is written out by the loop when the
+    socket is writable. As with HorusBroadcaster, messages may be dictionaries or pre-serialised
+    strings, may be sent by multicast (topics), and are sent to fallback_host if a broadcast fails.
+    """
+
+    def __init__(self, loop, fallback_host='127.0.0.1', binary=False, topics=None):
+        asyncore.dispatcher.__init__(self, map=loop.socket_map)
+        self.loop = loop
+        self.fallback_host = fallback_host
+        self.binary = binary
+        self.topics = topics
+
+        self.create_socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if topics is not None:
+            topics.configure_sender(self.socket)
+
+        self._queue = deque()
+
+
+    def send(self, packet, port=HORUS_UDP_PORT):
+        ''' Queue a message (dictionary or pre-serialised string) to be sent to the supplied UDP port. Thread-safe. '''
+        _address = '<broadcast>'
+        if (self.topics is not None) and self.topics.multicast():
+            if isinstance(packet, dict):
+                _type = packet.get('type', None)
+            else:
+                _types = udp_packet_type_candidates(packet)
+                _type = _types[0] if _types is not None else None
+            _address = self.topics.group(_type)
+
+        if isinstance(packet, dict):
+            packet = encode_udp_packet(packet, binary=self.binary)
+
+        self._queue.append((packet, _address, port))
+        self.loop._waker.wake()
+
+
+    def readable(self):
+        return False
+
+
+    def writable(self):
+        return len(self._queue) > 0
+
+
+    def handle_write(self):
+        while len(self._queue) > 0:
+            (_datagram, _address, _port) = self._queue.popleft()
+            try:
+                self.socket.sendto(_datagram, (_address, _port))
+                continue
+            except socket.error:
+                pass
+
+            # Multicast failed, fall back to broadcast.
+            if _address != '<broadcast>':
+                try:
+                    self.socket.sendto(_datagram, ('<broadcast>', _port))
+                    continue
+                except socket.error:
+                    pass
+
+            try:
+                self.socket.sendto(_datagram, (self.fallback_host, _port))
+            except socket.error as e:
+                print("Could not send UDP message: %s" % str(e))
+
+
+    def handle_connect(self):
+        pass
+
+
+    def handle_error(self):
+        traceback.print_exc()
+
+
+class StreamConnection(asyncore.dispatcher):
+    ''' A TCP connection accepted by a StreamServer. Splits the received stream into lines, and passes each to the handler. '''
+
+    def __init__(self, server, sock):
+        asyncore.dispatcher.__init__(self, sock, map=server.loop.socket_map)
+        self.server = server
+        self._buffer = b''
+
+
+    def writable(self):
+        return False
+
+
+    def handle_read(self):
+        try:
+            _data = self.recv(4096)
+        except socket.error:
+            return
+
+        if len(_data) == 0:
+            return
+
+        self._buffer += _data
+        _lines = self._buffer.split(b'\n')
+        self._buffer = _lines.pop()
+
+        # Guard against a client sending an endless line.
+        if len(self._buffer) > self.server.max_size:
+            self._buffer = b''
+
+        for _line in _lines:
+            _line = _line.rstrip(b'\r')
+            if len(_line) > 0:
+                self.server.loop.call_soon(self.server.handler, _line)
+
+
+    def handle_close(self):
+        self.close()
+
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self.server.connections.discard(self)
+
+
+    def handle_error(self):
+        traceback.print_exc()
+        self.close()
+
+
+class StreamServer(asyncore.dispatcher):
+    """
+    Accept TCP connections on a port, and pass each newline-delimited message received
+    (with the line ending removed) to handler(message).
+
+    As with DatagramEndpoint, handlers are run via the loop's call_soon.
+    """
+
+    def __init__(self, loop, port, handler, host='', max_size=MAX_JSON_LEN):
+        asyncore.dispatcher.__init__(self, map=loop.socket_map)
+        self.loop = loop
+        self.port = port
+        self.handler = handler
+        self.max_size = max_size
+        self.connections = set()
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(5)
+
+
+    def writable(self):
+        return False
+
+
+    def handle_accept(self):
+        _pair = self.accept()
+        if _pair is None:
+            return
+
+        self.connections.add(StreamConnection(self, _pair[0]))
+
+
+    def close(self):
+        ''' Stop listening, and close any open connections. '''
+        asyncore.dispatcher.close(self)
+        for _connection in list(self.connections):
+            _connection.close()
+
+
+    def handle_error(self):
+        traceback.print_exc()
@@ -5,6 +5,7 @@
 #   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
 #   Released under GNU GPL v3 or later
 #
+import calendar
 import struct
 import traceback
 from datetime import datetime, timedelta
@@ -13,6 +14,8 @@ import httplib
 import json
 from hashlib import sha256
 from base64 import b64encode
+from .packetbuffer import *
+from .frames import *
 
 WENET_IMAGE_UDP_PORT        = 7890
 WENET_TELEMETRY_UDP_PORT    = 7891
@@ -30,27 +33,34 @@ class WENET_PACKET_LENGTHS:
     ORIENTATION_TELEMETRY = 43
     IMAGE_TELEMETRY = 80
 
+# Pre-compiled packet structures.
+WENET_GPS_TELEMETRY_STRUCT = struct.Struct('>BHIBffffffBBB')
+WENET_ORIENTATION_TELEMETRY_STRUCT = struct.Struct('>BHIBBBBBBBbfffffff')
+WENET_IMAGE_TELEMETRY_STRUCT = struct.Struct('>BH7pBHIBffffffBBBBBBBBBbfffffff')
+WENET_TEXT_MESSAGE_HEADER_STRUCT = struct.Struct('>BH')
+SSDV_CALLSIGN_STRUCT = struct.Struct('>I')
+
+assert WENET_GPS_TELEMETRY_STRUCT.size == WENET_PACKET_LENGTHS.GPS_TELEMETRY
+assert WENET_ORIENTATION_TELEMETRY_STRUCT.size == WENET_PACKET_LENGTHS.ORIENTATION_TELEMETRY
+assert WENET_IMAGE_TELEMETRY_STRUCT.size == WENET_PACKET_LENGTHS.IMAGE_TELEMETRY
+
 def decode_wenet_packet_type(packet):
-    # Convert packet to a list of integers before parsing.
-    packet = list(bytearray(packet))
-    return packet[0]
+    if isinstance(packet, PacketBuffer):
+        return packet.packet_type
+    return packet_byte(packet_buffer(packet), 0)
 
 
 def wenet_packet_to_string(packet):
+    packet = packet_buffer(packet)
     packet_type = decode_wenet_packet_type(packet)
 
-    if packet_type == WENET_PACKET_TYPES.TEXT_MESSAGE:
-        return text_message_string(packet)
-    elif packet_type == WENET_PACKET_TYPES.GPS_TELEMETRY:
-        return gps_telemetry_string(packet)
-    elif packet_type == WENET_PACKET_TYPES.ORIENTATION_TELEMETRY:
-        return orientation_telemetry_string(packet)
-    elif packet_type == WENET_PACKET_TYPES.IMAGE_TELEMETRY:
-        return image_telemetry_string(packet)
-    elif packet_type == WENET_PACKET_TYPES.SSDV:
-        return ssdv_packet_string(packet)
-    else:
+    # Formatters are listed in WENET_PACKET_FORMATTERS, at the end of this file.
+    formatter = WENET_PACKET_FORMATTERS.get(packet_type, None)
+
+    if formatter is None:
         return "Unknown Wenet Packet Type: %d" % packet_type
+    else:
+        return formatter(packet)
 
 
 
@@ -60,8 +70,7 @@ def wenet_packet_to_string(packet):
 
 _ssdv_callsign_alphabet = '-0123456789---ABCDEFGHIJKLMNOPQRSTUVWXYZ'
 def ssdv_decode_callsign(code):
-    code = str(bytearray(code))
-    code = struct.unpack('>I',code)[0]
+    code = SSDV_CALLSIGN_STRUCT.unpack_from(packet_buffer(code))[0]
     callsign = ''
     while code:
         callsign += _ssdv_callsign_alphabet[code % 40]
@@ -71,23 +80,24 @@ def ssdv_decode_callsign(code):
 
 def ssdv_packet_info(packet):
     """ Extract various information out of a SSDV packet, and present as a dict. """
-    packet = list(bytearray(packet))
+    packet = packet_buffer(packet)
     # Check packet is actually a SSDV packet.
     if len(packet) != 256:
         return {'error': "ERROR: Invalid Packet Length"}
 
-    if packet[0] != 0x55: # A first byte of 0x55 indicates a SSDV packet.
+    _header = bytearray(packet[:11])
+    if _header[0] != 0x55: # A first byte of 0x55 indicates a SSDV packet.
         return {'error': "ERROR: Not a SSDV Packet."}
 
     # We got this far, may as well try and extract the packet info.
     try:
         packet_info = {
             'callsign' : ssdv_decode_callsign(packet[2:6]), # TODO: Callsign decoding.
-            'packet_type' : "FEC" if (packet[1]==0x66) else "No-FEC",
-            'image_id' : packet[6],
-            'packet_id' : (packet[7]<<8) + packet[8],
-            'width' : packet[9]*16,
-            'height' : packet[10]*16,
+            'packet_type' : "FEC" if (_header[1]==0x66) else "No-FEC",
+            'image_id' : _header[6],
+            'packet_id' : (_header[7]<<8) + _header[8],
+            'width' : _header[9]*16,
+            'height' : _header[10]*16,
             'error' : "None"
         }
 
@@ -109,13 +119,11 @@ def ssdv_packet_string(packet):
 #
 def decode_text_message(packet):
     """ Extract information from a text message packet """
-    # We need the packet as a string, convert to a string in case we were passed a list of bytes.
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
     message = {}
     try:
-        message['len'] = struct.unpack("B",packet[1])[0]
-        message['id'] = struct.unpack(">H",packet[2:4])[0]
-        message['text'] = packet[4:4+message['len']]
+        (message['len'], message['id']) = WENET_TEXT_MESSAGE_HEADER_STRUCT.unpack_from(packet, 1)
+        message['text'] = str(packet[4:4+message['len']])
         message['error'] = 'None'
     except:
         return {'error': 'Could not decode wenet message packet.'}
@@ -138,16 +146,98 @@ def text_message_string(packet):
 #
 # The above 
 
+GPS_EPOCH = datetime(1980, 1, 6, 0, 0, 0)
+# Unix time of the GPS epoch.
+GPS_EPOCH_UNIX = calendar.timegm(GPS_EPOCH.utctimetuple())
+
 def gps_weeksecondstoutc(gpsweek, gpsseconds, leapseconds):
     """ Convert time in GPS time (GPS Week, seconds-of-week) to a UTC timestamp """
-    epoch = datetime.strptime("1980-01-06 00:00:00","%Y-%m-%d %H:%M:%S")
-    elapsed = timedelta(days=(gpsweek*7),seconds=(gpsseconds))
-    timestamp = epoch + elapsed - timedelta(seconds=leapseconds)
+    timestamp = GPS_EPOCH + timedelta(days=(gpsweek*7),seconds=(gpsseconds - leapseconds))
     return timestamp.isoformat()
 
 
+# Human-readable GPS Fix states.
+GPS_FIX_STRINGS = {
+    0 : 'No Fix',
+    2 : '2D Fix',
+    3 : '3D Fix',
+    5 : 'Time Only'
+}
+
+def gps_fix_string(gps_fix):
+    """ Produce a human-readable indication of GPS Fix state. """
+    try:
+        return GPS_FIX_STRINGS[gps_fix]
+    except KeyError:
+        return 'Unknown (%d)' % gps_fix
+
+
+# Human-readable GPS dynamic models, indexed by model number.
+DYNAMIC_MODEL_STRINGS = ('Portable', 'Not Used', 'Stationary', 'Pedestrian', 'Automotive', 'Sea',
+    'Airborne 1G', 'Airborne 2G', 'Airborne 4G')
+
+def dynamic_model_string(dynamic_model):
+    """ Produce a human-readable indication of the GPS dynamic model. """
+    if 0 <= dynamic_model < len(DYNAMIC_MODEL_STRINGS):
+        return DYNAMIC_MODEL_STRINGS[dynamic_model]
+    else:
+        return 'Unknown'
+
+
+class WenetGPSFrame(TelemetryFrame):
+    """
+    Common derived fields of the Wenet packets which carry a GPS solution.
+    Subclasses must provide week, iTOW, leapS, gpsFix and dynamic_model slots, plus the cache_slots below
+    (initialised to None). The human-readable fields are produced on first access, and then cached.
+    """
+
+    __slots__ = ()
+
+    # Slots holding the cached human-readable fields.
+    cache_slots = ('_timestamp', '_gpsFix_str', '_dynamic_model_str')
+
+    # Frames are only produced on a successful decode.
+    error = 'None'
+
+    @property
+    def timestamp(self):
+        # Produce a human-readable timestamp, in UTC time.
+        if self._timestamp is None:
+            self._timestamp = gps_weeksecondstoutc(self.week, self.iTOW, self.leapS)
+        return self._timestamp
+
+    @property
+    def gpsFix_str(self):
+        if self._gpsFix_str is None:
+            self._gpsFix_str = gps_fix_string(self.gpsFix)
+        return self._gpsFix_str
+
+    @property
+    def dynamic_model_str(self):
+        if self._dynamic_model_str is None:
+            self._dynamic_model_str = dynamic_model_string(self.dynamic_model)
+        return self._dynamic_model_str
+
+
+class WenetGPSTelemetry(WenetGPSFrame):
+    """ Decoded Wenet GPS telemetry packet, as returned by gps_telemetry_decoder. """
+
+    fields = ('week', 'iTOW', 'leapS', 'latitude', 'longitude', 'altitude', 'ground_speed', 'heading',
+        'ascent_rate', 'numSV', 'gpsFix', 'dynamic_model')
+    derived_fields = ('timestamp', 'gpsFix_str', 'dynamic_model_str', 'error')
+    key_set = frozenset(fields + derived_fields)
+
+    __slots__ = fields + WenetGPSFrame.cache_slots
+
+    def __init__(self, data):
+        (self.week, _iTOW, self.leapS, self.latitude, self.longitude, self.altitude, self.ground_speed,
+            self.heading, self.ascent_rate, self.numSV, self.gpsFix, self.dynamic_model) = data[1:]
+        self.iTOW = _iTOW/1000.0 # iTOW provided as milliseconds, convert to seconds.
+        self._timestamp = self._gpsFix_str = self._dynamic_model_str = None
+
+
 def gps_telemetry_decoder(packet):
-    """ Extract GPS telemetry data from a packet, and return it as a dictionary. 
+    """ Extract GPS telemetry data from a packet, and return it as a dictionary-like WenetGPSTelemetry object.
 
     Keyword Arguments:
     packet: A GPS telemetry packet, as per https://docs.google.com/document/d/12230J1X3r2-IcLVLkeaVmIXqFeo3uheurFakElIaPVo/edit?usp=sharing
@@ -155,91 +245,33 @@ def gps_telemetry_decoder(packet):
             to a string prior to decoding.
 
     Return value:
-            A dictionary containing the decoded packet data. 
-            If the decode failed for whatever reason, a dictionary will still be returned, but will 
+            A WenetGPSTelemetry object containing the decoded packet data. 
+            If the decode failed for whatever reason, a dictionary will be returned instead, which will 
             contain the field 'error' with the decode fault description.
             This field (error) will be set to 'None' if decoding was successful.
 
     """
 
-    # We need the packet as a string - convert to a string in case we were passed a list of bytes,
+    # Normalise the packet into a PacketBuffer, in case we were passed a list of bytes,
     # which occurs when we are decoding a packet that has arrived via a UDP-broadcast JSON blob.
-    packet = str(bytearray(packet))
-    gps_data = {}
+    packet = packet_buffer(packet)
 
     # Some basic sanity checking of the packet before we attempt to decode.
     if len(packet) < WENET_PACKET_LENGTHS.GPS_TELEMETRY:
         return {'error': 'GPS Telemetry Packet has invalid length.'}
-    elif len(packet) > WENET_PACKET_LENGTHS.GPS_TELEMETRY:
-        # If the packet is too big (which it will be, as it's padded with 0x55's), clip it. 
-        packet = packet[:WENET_PACKET_LENGTHS.GPS_TELEMETRY]
     else:
+        # If the packet is too big (which it will be, as it's padded with 0x55's), unpack_from
+        # will only read the start of it, so there is no need to clip it.
         pass
 
     # Wrap the next bit in exception handling.
     try:
-        # Unpack the packet into a list.
-        data = struct.unpack('>BHIBffffffBBB', packet)
-
-        gps_data['week']    = data[1]
-        gps_data['iTOW']    = data[2]/1000.0 # iTOW provided as milliseconds, convert to seconds.
-        gps_data['leapS']   = data[3]
-        gps_data['latitude'] = data[4]
-        gps_data['longitude'] = data[5]
-        gps_data['altitude'] = data[6]
-        gps_data['ground_speed'] = data[7]
-        gps_data['heading'] = data[8]
-        gps_data['ascent_rate'] = data[9]
-        gps_data['numSV']   = data[10]
-        gps_data['gpsFix']  = data[11]
-        gps_data['dynamic_model'] = data[12]
-
-        # Perform some post-processing on the data, to make some of the fields easier to read.
-
-        # Produce a human-readable timestamp, in UTC time.
-        gps_data['timestamp'] = gps_weeksecondstoutc(gps_data['week'], gps_data['iTOW'], gps_data['leapS'])
-
-        # Produce a human-readable indication of GPS Fix state.
-        if gps_data['gpsFix'] == 0:
-            gps_data['gpsFix_str'] = 'No Fix'
-        elif gps_data['gpsFix'] == 2:
-            gps_data['gpsFix_str'] = '2D Fix'
-        elif gps_data['gpsFix'] == 3:
-            gps_data['gpsFix_str'] = '3D Fix'
-        elif gps_data['gpsFix'] == 5:
-            gps_data['gpsFix_str'] = 'Time Only'
-        else:
-            gps_data['gpsFix_str'] = 'Unknown (%d)' % gps_data['gpsFix']
-
-        # Produce a human-readable indication of the current dynamic model.
-        if gps_data['dynamic_model'] == 0:
-            gps_data['dynamic_model_str'] = 'Portable'
-        elif gps_data['dynamic_model'] == 1:
-            gps_data['dynamic_model_str'] = 'Not Used'
-        elif gps_data['dynamic_model'] == 2:
-            gps_data['dynamic_model_str'] = 'Stationary'
-        elif gps_data['dynamic_model'] == 3:
-            gps_data['dynamic_model_str'] = 'Pedestrian'
-        elif gps_data['dynamic_model'] == 4:
-            gps_data['dynamic_model_str'] = 'Automotive'
-        elif gps_data['dynamic_model'] == 5:
-            gps_data['dynamic_model_str'] = 'Sea'
-        elif gps_data['dynamic_model'] == 6:
-            gps_data['dynamic_model_str'] = 'Airborne 1G'
-        elif gps_data['dynamic_model'] == 7:
-            gps_data['dynamic_model_str'] = 'Airborne 2G'
-        elif gps_data['dynamic_model'] == 8:
-            gps_data['dynamic_model_str'] = 'Airborne 4G'
-        else:
-            gps_data['dynamic_model_str'] = 'Unknown'
-
-        gps_data['error'] = 'None'
-
-        return gps_data
+        # Unpack the packet, and store the fields. Human-readable fields are produced on access.
+        return WenetGPSTelemetry(WENET_GPS_TELEMETRY_STRUCT.unpack_from(packet))
 
     except:
         traceback.print_exc()
-        print(packet)
+        print(packet_hex_dump(packet))
         return {'error': 'Could not decode GPS telemetry packet.'}
 
 
@@ -287,17 +319,16 @@ def orientation_telemetry_decoder(packet):
 
     """
 
-    # We need the packet as a string - convert to a string in case we were passed a list of bytes,
+    # Normalise the packet into a PacketBuffer, in case we were passed a list of bytes,
     # which occurs when we are decoding a packet that has arrived via a UDP-broadcast JSON blob.
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
 
     # Some basic sanity checking of the packet before we attempt to decode.
     if len(packet) < WENET_PACKET_LENGTHS.ORIENTATION_TELEMETRY:
         return {'error': 'Orientation Telemetry Packet has invalid length.'}
-    elif len(packet) > WENET_PACKET_LENGTHS.ORIENTATION_TELEMETRY:
-        # If the packet is too big (which it will be, as it's padded with 0x55's), clip it. 
-        packet = packet[:WENET_PACKET_LENGTHS.ORIENTATION_TELEMETRY]
     else:
+        # If the packet is too big (which it will be, as it's padded with 0x55's), unpack_from
+        # will only read the start of it, so there is no need to clip it.
         pass
 
     orientation_data = {}
@@ -305,7 +336,7 @@ def orientation_telemetry_decoder(packet):
     # Wrap the next bit in exception handling.
     try:
         # Unpack the packet into a list.
-        data = struct.unpack('>BHIBBBBBBBbfffffff', packet)
+        data = WENET_ORIENTATION_TELEMETRY_STRUCT.unpack_from(packet)
 
         orientation_data['week']    = data[1]
         orientation_data['iTOW']    = data[2]/1000.0 # iTOW provided as milliseconds, convert to seconds.
@@ -337,7 +368,7 @@ def orientation_telemetry_decoder(packet):
 
     except:
         traceback.print_exc()
-        print(packet)
+        print(packet_hex_dump(packet))
         return {'error': 'Could not decode Orientation telemetry packet.'}
 
 
@@ -374,8 +405,32 @@ def orientation_telemetry_string(packet):
 #
 # Image (Combined GPS/Orientation + Image ID) Telemetry Decoder
 #
+class WenetImageTelemetry(WenetGPSFrame):
+    """ Decoded Wenet image telemetry packet, as returned by image_telemetry_decoder. """
+
+    fields = ('sequence_number', 'callsign', 'image_id', 'week', 'iTOW', 'leapS', 'latitude', 'longitude',
+        'altitude', 'ground_speed', 'heading', 'ascent_rate', 'numSV', 'gpsFix', 'dynamic_model',
+        'sys_status', 'sys_error', 'sys_cal', 'gyro_cal', 'accel_cal', 'magnet_cal', 'temp',
+        'euler_heading', 'euler_roll', 'euler_pitch',
+        'quaternion_x', 'quaternion_y', 'quaternion_z', 'quaternion_w')
+    derived_fields = ('timestamp', 'gpsFix_str', 'dynamic_model_str', 'error')
+    key_set = frozenset(fields + derived_fields)
+
+    __slots__ = fields + WenetGPSFrame.cache_slots
+
+    def __init__(self, data):
+        (self.sequence_number, self.callsign, self.image_id, self.week, _iTOW, self.leapS,
+            self.latitude, self.longitude, self.altitude, self.ground_speed, self.heading, self.ascent_rate,
+            self.numSV, self.gpsFix, self.dynamic_model,
+            self.sys_status, self.sys_error, self.sys_cal, self.gyro_cal, self.accel_cal, self.magnet_cal, self.temp,
+            self.euler_heading, self.euler_roll, self.euler_pitch,
+            self.quaternion_x, self.quaternion_y, self.quaternion_z, self.quaternion_w) = data[1:]
+        self.iTOW = _iTOW/1000.0 # iTOW provided as milliseconds, convert to seconds.
+        self._timestamp = self._gpsFix_str = self._dynamic_model_str = None
+
+
 def image_telemetry_decoder(packet):
-    """ Extract Image Telemetry data from a supplied packet, and return it as a dictionary.
+    """ Extract Image Telemetry data from a supplied packet, and return it as a dictionary-like WenetImageTelemetry object.
 
     Keyword Arguments:
     packet: An Image telemetry packet, as per https://docs.google.com/document/d/12230J1X3r2-IcLVLkeaVmIXqFeo3uheurFakElIaPVo/edit?usp=sharing
@@ -383,119 +438,35 @@ def image_telemetry_decoder(packet):
             to a string prior to decoding.
 
     Return value:
-            A dictionary containing the decoded packet data. 
-            If the decode failed for whatever reason, a dictionary will still be returned, but will 
+            A WenetImageTelemetry object containing the decoded packet data. 
+            If the decode failed for whatever reason, a dictionary will be returned instead, which will 
             contain the field 'error' with the decode fault description.
             This field (error) will be set to 'None' if decoding was successful.
 
     """
 
-    # We need the packet as a string - convert to a string in case we were passed a list of bytes,
+    # Normalise the packet into a PacketBuffer, in case we were passed a list of bytes,
     # which occurs when we are decoding a packet that has arrived via a UDP-broadcast JSON blob.
-    packet = str(bytearray(packet))
+    packet = packet_buffer(packet)
 
-    image_data = {}
-
-    
     # Some basic sanity checking of the packet before we attempt to decode.
     if len(packet) < WENET_PACKET_LENGTHS.IMAGE_TELEMETRY:
         return {'error': 'Image Telemetry Packet has invalid length.'}
-    elif len(packet) > WENET_PACKET_LENGTHS.IMAGE_TELEMETRY:
-        # If the packet is too big (which it will be, as it's padded with 0x55's), clip it. 
-        packet = packet[:WENET_PACKET_LENGTHS.IMAGE_TELEMETRY]
     else:
+        # If the packet is too big (which it will be, as it's padded with 0x55's), unpack_from
+        # will only read the start of it, so there is no need to clip it.
         pass
 
     # Wrap the next bit in exception handling.
     try:
-        # Unpack the packet into a list.
-        data = struct.unpack('>BH7pBHIBffffffBBBBBBBBBbfffffff', packet)
-
-        image_data['sequence_number'] = data[1]
-        image_data['callsign'] = data[2]
-        image_data['image_id'] = data[3]
-        image_data['week']  = data[4]
-        image_data['iTOW']  = data[5]/1000.0 # iTOW provided as milliseconds, convert to seconds.
-        image_data['leapS']     = data[6]
-        image_data['latitude'] = data[7]
-        image_data['longitude'] = data[8]
-        image_data['altitude'] = data[9]
-        image_data['ground_speed'] = data[10]
-        image_data['heading'] = data[11]
-        image_data['ascent_rate'] = data[12]
-        image_data['numSV']     = data[13]
-        image_data['gpsFix']    = data[14]
-        image_data['dynamic_model'] = data[15]
-
-        # Perform some post-processing on the data, to make some of the fields easier to read.
-
-        # Produce a human-readable timestamp, in UTC time.
-        image_data['timestamp'] = gps_weeksecondstoutc(image_data['week'], image_data['iTOW'], image_data['leapS'])
-
-        # Produce a human-readable indication of GPS Fix state.
-        if image_data['gpsFix'] == 0:
-            image_data['gpsFix_str'] = 'No Fix'
-        elif image_data['gpsFix'] == 2:
-            image_data['gpsFix_str'] = '2D Fix'
-        elif image_data['gpsFix'] == 3:
-            image_data['gpsFix_str'] = '3D Fix'
-        elif image_data['gpsFix'] == 5:
-            image_data['gpsFix_str'] = 'Time Only'
-        else:
-            image_data['gpsFix_str'] = 'Unknown (%d)' % image_data['gpsFix']
-
-        # Produce a human-readable indication of the current dynamic model.
-        if image_data['dynamic_model'] == 0:
-            image_data['dynamic_model_str'] = 'Portable'
-        elif image_data['dynamic_model'] == 1:
-            image_data['dynamic_model_str'] = 'Not Used'
-        elif image_data['dynamic_model'] == 2:
-            image_data['dynamic_model_str'] = 'Stationary'
-        elif image_data['dynamic_model'] == 3:
-            image_data['dynamic_model_str'] = 'Pedestrian'
-        elif image_data['dynamic_model'] == 4:
-            image_data['dynamic_model_str'] = 'Automotive'
-        elif image_data['dynamic_model'] == 5:
-            image_data['dynamic_model_str'] = 'Sea'
-        elif image_data['dynamic_model'] == 6:
-            image_data['dynamic_model_str'] = 'Airborne 1G'
-        elif image_data['dynamic_model'] == 7:
-            image_data['dynamic_model_str'] = 'Airborne 2G'
-        elif image_data['dynamic_model'] == 8:
-            image_data['dynamic_model_str'] = 'Airborne 4G'
-        else:
-            image_data['dynamic_model_str'] = 'Unknown'
-
-        image_data['sys_status']    = data[16]
-        image_data['sys_error'] = data[17]
-        image_data['sys_cal']   = data[18]
-        image_data['gyro_cal']  = data[19]
-        image_data['accel_cal']     = data[20]
-        image_data['magnet_cal']    = data[21]
-        image_data['temp']      = data[22]
-
-        image_data['euler_heading'] = data[23]
-        image_data['euler_roll'] = data[24]
-        image_data['euler_pitch'] = data[25]
-
-        image_data['quaternion_x'] = data[26]
-        image_data['quaternion_y'] = data[27]
-        image_data['quaternion_z'] = data[28]
-        image_data['quaternion_w'] = data[29]
-
-        image_data['error'] = 'None'
-
-        return image_data
+        # Unpack the packet, and store the fields. Human-readable fields are produced on access.
+        return WenetImageTelemetry(WENET_IMAGE_TELEMETRY_STRUCT.unpack_from(packet))
 
     except:
         traceback.print_exc()
-        print(packet)
+        print(packet_hex_dump(packet))
         return {'error': 'Could not decode Image telemetry packet.'}
 
-    # SHSSP Code goes here.
-
-    return {'error': "Image Telemetry: Not Implemented."}
-
 def image_telemetry_string(packet):
     """ Produce a String representation of an Image Telemetry packet"""
 
@@ -519,3 +490,13 @@ def image_telemetry_string(packet):
             )
 
         return image_data_string
+
+
+# String formatters for each Wenet packet type, used by wenet_packet_to_string.
+WENET_PACKET_FORMATTERS = {
+    WENET_PACKET_TYPES.TEXT_MESSAGE             : text_message_string,
+    WENET_PACKET_TYPES.GPS_TELEMETRY            : gps_telemetry_string,
+    WENET_PACKET_TYPES.ORIENTATION_TELEMETRY    : orientation_telemetry_string,
+    WENET_PACKET_TYPES.IMAGE_TELEMETRY          : image_telemetry_string,
+    WENET_PACKET_TYPES.SSDV                     : ssdv_packet_string,
+}
@@ -0,0 +1,207 @@
+#!/usr/bin/env python2.7
+#
+#   Project Horus - UDP Broadcast Wire Formats
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Messages on the Horus UDP broadcast bus are JSON-encoded dicts by default.
+#   Messages which carry a binary payload (RXPKT, TXQUEUED, TXDONE) can optionally be sent
+#   using a compact binary envelope instead, which carries the payload as raw bytes, rather than
+#   as a JSON list of integers.
+#
+#   BINARY ENVELOPE FORMAT
+#   ======================
+#   All values little-endian.
+#   Header:
+#       uint8   Magic byte (0xB5). This can never be the first byte of a JSON blob.
+#       uint8   Envelope version (currently 2)
+#       uint8   Message type code (see HORUS_BINARY_MESSAGE_TYPES)
+#   Body, RXPKT:
+#       double  RSSI (dBm)
+#       double  SNR (dB)
+#       int32   Frequency error (Hz)
+#       uint8   Packet flags bitfield (bit N set if pkt_flags[BINARY_PKT_FLAGS[N]] is set)
+#       uint8   Timestamp length, followed by the ISO-8601 timestamp string
+#       ...     Payload bytes (remainder of datagram)
+#   Body, TXQUEUED / TXDONE:
+#       uint16  TX queue size
+#       uint8   Timestamp length, followed by the ISO-8601 timestamp string
+#       ...     Payload bytes (remainder of datagram)
+#
+#   Messages carrying a 'tx_id' field (see tx_packet) are always sent as JSON, as the binary
+#   envelope has no space for it.
+#
+#   decode_udp_packet() detects which format has been received, so listeners work with either.
+#   udp_packet_type_candidates() finds the message type of a datagram without decoding it, so
+#   listeners can discard unwanted messages cheaply.
+#
+import json
+import re
+import struct
+from .packetbuffer import *
+
+HORUS_BINARY_MAGIC = 0xB5
+# Version 1 sent RSSI and SNR as single-precision floats, which didn't decode to the same values as the JSON messages.
+HORUS_BINARY_VERSION = 2
+
+class HORUS_BINARY_MESSAGE_TYPES:
+    RXPKT       = 1
+    TXQUEUED    = 2
+    TXDONE      = 3
+
+# LoRa IRQ flags, in bitfield order, as provided in the 'pkt_flags' field of a RXPKT message.
+BINARY_PKT_FLAGS = ['rx_timeout', 'rx_done', 'crc_error', 'valid_header', 'tx_done', 'cad_done', 'fhss_change_ch', 'cad_detected']
+
+BINARY_HEADER_STRUCT = struct.Struct("<BBB")
+BINARY_RXPKT_STRUCT = struct.Struct("<ddiB")
+BINARY_TXSTATUS_STRUCT = struct.Struct("<H")
+
+
+def _pack_string(data):
+    ''' Pack a string (max 255 characters) with a leading length byte. '''
+    data = str(data)[:255]
+    return struct.pack("<B", len(data)) + data
+
+def _unpack_string(packet, offset):
+    ''' Unpack a length-prefixed string. Returns the string, and the offset of the data following it. '''
+    _len = packet_byte(packet, offset)
+    if _len is None:
+        raise IndexError("String length byte missing.")
+    return (str(packet[offset+1:offset+1+_len]), offset+1+_len)
+
+
+def _encode_rxpkt(packet):
+    _flags = 0
+    for _bit, _name in enumerate(BINARY_PKT_FLAGS):
+        if packet['pkt_flags'].get(_name, 0):
+            _flags |= (1 << _bit)
+
+    return BINARY_RXPKT_STRUCT.pack(packet['rssi'], packet['snr'], int(packet['freq_error']), _flags) \
+        + _pack_string(packet['timestamp']) \
+        + str(bytearray(packet['payload']))
+
+def _decode_rxpkt(packet, offset):
+    (_rssi, _snr, _freq_error, _flags) = BINARY_RXPKT_STRUCT.unpack_from(packet, offset)
+    (_timestamp, offset) = _unpack_string(packet, offset + BINARY_RXPKT_STRUCT.size)
+
+    _pkt_flags = {}
+    for _bit, _name in enumerate(BINARY_PKT_FLAGS):
+        _pkt_flags[_name] = (_flags >> _bit) & 0x01
+
+    return {
+        'type'      : 'RXPKT',
+        'timestamp' : _timestamp,
+        'payload'   : list(bytearray(packet[offset:])),
+        'snr'       : _snr,
+        'rssi'      : _rssi,
+        'pkt_flags' : _pkt_flags,
+        'freq_error': _freq_error
+    }
+
+
+def _encode_txstatus(packet):
+    return BINARY_TXSTATUS_STRUCT.pack(packet['txqueuesize']) \
+        + _pack_string(packet['timestamp']) \
+        + str(bytearray(packet['payload']))
+
+def _decode_txstatus(packet, offset, packet_type):
+    (_txqueuesize,) = BINARY_TXSTATUS_STRUCT.unpack_from(packet, offset)
+    (_timestamp, offset) = _unpack_string(packet, offset + BINARY_TXSTATUS_STRUCT.size)
+
+    return {
+        'type'  : packet_type,
+        'timestamp' : _timestamp,
+        'payload' : list(bytearray(packet[offset:])),
+        'txqueuesize' : _txqueuesize
+    }
+
+
+# Binary encoders and decoders, keyed by message type string and message type code respectively.
+_binary_encoders = {
+    'RXPKT'     : (HORUS_BINARY_MESSAGE_TYPES.RXPKT, _encode_rxpkt),
+    'TXQUEUED'  : (HORUS_BINARY_MESSAGE_TYPES.TXQUEUED, _encode_txstatus),
+    'TXDONE'    : (HORUS_BINARY_MESSAGE_TYPES.TXDONE, _encode_txstatus),
+}
+
+_binary_decoders = {
+    HORUS_BINARY_MESSAGE_TYPES.RXPKT    : _decode_rxpkt,
+    HORUS_BINARY_MESSAGE_TYPES.TXQUEUED : lambda packet, offset: _decode_txstatus(packet, offset, 'TXQUEUED'),
+    HORUS_BINARY_MESSAGE_TYPES.TXDONE   : lambda packet, offset: _decode_txstatus(packet, offset, 'TXDONE'),
+}
+
+
+# Matches a "type" key (and its string value) in a JSON message.
+# Quotes within JSON strings are always escaped, so this can only match an actual key.
+_JSON_TYPE_REGEX = re.compile(r'"type"\s*:\s*"([^"\\]*)"')
+
+# Message type strings, keyed by binary message type code.
+_binary_type_names = dict((_code, _name) for (_name, (_code, _encoder)) in _binary_encoders.items())
+
+
+def udp_packet_type_candidates(datagram):
+    """
+    Find the message type of a received datagram, without decoding it.
+
+    Returns a list of possible message types. The message's 'type' will be one of these, though for JSON messages
+    the list may also include the values of 'type' keys in nested objects. Returns None if the type could not be found,
+    in which case the datagram should be fully decoded to find out what it is.
+    """
+    if is_binary_udp_packet(datagram):
+        if len(datagram) < BINARY_HEADER_STRUCT.size:
+            return None
+        _name = _binary_type_names.get(bytearray(datagram[2:3])[0], None)
+        return None if _name is None else [_name]
+
+    _types = _JSON_TYPE_REGEX.findall(datagram)
+    return _types if len(_types) > 0 else None
+
+
+def is_binary_udp_packet(datagram):
+    ''' Check if a received datagram uses the binary envelope (rather than JSON). '''
+    return len(datagram) > 0 and bytearray(datagram[:1])[0] == HORUS_BINARY_MAGIC
+
+
+def encode_udp_packet(packet, binary=False):
+    """
+    Encode a Horus UDP message dictionary into a datagram.
+    If binary is True, and the message type has a binary representation, the binary envelope is used.
+    Otherwise (or if the message is missing fields required by the binary envelope, or has a transmit ID)
+    the message is JSON-encoded.
+    Note that fields not listed in the binary envelope format above are not carried by it.
+    """
+    if binary and (packet.get('type') in _binary_encoders) and ('tx_id' not in packet):
+        (_type_code, _encoder) = _binary_encoders[packet['type']]
+        try:
+            return BINARY_HEADER_STRUCT.pack(HORUS_BINARY_MAGIC, HORUS_BINARY_VERSION, _type_code) + _encoder(packet)
+        except (KeyError, TypeError, ValueError, struct.error):
+            pass
+
+    return json.dumps(packet)
+
+
+def decode_udp_packet(datagram):
+    """
+    Decode a received Horus UDP datagram (in either JSON or binary envelope format) into a message dictionary.
+    Raises a ValueError if the datagram cannot be decoded.
+    """
+    if not is_binary_udp_packet(datagram):
+        return json.loads(datagram)
+
+    _packet = packet_buffer(datagram)
+
+    if len(_packet) < BINARY_HEADER_STRUCT.size:
+        raise ValueError("Binary message too short.")
+
+    (_magic, _version, _type_code) = BINARY_HEADER_STRUCT.unpack_from(_packet)
+
+    if _version != HORUS_BINARY_VERSION:
+        raise ValueError("Unsupported binary message version: %d" % _version)
+
+    if _type_code not in _binary_decoders:
+        raise ValueError("Unknown binary message type: %d" % _type_code)
+
+    try:
+        return _binary_decoders[_type_code](_packet, BINARY_HEADER_STRUCT.size)
+    except (IndexError, struct.error) as e:
+        raise ValueError("Invalid binary message: %s" % str(e))
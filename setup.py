@@ -117,7 +117,7 @@ setup(
     #
     # For an analysis of "install_requires" vs pip's requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['crcmod','python-dateutil','shapely','fastkml'],  # Optional
+    install_requires=['crcmod','python-dateutil','shapely','fastkml','numpy'],  # Optional
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). Users will be able to install these using the "extras"
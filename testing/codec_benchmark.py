@@ -0,0 +1,323 @@
+#
+#   Project Horus - Packet Codec Benchmark
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Measures the throughput (packets/second) and allocations-per-packet of the horuslib
+#   packet decoders and encoders, using generated packets of every Horus and Wenet packet type.
+#
+#   Usage:
+#       python codec_benchmark.py --output before.json
+#       (make changes)
+#       python codec_benchmark.py --output after.json --compare before.json --threshold 10
+#
+#   When comparing, the script exits with status 1 if any case's throughput has dropped by more than
+#   the threshold (percent), or its memory metric (below) has increased by one or more per packet.
+#
+#   Allocations are counted with tracemalloc where it is available (Python 3). Python 2 has no way of
+#   counting allocations, so the number of garbage-collector-tracked objects (dicts, lists, instances, etc)
+#   retained per packet is reported instead, by holding onto the results of each call. This doesn't count
+#   strings, numbers, or anything freed before the call returns. Each case records which metric it used
+#   ('allocation_method'), and results are only compared against the same metric.
+#
+import argparse
+import gc
+import json
+import platform
+import struct
+import sys
+import time
+from datetime import datetime
+from horuslib.packets import *
+from horuslib.wenet import *
+
+
+#
+# Packet Generation
+#
+
+def generate_horus_packets():
+    """ Generate a packet of each Horus packet type, as would be received from the LoRa modem. Returns a dict of name: packet string. """
+    _ssdv = bytearray([HORUS_PACKET_TYPES.SSDV_FEC, 0x12, 0x34, 0x56, 0x78, 7, 0, 42, 20, 15, 0, 0, 0, 0, 0])
+    _ssdv += bytearray(range(255 - len(_ssdv)))
+
+    _packets = {
+        'PAYLOAD_TELEMETRY' : PAYLOAD_TELEMETRY_STRUCT.pack(HORUS_PACKET_TYPES.PAYLOAD_TELEMETRY, 0, 1, 1234, 12, 34, 56,
+                                -34.91234, 138.61234, 25432, 23, 9, 0xF0, 180, 120, 12, 110, 0x32),
+        'TEXT_MESSAGE'      : str(bytearray(create_text_message_packet("VK5QI", "Landing in the next paddock", destination=1))),
+        'CUTDOWN_COMMAND'   : str(bytearray(create_cutdown_packet(time=4, passcode="abc", destination=1))),
+        'PARAMETER_CHANGE'  : str(bytearray(create_param_change_packet(param=HORUS_PAYLOAD_PARAMS.PING, value=10, passcode="abc", destination=1))),
+        'COMMAND_ACK'       : str(bytearray([HORUS_PACKET_TYPES.COMMAND_ACK, 0, 1, 100, 0xF4, 2, 5, 0])),
+        'SHORT_TELEMETRY'   : SHORT_TELEMETRY_STRUCT.pack(HORUS_PACKET_TYPES.SHORT_TELEMETRY, 3, 12, 34, 56, -34.91234, 138.61234, 10, 180, 7),
+        'SLOT_REQUEST'      : create_slot_request_packet(destination=1, callsign="VK5QI"),
+        'CAR_TELEMETRY'     : str(bytearray(create_car_telemetry_packet(destination=1, callsign="VK5QI", latitude=-34.9, longitude=138.6, speed=80, message="Chasing"))),
+        'SSDV_FEC'          : str(_ssdv),
+        'SSDV_NOFEC'        : str(bytearray([HORUS_PACKET_TYPES.SSDV_NOFEC]) + _ssdv[1:]),
+    }
+
+    # Make sure we have generated a packet for every packet type.
+    for _name in dir(HORUS_PACKET_TYPES):
+        if not _name.startswith('_'):
+            assert _name in _packets, "No generated packet for %s" % _name
+
+    return _packets
+
+
+def generate_wenet_packets():
+    """ Generate a packet of each Wenet packet type, padded to 256 bytes as received from the modem. Returns a dict of name: packet string. """
+    _gps = struct.pack('>BHIBffffffBBB', WENET_PACKET_TYPES.GPS_TELEMETRY, 1990, 345678000, 18,
+            -34.91234, 138.61234, 25432.0, 45.0, 270.0, 5.2, 9, 3, 6)
+    _orientation = struct.pack('>BHIBBBBBBBbfffffff', WENET_PACKET_TYPES.ORIENTATION_TELEMETRY, 1990, 345678000, 18,
+            1, 0, 3, 3, 3, 3, -25, 90.0, 5.0, -3.0, 0.1, 0.2, 0.3, 0.9)
+    _image = struct.pack('>BH7pBHIBffffffBBBBBBBBBbfffffff', WENET_PACKET_TYPES.IMAGE_TELEMETRY, 1234, 'VK5QI', 12,
+            1990, 345678000, 18, -34.91234, 138.61234, 25432.0, 45.0, 270.0, 5.2, 9, 3, 6,
+            1, 0, 3, 3, 3, 3, -25, 90.0, 5.0, -3.0, 0.1, 0.2, 0.3, 0.9)
+    _text = struct.pack('>BBH', WENET_PACKET_TYPES.TEXT_MESSAGE, 14, 123) + "Camera started"
+    _ssdv = bytearray([WENET_PACKET_TYPES.SSDV, 0x66, 0x00, 0x8D, 0x7D, 0x93, 12, 0, 42, 40, 30, 0, 0, 0, 0, 0])
+    _ssdv += bytearray(range(256 - len(_ssdv)))
+
+    _packets = {
+        'TEXT_MESSAGE'          : _text,
+        'GPS_TELEMETRY'         : _gps,
+        'ORIENTATION_TELEMETRY' : _orientation,
+        'IMAGE_TELEMETRY'       : _image,
+        'SSDV'                  : str(_ssdv),
+        'IDLE'                  : '',
+    }
+
+    for _name in _packets:
+        _packets[_name] = _packets[_name] + chr(WENET_PACKET_TYPES.IDLE)*(256-len(_packets[_name]))
+
+    for _name in dir(WENET_PACKET_TYPES):
+        if not _name.startswith('_'):
+            assert _name in _packets, "No generated packet for %s" % _name
+
+    return _packets
+
+
+def generate_udp_datagrams(horus_packets, wenet_packets):
+    """ Generate UDP broadcast bus messages carrying the generated packets, in each wire format. """
+    _rxpkt = {
+        'type'      : 'RXPKT',
+        'timestamp' : datetime(2018, 1, 1, 12, 34, 56, 123456).isoformat(),
+        'payload'   : list(bytearray(horus_packets['PAYLOAD_TELEMETRY'])),
+        'snr'       : 8.25,
+        'rssi'      : -95.5,
+        'pkt_flags' : {'rx_timeout':0, 'rx_done':1, 'crc_error':0, 'valid_header':1, 'tx_done':0, 'cad_done':0, 'fhss_change_ch':0, 'cad_detected':0},
+        'freq_error': -1234
+    }
+    _ssdv_rxpkt = dict(_rxpkt)
+    _ssdv_rxpkt['payload'] = list(bytearray(horus_packets['SSDV_FEC']))
+    _wenet = {'type': 'WENET', 'packet': list(bytearray(wenet_packets['GPS_TELEMETRY']))}
+
+    return {
+        'RXPKT_TELEMETRY_JSON'  : encode_udp_packet(_rxpkt),
+        'RXPKT_TELEMETRY_BINARY': encode_udp_packet(_rxpkt, binary=True),
+        'RXPKT_SSDV_JSON'       : encode_udp_packet(_ssdv_rxpkt),
+        'RXPKT_SSDV_BINARY'     : encode_udp_packet(_ssdv_rxpkt, binary=True),
+        'WENET_GPS_JSON'        : encode_udp_packet(_wenet),
+    }, _rxpkt
+
+
+#
+# Benchmark Cases
+#
+
+def build_cases():
+    """ Build the list of (case name, function, argument) tuples to benchmark. """
+    _horus = generate_horus_packets()
+    _wenet = generate_wenet_packets()
+    (_datagrams, _rxpkt) = generate_udp_datagrams(_horus, _wenet)
+    _telemetry = decode_horus_payload_telemetry(_horus['PAYLOAD_TELEMETRY'])
+
+    _cases = []
+
+    # Horus packets, as raw strings from the modem.
+    for _name in sorted(_horus.keys()):
+        _cases.append(('horus.decode_payload.%s' % _name, decode_payload, _horus[_name]))
+        _cases.append(('horus.payload_to_string.%s' % _name, payload_to_string, _horus[_name]))
+
+    _cases.append(('horus.decode_horus_payload_telemetry.str', decode_horus_payload_telemetry, _horus['PAYLOAD_TELEMETRY']))
+    _cases.append(('horus.decode_horus_payload_telemetry.list', decode_horus_payload_telemetry, list(bytearray(_horus['PAYLOAD_TELEMETRY']))))
+    _cases.append(('horus.telemetry_to_sentence', telemetry_to_sentence, _telemetry))
+
+    # Wenet packets.
+    for _name in sorted(_wenet.keys()):
+        _cases.append(('wenet.wenet_packet_to_string.%s' % _name, wenet_packet_to_string, _wenet[_name]))
+
+    _cases.append(('wenet.gps_telemetry_decoder', gps_telemetry_decoder, _wenet['GPS_TELEMETRY']))
+    _cases.append(('wenet.orientation_telemetry_decoder', orientation_telemetry_decoder, _wenet['ORIENTATION_TELEMETRY']))
+    _cases.append(('wenet.image_telemetry_decoder', image_telemetry_decoder, _wenet['IMAGE_TELEMETRY']))
+    _cases.append(('wenet.decode_text_message', decode_text_message, _wenet['TEXT_MESSAGE']))
+    _cases.append(('wenet.ssdv_packet_info', ssdv_packet_info, _wenet['SSDV']))
+
+    # UDP bus messages.
+    for _name in sorted(_datagrams.keys()):
+        _cases.append(('udp.decode_udp_packet.%s' % _name, decode_udp_packet, _datagrams[_name]))
+        _cases.append(('udp.udp_packet_to_string.%s' % _name, udp_packet_to_string, _datagrams[_name]))
+
+    _cases.append(('udp.encode_udp_packet.RXPKT_JSON', encode_udp_packet, _rxpkt))
+    _cases.append(('udp.encode_udp_packet.RXPKT_BINARY', lambda packet: encode_udp_packet(packet, binary=True), _rxpkt))
+
+    return _cases
+
+
+#
+# Measurement
+#
+
+def measure_throughput(func, arg, min_time=0.2):
+    """ Call func(arg) repeatedly for at least min_time seconds (best of 3 runs). Returns packets per second. """
+    # Work out how many iterations we need to run for min_time.
+    _iterations = 10
+    while True:
+        _start = time.time()
+        for _i in xrange(_iterations):
+            func(arg)
+        _elapsed = time.time() - _start
+        if _elapsed >= min_time:
+            break
+        _iterations *= 2
+
+    _best = _elapsed
+    for _run in range(2):
+        _start = time.time()
+        for _i in xrange(_iterations):
+            func(arg)
+        _best = min(_best, time.time() - _start)
+
+    return _iterations/_best
+
+
+def measure_allocations(func, arg, iterations=1000):
+    """
+    Count the allocations made per call of func(arg), or if tracemalloc isn't available, the gc-tracked
+    objects retained per call (see the notes at the top of this file).
+    Returns a tuple of (count per call, method used).
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        _before = tracemalloc.take_snapshot()
+        for _i in xrange(iterations):
+            func(arg)
+        _after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        _count = sum(_stat.count_diff for _stat in _after.compare_to(_before, 'lineno') if _stat.count_diff > 0)
+        return (float(_count)/iterations, 'tracemalloc')
+
+    # Fall back to counting the garbage-collector-tracked objects retained by each call.
+    # With the collector disabled, the generation 0 count is the number of tracked objects
+    # allocated (less those freed) since the last collection. This is not an allocation count.
+    _results = []
+    gc.collect()
+    gc.disable()
+    try:
+        _start = gc.get_count()[0]
+        for _i in xrange(iterations):
+            _results.append(func(arg))
+        _count = gc.get_count()[0] - _start
+    finally:
+        gc.enable()
+
+    return (float(_count)/iterations, 'gc_tracked_retained')
+
+
+def run_benchmarks(min_time=0.2, case_filter=None):
+    """ Run all benchmark cases. Returns a results dictionary, suitable for saving as JSON. """
+    _results = {
+        'timestamp' : datetime.utcnow().isoformat(),
+        'python'    : sys.version.split()[0],
+        'platform'  : platform.platform(),
+        'cases'     : {}
+    }
+
+    for (_name, _func, _arg) in build_cases():
+        if case_filter is not None and case_filter not in _name:
+            continue
+
+        _pps = measure_throughput(_func, _arg, min_time=min_time)
+        (_allocs, _method) = measure_allocations(_func, _arg)
+
+        _results['cases'][_name] = {
+            'packets_per_sec'   : _pps,
+            'us_per_packet'     : 1e6/_pps,
+            'allocations_per_packet' : _allocs,
+            'allocation_method' : _method
+        }
+
+        print("%-55s %12.0f pkt/s %8.2f us %8.2f %s" % (_name, _pps, 1e6/_pps, _allocs, ALLOCATION_UNITS.get(_method, _method)))
+
+    return _results
+
+
+# Units printed for each allocation counting method.
+ALLOCATION_UNITS = {
+    'tracemalloc'           : 'allocs',
+    'gc_tracked_retained'   : 'retained objs'
+}
+
+
+def compare_results(results, previous, threshold=10.0):
+    """
+    Print the change in throughput (and memory metric) of each case, relative to a previous set of results.
+    Returns a list of the cases which have regressed: throughput down by more than threshold percent, or
+    the memory metric up by one or more per packet (only checked if both results used the same method).
+    """
+    print("\nComparison against results from %s (Python %s):" % (previous['timestamp'], previous['python']))
+    _regressions = []
+    for _name in sorted(results['cases'].keys()):
+        if _name not in previous['cases']:
+            print("%-55s (new)" % _name)
+            continue
+
+        _case = results['cases'][_name]
+        _previous = previous['cases'][_name]
+        _speedup = _case['packets_per_sec']/_previous['packets_per_sec']
+        _regressed = _speedup < (1.0 - threshold/100.0)
+
+        _previous_method = _previous['allocation_method']
+        if _previous_method == _case['allocation_method']:
+            _alloc_change = _case['allocations_per_packet'] - _previous['allocations_per_packet']
+            _regressed = _regressed or (_alloc_change >= 1.0)
+            _alloc_str = "%+8.2f %s" % (_alloc_change, ALLOCATION_UNITS.get(_case['allocation_method'], _case['allocation_method']))
+        else:
+            _alloc_str = "(memory metrics not comparable: %s vs %s)" % (_case['allocation_method'], _previous_method)
+
+        if _regressed:
+            _regressions.append(_name)
+
+        print("%-55s %6.2fx %s%s" % (_name, _speedup, _alloc_str, "  REGRESSION" if _regressed else ""))
+
+    return _regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", type=str, default=None, help="Save results to this JSON file.")
+    parser.add_argument("-c", "--compare", type=str, default=None, help="Compare results against a previously saved JSON file.")
+    parser.add_argument("-t", "--min_time", type=float, default=0.2, help="Minimum time (seconds) to run each case for.")
+    parser.add_argument("-f", "--filter", type=str, default=None, help="Only run cases containing this string.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Throughput drop (percent) treated as a regression when comparing. Default = 10")
+    args = parser.parse_args()
+
+    results = run_benchmarks(min_time=args.min_time, case_filter=args.filter)
+
+    if args.output is not None:
+        with open(args.output, 'w') as _f:
+            json.dump(results, _f, indent=2, sort_keys=True)
+        print("Results saved to %s" % args.output)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as _f:
+            _regressions = compare_results(results, json.load(_f), threshold=args.threshold)
+
+        if len(_regressions) > 0:
+            print("%d case(s) regressed: %s" % (len(_regressions), ", ".join(_regressions)))
+            sys.exit(1)
@@ -0,0 +1,98 @@
+#
+#   Project Horus - Track State Estimation Benchmark
+#
+#   Copyright (C) 2018  Mark Jessop <vk5qi@rfhead.net>
+#   Released under GNU GPL v3 or later
+#
+#   Measures the time taken by GenericTrack.add_telemetry, for tracks of increasing length,
+#   using a simulated flight (ascent, then descent) at one position per second.
+#   This should stay constant as the track grows. For comparison, the time taken to recalculate
+#   all states from the stored history (update_states with no position) is also reported,
+#   along with the bearing/distance calculation on its own (bearing_distance vs position_info).
+#
+#   Usage:
+#       python track_benchmark.py
+#       python track_benchmark.py --lengths 100,10000,100000
+#
+import argparse
+import math
+import time
+from datetime import datetime, timedelta
+from horuslib.earthmaths import position_info, bearing_distance
+from horuslib.geometry import GenericTrack
+
+
+def simulated_flight(count, start=datetime(2018, 1, 1, 0, 0, 0)):
+    """
+    Generate a list of telemetry dictionaries for a simulated flight, one position per second.
+    The flight (ascent to 30km at 5 m/s, descent at 10 m/s) is repeated for long tracks.
+    """
+    _positions = []
+    for _i in range(count):
+        _t = _i % 9000
+        if _t < 6000:
+            _alt = _t*5.0
+        else:
+            _alt = 30000.0 - (_t - 6000)*10.0
+        _positions.append({
+            'time'  : start + timedelta(seconds=_i),
+            'lat'   : -34.9 + _i*1e-5,
+            'lon'   : 138.6 + _i*2e-5 + 1e-4*math.sin(_i/30.0),
+            'alt'   : _alt
+            })
+
+    return _positions
+
+
+def time_call(func, iterations):
+    """ Call func() iterations times (best of 3 runs). Returns the time per call, in microseconds. """
+    _best = None
+    for _run in range(3):
+        _start = time.time()
+        for _i in xrange(iterations):
+            func()
+        _elapsed = time.time() - _start
+        _best = _elapsed if _best is None else min(_best, _elapsed)
+
+    return _best*1e6/iterations
+
+
+def benchmark_track(length, iterations=2000):
+    """ Time add_telemetry and a full state recalculation for a track which already has length positions. """
+    _positions = simulated_flight(length + 3*iterations)
+
+    _track = GenericTrack()
+    for _position in _positions[:length]:
+        _track.add_telemetry(_position)
+
+    # Each call adds the next position of the flight.
+    _remaining = iter(_positions[length:])
+    _add = time_call(lambda: _track.add_telemetry(next(_remaining)), iterations)
+    _recalculate = time_call(lambda: _track.update_states(), iterations)
+
+    return (_add, _recalculate)
+
+
+def benchmark_kernels(iterations=100000):
+    """ Time bearing_distance against position_info, for a single pair of positions. """
+    _pos_info = time_call(lambda: position_info((-34.9, 138.6, 100.0), (-34.8, 138.7, 200.0)), iterations)
+    _kernel = time_call(lambda: bearing_distance(-34.9, 138.6, -34.8, 138.7), iterations)
+    return (_pos_info, _kernel)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--lengths", type=str, default="10,1000,10000,50000", help="Comma-separated track lengths to benchmark.")
+    parser.add_argument("-i", "--iterations", type=int, default=2000, help="Calls to time at each track length.")
+    args = parser.parse_args()
+
+    (_pos_info, _kernel) = benchmark_kernels()
+    print("position_info:       %8.2f us" % _pos_info)
+    print("bearing_distance:    %8.2f us" % _kernel)
+    print("")
+    print("%10s  %16s  %16s" % ("Length", "add_telemetry", "Recalculate"))
+
+    for _length in [int(_x) for _x in args.lengths.split(',')]:
+        (_add, _recalculate) = benchmark_track(_length, iterations=args.iterations)
+        print("%10d  %13.2f us  %13.2f us" % (_length, _add, _recalculate))